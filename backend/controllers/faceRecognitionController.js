@@ -12,6 +12,27 @@ const ACTIVITY_TYPES = {
     REGISTER_FACE_ADMIN: 'REGISTER_FACE_ADMIN'
 };
 
+// Decode a (data URL) base64 image once, so the Python service receives the raw bytes
+const toImageBuffer = (imageBase64) => {
+    const comma = imageBase64.indexOf(',');
+    return Buffer.from(comma >= 0 ? imageBase64.slice(comma + 1) : imageBase64, 'base64');
+};
+
+// Teach the Python service another template from a supervisor-confirmed face clock-in.
+// Best effort: the attendance record never depends on it
+exports.addTemplateFromClockIn = async (id_pekerja, imageBase64) => {
+    try {
+        const response = await axios.post(`${FACE_SERVICE_URL}/add_template`, toImageBuffer(imageBase64), {
+            params: { worker_id: id_pekerja },
+            headers: { 'Content-Type': 'application/octet-stream' },
+            timeout: 15000
+        });
+        console.log(`Face template for worker ${id_pekerja}: ${response.data.message}`);
+    } catch (error) {
+        console.error('Error adding face template:', error.message);
+    }
+};
+
 exports.registerWorkerFace = async (req, res) => {
     try {
         const { id_pekerja, image_base64 } = req.body;
@@ -25,7 +46,7 @@ exports.registerWorkerFace = async (req, res) => {
 
         // Get worker info from database
         const [workerRows] = await pool.query(
-            'SELECT p.nama_pengguna FROM pekerja pk JOIN pengguna p ON pk.id_pengguna = p.id_pengguna WHERE pk.id_pekerja = ?',
+            'SELECT p.nama_pengguna, pk.id_lokasi_penugasan FROM pekerja pk JOIN pengguna p ON pk.id_pengguna = p.id_pengguna WHERE pk.id_pekerja = ?',
             [id_pekerja]
         );
 
@@ -42,12 +63,14 @@ exports.registerWorkerFace = async (req, res) => {
         const response = await axios.post(`${FACE_SERVICE_URL}/register`, {
             worker_id: id_pekerja,
             worker_name: workerName,
-            image: image_base64
+            location_id: workerRows[0].id_lokasi_penugasan,
+            image: image_base64,
+            wait_durable: true // only mark the worker registered once the encoding is on disk
         }, {
             timeout: 30000 // 30 second timeout
         });
 
-        if (response.data.success) {
+        if (response.data.success && response.data.durable !== false) {
             // Update database to mark that face is registered
             await pool.query(
                 'UPDATE pekerja SET face_registered = TRUE WHERE id_pekerja = ?',
@@ -72,7 +95,8 @@ exports.registerWorkerFace = async (req, res) => {
         } else {
             return res.status(400).json({
                 success: false,
-                message: response.data.message || 'Gagal mendaftarkan wajah'
+                message: response.data.message || 'Gagal mendaftarkan wajah',
+                reason: response.data.reason
             });
         }
 
@@ -105,16 +129,24 @@ exports.registerFaceFromAdmin = async (req, res) => {
             });
         }
 
+        // Look up the worker's project location so recognition can be scoped to it
+        const [locationRows] = await pool.query(
+            'SELECT id_lokasi_penugasan FROM pekerja WHERE id_pekerja = ?',
+            [id_pekerja]
+        );
+
         // Send to Python face recognition service
         const response = await axios.post(`${FACE_SERVICE_URL}/register`, {
             worker_id: id_pekerja,
             worker_name: nama_pengguna,
-            image: face_image
+            location_id: locationRows.length > 0 ? locationRows[0].id_lokasi_penugasan : null,
+            image: face_image,
+            wait_durable: true
         }, {
             timeout: 30000
         });
 
-        if (response.data.success) {
+        if (response.data.success && response.data.durable !== false) {
             // Update database to mark that face is registered
             await pool.query(
                 'UPDATE pekerja SET face_registered = TRUE WHERE id_pekerja = ?',
@@ -132,7 +164,8 @@ exports.registerFaceFromAdmin = async (req, res) => {
         } else {
             return res.status(400).json({
                 success: false,
-                message: response.data.message || 'Gagal mendaftarkan wajah'
+                message: response.data.message || 'Gagal mendaftarkan wajah',
+                reason: response.data.reason
             });
         }
 
@@ -155,7 +188,7 @@ exports.registerFaceFromAdmin = async (req, res) => {
 
 exports.recognizeFace = async (req, res) => {
     try {
-        const { image_base64 } = req.body;
+        const { image_base64, id_lokasi } = req.body;
 
         if (!image_base64) {
             return res.status(400).json({
@@ -164,10 +197,10 @@ exports.recognizeFace = async (req, res) => {
             });
         }
 
-        // Send to Python face recognition service
-        const response = await axios.post(`${FACE_SERVICE_URL}/recognize`, {
-            image: image_base64
-        }, {
+        // Send to Python face recognition service as a binary body, scoped to the site's workers when known
+        const response = await axios.post(`${FACE_SERVICE_URL}/recognize`, toImageBuffer(image_base64), {
+            params: { location_id: id_lokasi || undefined },
+            headers: { 'Content-Type': 'application/octet-stream' },
             timeout: 15000 // 15 second timeout
         });
 
@@ -176,6 +209,15 @@ exports.recognizeFace = async (req, res) => {
     } catch (error) {
         console.error('Error recognizing face:', error);
         
+        // Python service is saturated: pass its backpressure through to the kiosk
+        if (error.response && error.response.status === 503) {
+            res.set('Retry-After', error.response.headers['retry-after'] || '1');
+            return res.status(503).json({
+                success: false,
+                message: 'Face recognition service sedang sibuk, coba lagi sebentar'
+            });
+        }
+        
         if (error.code === 'ECONNREFUSED') {
             return res.status(503).json({
                 success: false,
@@ -2,6 +2,7 @@ const pool = require('../config/db');
 const fs = require('fs');
 const path = require('path');
 const { logActivity } = require('./logController');
+const { addTemplateFromClockIn } = require('./faceRecognitionController');
 
 // Define activity types constants
 const ACTIVITY_TYPES = {
@@ -200,6 +201,11 @@ exports.catatKehadiran = async (req, res) => {
                 VALUES (?, NOW(), ?, ?, ?, ?)`;
             await pool.query(query, [id_pekerja, status_kehadiran, metode, namaFileFoto, id_lokasi]);
 
+            // A supervisor-approved face clock-in is a confirmed photo of this worker
+            if (metode === 'Wajah' && fotoB64) {
+                addTemplateFromClockIn(id_pekerja, fotoB64);
+            }
+
             // Log activity - Fixed parameter count
             await logActivity(
                 req.user.id, 
@@ -7,7 +7,7 @@ import CustomQrReader from './CustomQrReader';
 import pythonFaceService from '../../utils/faceRecognitionService';
 import AlternativeQrReader from "./AlternativeQrReader.jsx";
 
-const AttendanceModal = ({ isOpen, onClose, onComplete, mode, worker, actionType }) => {
+const AttendanceModal = ({ isOpen, onClose, onComplete, mode, worker, actionType, idLokasi }) => {
     const [isProcessing, setIsProcessing] = useState(false);
     const [error, setError] = useState('');
     const [capturedImage, setCapturedImage] = useState(null);
@@ -140,7 +140,7 @@ const AttendanceModal = ({ isOpen, onClose, onComplete, mode, worker, actionType
                 console.log('Sending image to face recognition service...');
                 
                 // Send to Python face recognition service
-                const result = await pythonFaceService.recognizeFace(imageBase64);
+                const result = await pythonFaceService.recognizeFace(imageBase64, idLokasi);
                 
                 console.log('Face recognition result:', result);
                 
@@ -186,7 +186,7 @@ const AttendanceModal = ({ isOpen, onClose, onComplete, mode, worker, actionType
                 // Don't stop recognition on errors, just log them
             }
         }, 3000); // Check every 3 seconds - lebih lambat untuk debugging
-    }, [allWorkers, faceServiceHealthy, awaitingApproval, mode, stopFaceRecognition, isRecognitionActive]);
+    }, [allWorkers, faceServiceHealthy, awaitingApproval, mode, stopFaceRecognition, isRecognitionActive, idLokasi]);
 
     // Auto-start face recognition when video is ready and service is healthy
     const handleVideoPlay = useCallback(() => {
@@ -231,7 +231,7 @@ const AttendanceModal = ({ isOpen, onClose, onComplete, mode, worker, actionType
             tipe_aksi: detectedAction,
             metode: 'Wajah',
             fotoB64: capturedImage,
-            id_lokasi: 1,
+            id_lokasi: idLokasi,
             confidence: confidence,
             recognized_worker: recognizedWorker.nama_pengguna
         });
@@ -269,6 +269,11 @@ const AttendanceModal = ({ isOpen, onClose, onComplete, mode, worker, actionType
     };
 
     const handleSubmit = async (payloadData) => {
+        // Absensi selalu dicatat pada lokasi proyek yang dipilih di halaman absensi
+        if (!idLokasi) {
+            setError('Pilih lokasi proyek terlebih dahulu.');
+            return;
+        }
         setIsProcessing(true);
         setError('');
 
@@ -297,7 +302,7 @@ const AttendanceModal = ({ isOpen, onClose, onComplete, mode, worker, actionType
                 payload = {
                     qrCode: payloadData.qrCode,
                     tipeAksi: payloadData.tipeAksi || 'auto',
-                    idLokasi: payloadData.idLokasi || 1
+                    idLokasi: payloadData.idLokasi
                 };
             }
 
@@ -369,7 +374,7 @@ const AttendanceModal = ({ isOpen, onClose, onComplete, mode, worker, actionType
             tipe_aksi: detectedAction,
             metode: 'Manual',
             fotoB64: capturedImage,
-            id_lokasi: 1,
+            id_lokasi: idLokasi,
         });
     };
 
@@ -384,7 +389,7 @@ const AttendanceModal = ({ isOpen, onClose, onComplete, mode, worker, actionType
             tipe_aksi: actionType,
             metode: 'Manual',
             fotoB64: imageSrc,
-            id_lokasi: 1,
+            id_lokasi: idLokasi,
         });
     };
 
@@ -438,7 +443,7 @@ const AttendanceModal = ({ isOpen, onClose, onComplete, mode, worker, actionType
                 qrCode: scannedCode,
                 tipeAksi: 'auto', // Backend akan menentukan
                 metode: 'QR',
-                idLokasi: 1,
+                idLokasi,
             });
         }
     };
@@ -695,7 +700,7 @@ const AttendanceModal = ({ isOpen, onClose, onComplete, mode, worker, actionType
                                             tipe_aksi: 'clock_in',
                                             metode: 'Manual',
                                             fotoB64: capturedImage,
-                                            id_lokasi: 1,
+                                            id_lokasi: idLokasi,
                                         });
                                     }}
                                     disabled={isProcessing || !selectedWorkerId || (selectedWorkerStatus?.waktu_clock_in && !selectedWorkerStatus?.waktu_clock_out)}
@@ -720,7 +725,7 @@ const AttendanceModal = ({ isOpen, onClose, onComplete, mode, worker, actionType
                                                 tipe_aksi: 'clock_out',
                                                 metode: 'Manual',
                                                 fotoB64: capturedImage,
-                                                id_lokasi: 1,
+                                                id_lokasi: idLokasi,
                                             });
                                         }}
                                         disabled={isProcessing || !selectedWorkerId || !selectedWorkerStatus?.waktu_clock_in || selectedWorkerStatus?.waktu_clock_out || (selectedWorkerStatus?.status_kehadiran === 'Izin' || selectedWorkerStatus?.status_kehadiran === 'Absen')}
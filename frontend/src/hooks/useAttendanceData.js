@@ -14,6 +14,22 @@ export const useAttendanceData = () => {
     const [reportLoading, setReportLoading] = useState(true);
     const [selectedDate, setSelectedDate] = useState(new Date().toISOString().slice(0, 10));
 
+    // State untuk lokasi proyek tempat absensi dilakukan
+    const [lokasiList, setLokasiList] = useState([]);
+    const [selectedLokasi, setSelectedLokasi] = useState(null);
+
+    // Fungsi fetch lokasi yang ditugaskan ke supervisor; lokasi pertama dipilih sebagai awal
+    const fetchLokasi = useCallback(async () => {
+        try {
+            const { data } = await axiosInstance.get('/proyek/supervisor-assignments');
+            setLokasiList(data);
+            setSelectedLokasi(prev => prev ?? (data.length > 0 ? data[0].id_lokasi : null));
+        } catch (error) {
+            console.error("Gagal mengambil daftar lokasi:", error);
+            setLokasiList([]);
+        }
+    }, []);
+
     // Fungsi fetch data mingguan
     const fetchAbsensiMingguan = useCallback(async (tanggal) => {
         setReportLoading(true);
@@ -61,7 +77,8 @@ export const useAttendanceData = () => {
             // Panggil kedua fungsi fetch secara paralel untuk efisiensi
             await Promise.all([
                 fetchWorkerStatus(),
-                fetchAbsensiMingguan(new Date().toISOString().slice(0, 10))
+                fetchAbsensiMingguan(new Date().toISOString().slice(0, 10)),
+                fetchLokasi()
             ]);
 
         } catch (error) {
@@ -70,7 +87,7 @@ export const useAttendanceData = () => {
         } finally {
             setIsLoading(false);
         }
-    }, [fetchWorkerStatus, fetchAbsensiMingguan]);
+    }, [fetchWorkerStatus, fetchAbsensiMingguan, fetchLokasi]);
 
     useEffect(() => {
         setupSystem();
@@ -96,6 +113,9 @@ export const useAttendanceData = () => {
         reportLoading,
         selectedDate,
         setSelectedDate,
+        lokasiList,
+        selectedLokasi,
+        setSelectedLokasi,
         
         // Functions
         fetchWorkerStatus,
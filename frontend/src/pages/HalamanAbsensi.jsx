@@ -21,6 +21,9 @@ const HalamanAbsensi = () => {
         reportLoading,
         selectedDate,
         setSelectedDate,
+        lokasiList,
+        selectedLokasi,
+        setSelectedLokasi,
         handleActionComplete
     } = useAttendanceData();
 
@@ -48,18 +51,34 @@ const HalamanAbsensi = () => {
             {/* Header Section - Mobile Optimized */}
             <div className="mb-6">
                 <h1 className="text-2xl sm:text-3xl font-bold text-gray-800 mb-4">Manajemen Absensi Harian</h1>
+
+                {/* Lokasi Proyek - absensi dicatat dan wajah dicocokkan di lokasi ini */}
+                <div className="mb-4">
+                    <label className="block text-sm font-medium text-gray-700 mb-2">Lokasi Proyek</label>
+                    <select
+                        value={selectedLokasi ?? ''}
+                        onChange={(e) => setSelectedLokasi(Number(e.target.value))}
+                        disabled={lokasiList.length === 0}
+                        className="w-full sm:w-auto p-2 border border-gray-300 rounded-lg focus:ring-blue-500 focus:border-blue-500 text-sm"
+                    >
+                        {lokasiList.length === 0 && <option value="">Tidak ada lokasi yang ditugaskan</option>}
+                        {lokasiList.map(l => <option key={l.id_lokasi} value={l.id_lokasi}>{l.nama_lokasi}</option>)}
+                    </select>
+                </div>
                 
                 {/* Action Buttons - Mobile First */}
                 <div className="grid grid-cols-1 sm:grid-cols-2 gap-3 sm:gap-4">
                     <button
                         onClick={() => openModal('face', null, 'smart')}
-                        className="w-full bg-teal-600 text-white px-4 py-3 rounded-lg font-semibold hover:bg-teal-700 transition-colors text-sm sm:text-base"
+                        disabled={!selectedLokasi}
+                        className="w-full bg-teal-600 text-white px-4 py-3 rounded-lg font-semibold hover:bg-teal-700 transition-colors text-sm sm:text-base disabled:opacity-50 disabled:cursor-not-allowed"
                     >
                         🤳 Absensi Wajah
                     </button>
                     <button
                         onClick={() => openModal('qr', null, 'smart')}
-                        className="w-full bg-sky-600 text-white px-4 py-3 rounded-lg font-semibold hover:bg-sky-700 transition-colors text-sm sm:text-base"
+                        disabled={!selectedLokasi}
+                        className="w-full bg-sky-600 text-white px-4 py-3 rounded-lg font-semibold hover:bg-sky-700 transition-colors text-sm sm:text-base disabled:opacity-50 disabled:cursor-not-allowed"
                     >
                         📱 Pindai QR Code
                     </button>
@@ -86,6 +105,7 @@ const HalamanAbsensi = () => {
                 isOpen={isModalOpen}
                 onClose={closeModal}
                 onComplete={handleActionComplete}
+                idLokasi={selectedLokasi}
                 {...modalConfig}
             />
         </Layout>
@@ -21,6 +21,7 @@ const HalamanAbsensi = () => {
         reportLoading,
         selectedDate,
         setSelectedDate,
+        selectedLokasi,
         handleActionComplete
     } = useAttendanceData();
 
@@ -84,6 +85,7 @@ const HalamanAbsensi = () => {
                 isOpen={isModalOpen}
                 onClose={closeModal}
                 onComplete={handleActionComplete}
+                idLokasi={selectedLokasi}
                 {...modalConfig}
             />
         </Layout>
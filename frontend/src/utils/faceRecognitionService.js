@@ -33,10 +33,11 @@ class PythonFaceRecognitionService {
         }
     }
 
-    async recognizeFace(imageBase64) {
+    async recognizeFace(imageBase64, idLokasi = null) {
         try {
             const response = await axiosInstance.post('/face/recognize', {
-                image_base64: imageBase64
+                image_base64: imageBase64,
+                id_lokasi: idLokasi
             });
             return response.data;
         } catch (error) {
@@ -0,0 +1,96 @@
+"""
+Detection Size Benchmark
+Runs the recognition pipeline over a folder of your own photos at several detection sizes
+(FACE_DETECT_MAX_SIDE) and compares each against full-resolution detection: how many images
+still find the same number of faces, how far the encodings move, and the time per stage.
+
+Usage: python benchmark_detection.py ../backend/face_images --sizes 480 640 960 1280
+"""
+import argparse
+import glob
+import json
+import os
+import numpy as np
+
+from image_io import decode_frame
+from inference_pool import detect_and_encode
+
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png')
+STAGES = ('decode_ms', 'detect_ms', 'encode_ms')
+
+
+def run_pipeline(path, max_side):
+    with open(path, 'rb') as f:
+        frame = decode_frame(f, max_side)
+    face_locations, face_encodings, timings = detect_and_encode(frame.array, detection_image=frame.detection)
+    frame.timings.update(timings)
+    return face_locations, np.asarray(face_encodings), frame.timings
+
+
+def encoding_drift(reference, encodings):
+    """Distance from each reference encoding to the closest encoding found at the reduced size"""
+    if len(reference) == 0 or len(encodings) == 0:
+        return []
+    distances = np.linalg.norm(reference[:, None, :] - encodings[None, :, :], axis=2)
+    return distances.min(axis=1).tolist()
+
+
+def summarize(max_side, runs, reference):
+    same_count = sum(len(run[0]) == len(ref[0]) for run, ref in zip(runs, reference))
+    missed = sum(max(0, len(ref[0]) - len(run[0])) for run, ref in zip(runs, reference))
+    drift = [d for run, ref in zip(runs, reference) for d in encoding_drift(ref[1], run[1])]
+    row = {
+        'max_side': max_side,
+        'images': len(runs),
+        'same_face_count': same_count,
+        'missed_faces': missed,
+        'mean_encoding_drift': float(np.mean(drift)) if drift else None,
+        'max_encoding_drift': float(np.max(drift)) if drift else None,
+    }
+    for stage in STAGES:
+        values = [run[2].get(stage, 0.0) for run in runs]
+        row[f'{stage}_p50'] = float(np.percentile(values, 50))
+        row[f'{stage}_p99'] = float(np.percentile(values, 99))
+    row['total_ms_p50'] = float(np.percentile([sum(run[2].get(s, 0.0) for s in STAGES) for run in runs], 50))
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('folder', help='Folder of photos (e.g. backend/face_images)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[480, 640, 960, 1280])
+    parser.add_argument('--limit', type=int, default=0, help='Use at most this many images (0 = all)')
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    args = parser.parse_args()
+
+    paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(args.folder, pattern)))
+    if args.limit:
+        paths = paths[:args.limit]
+    if not paths:
+        parser.error(f"No images found in {args.folder}")
+
+    print(f"Full-resolution reference over {len(paths)} image(s)...")
+    reference = [run_pipeline(path, 0) for path in paths]
+    report = {'images': len(paths), 'results': [summarize(0, reference, reference)]}
+
+    for max_side in args.sizes:
+        runs = [run_pipeline(path, max_side) for path in paths]
+        report['results'].append(summarize(max_side, runs, reference))
+
+    for row in report['results']:
+        label = 'full' if row['max_side'] == 0 else str(row['max_side'])
+        drift = '-' if row['mean_encoding_drift'] is None else f"{row['mean_encoding_drift']:.4f}"
+        print(
+            f"{label:>6}  total p50 {row['total_ms_p50']:8.1f} ms  "
+            f"(decode {row['decode_ms_p50']:.1f} / detect {row['detect_ms_p50']:.1f} / encode {row['encode_ms_p50']:.1f})  "
+            f"same count {row['same_face_count']}/{row['images']}  missed {row['missed_faces']}  drift {drift}"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Face Detector Benchmark
+Runs each detector backend over a folder of your own photos and measures its speed and how
+many faces it finds compared with a reference: recall (reference faces found), precision
+(detections that are reference faces) and detection time per image. The report written with
+--output is what FACE_DETECTOR=auto selects from: the fastest detector whose recall reaches
+FACE_DETECTOR_MIN_RECALL.
+
+Faces at the kiosk are small and far away, enrolment photos are close-ups, so benchmark each
+kind of photo separately and point the service at both reports:
+  FACE_DETECTOR=auto FACE_DETECTOR_REPORT=detectors_kiosk.json
+  FACE_ENROL_DETECTOR=auto FACE_ENROL_DETECTOR_REPORT=detectors_enrol.json
+
+The reference is --reference run at full resolution (default cnn:1), or hand-labelled boxes
+from --truth, a JSON object of file name -> [[top, right, bottom, left], ...] at full size.
+Detection runs at --detect-max-side, like the service (FACE_DETECT_MAX_SIDE).
+
+Usage:
+  python benchmark_detectors.py kiosk_frames/ --profile kiosk --output detectors_kiosk.json
+  python benchmark_detectors.py ../backend/face_images --profile enrol --output detectors_enrol.json
+  python benchmark_detectors.py photos/ --detectors hog:0 hog:1 hog:2 cnn:0 opencv_dnn:300 --truth boxes.json
+"""
+import argparse
+import glob
+import json
+import os
+import time
+import numpy as np
+
+from face_detectors import get_detector, select_detector
+from image_io import decode_frame
+from inference_pool import detect_and_encode
+from stream_tracker import box_iou
+
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png')
+DEFAULT_DETECTORS = ['hog:0', 'hog:1', 'hog:2', 'cnn:0', 'cnn:1', 'opencv_dnn:300', 'opencv_dnn:600']
+
+
+def load_frames(paths, max_side):
+    frames = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            frames.append(decode_frame(f, max_side))
+    return frames
+
+
+def detect(frame, spec):
+    """Boxes on the full image and detection time in ms"""
+    face_locations, _, timings = detect_and_encode(frame.array, 0, frame.detection, detector=spec)
+    return face_locations, timings['detect_ms']
+
+
+def match_count(reference, found, iou_threshold):
+    """Reference boxes matched one-to-one by a found box (greedy, highest IoU first)"""
+    pairs = sorted(((box_iou(r, f), i, j) for i, r in enumerate(reference) for j, f in enumerate(found)), reverse=True)
+    used_reference, used_found = set(), set()
+    for iou, i, j in pairs:
+        if iou < iou_threshold:
+            break
+        if i in used_reference or j in used_found:
+            continue
+        used_reference.add(i)
+        used_found.add(j)
+    return len(used_reference)
+
+
+def benchmark(spec, frames, reference, iou_threshold):
+    try:
+        get_detector(spec)  # Model load is not timed
+    except Exception as e:
+        return {'detector': spec, 'available': False, 'error': str(e)}
+    found, matched, complete, latencies = 0, 0, 0, []
+    for frame, expected in zip(frames, reference):
+        boxes, ms = detect(frame, spec)
+        hits = match_count(expected, boxes, iou_threshold)
+        found += len(boxes)
+        matched += hits
+        complete += hits == len(expected)
+        latencies.append(ms)
+    total = sum(len(expected) for expected in reference)
+    return {
+        'detector': spec,
+        'available': True,
+        'images': len(frames),
+        'reference_faces': total,
+        'detected_faces': found,
+        'matched_faces': matched,
+        'recall': matched / total if total else 1.0,
+        'precision': matched / found if found else 1.0,
+        'images_all_found': complete,
+        'detect_ms_p50': float(np.percentile(latencies, 50)),
+        'detect_ms_p99': float(np.percentile(latencies, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('folder', help='Folder of photos of the kind the detector will see')
+    parser.add_argument('--detectors', nargs='+', default=DEFAULT_DETECTORS, help='Detector specs to compare')
+    parser.add_argument('--reference', default='cnn:1', help='Detector whose full-resolution boxes count as the truth')
+    parser.add_argument('--truth', help='JSON of file name -> labelled boxes, instead of --reference')
+    parser.add_argument('--detect-max-side', type=int, default=int(os.environ.get('FACE_DETECT_MAX_SIDE', 960)))
+    parser.add_argument('--iou', type=float, default=0.4, help='Least overlap for a detection to count as a reference face')
+    parser.add_argument('--min-recall', type=float, default=float(os.environ.get('FACE_DETECTOR_MIN_RECALL', 0.95)))
+    parser.add_argument('--limit', type=int, default=0, help='Use at most this many images (0 = all)')
+    parser.add_argument('--profile', default='photos', help='Name of this kind of photo in the report')
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    args = parser.parse_args()
+
+    paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(args.folder, pattern)))
+    if args.limit:
+        paths = paths[:args.limit]
+    if not paths:
+        parser.error(f"No images found in {args.folder}")
+
+    if args.truth:
+        with open(args.truth) as f:
+            truth = json.load(f)
+        reference = [[tuple(box) for box in truth.get(os.path.basename(path), [])] for path in paths]
+        reference_name = args.truth
+    else:
+        print(f"Reference boxes from {args.reference} at full resolution over {len(paths)} image(s)...")
+        started = time.perf_counter()
+        reference = [detect(frame, args.reference)[0] for frame in load_frames(paths, 0)]
+        print(f"  {sum(map(len, reference))} face(s) in {time.perf_counter() - started:.1f} s")
+        reference_name = args.reference
+
+    frames = load_frames(paths, args.detect_max_side)
+    results = [benchmark(spec, frames, reference, args.iou) for spec in args.detectors]
+    selected = select_detector([row for row in results if row['available']], args.min_recall)
+
+    for row in results:
+        if not row['available']:
+            print(f"{row['detector']:<16} unavailable: {row['error']}")
+            continue
+        print(
+            f"{row['detector']:<16} recall {row['recall']:.3f}  precision {row['precision']:.3f}  "
+            f"detect p50 {row['detect_ms_p50']:8.1f} ms  p99 {row['detect_ms_p99']:8.1f} ms  "
+            f"all faces in {row['images_all_found']}/{row['images']}"
+        )
+    if selected is not None:
+        print(f"Selected for recall >= {args.min_recall}: {selected['detector']}")
+
+    if args.output:
+        report = {
+            'profile': args.profile,
+            'images': len(paths),
+            'reference': reference_name,
+            'detect_max_side': args.detect_max_side,
+            'iou_threshold': args.iou,
+            'min_recall': args.min_recall,
+            'selected': selected['detector'] if selected else None,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
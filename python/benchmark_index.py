@@ -0,0 +1,223 @@
+"""
+Face Index Recall Benchmark
+Compares approximate index backends and the centroid pre-pass (FACE_CENTROID_SHORTLIST)
+against the exact scan of every template on a synthetic gallery, so a recall/latency
+setting can be chosen without silently losing matches.
+
+Also compares gallery precisions (FACE_GALLERY_PRECISION) on a location-scoped search of
+the whole gallery, the widest scan the service does: latency, recall against the float32
+gallery, bytes per row of the scanned matrix, and the error of the first-pass and returned
+distances against face_distance over the original float64 encodings.
+
+Usage: python benchmark_index.py --size 100000 --queries 500 --nprobe 1 4 8 16 32
+       python benchmark_index.py --size 100000 --templates 5 --nprobe --centroid-shortlist 4 16 64
+       python benchmark_index.py --size 200000 --nprobe --precision float32 int8
+"""
+import argparse
+import json
+import time
+import numpy as np
+
+from face_gallery import FaceGallery, ENCODING_DIM, PRECISIONS
+from face_index import make_index
+
+MATCH_DISTANCE = 0.4  # Same cut-off as CONFIDENCE_THRESHOLD = 0.6 in the server
+
+
+def synthetic_gallery(size, clusters=64, templates=1, seed=0):
+    """
+    Clustered random encodings, loosely shaped like real face embeddings; each run of
+    templates rows are captures of one worker
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 0.12, (clusters, ENCODING_DIM))
+    workers = -(-size // templates)
+    members = rng.integers(0, clusters, workers)
+    identities = centers[members] + rng.normal(0, 0.06, (workers, ENCODING_DIM))
+    encodings = np.repeat(identities, templates, axis=0)[:size]
+    if templates > 1:
+        encodings = encodings + rng.normal(0, 0.02, (size, ENCODING_DIM))
+    return encodings.astype(np.float32)
+
+
+def synthetic_probes(encodings, count, seed=1):
+    """Noisy re-captures of enrolled faces"""
+    rng = np.random.default_rng(seed)
+    targets = rng.choice(len(encodings), count, replace=False)
+    noise = rng.normal(0, 0.02, (count, ENCODING_DIM)).astype(np.float32)
+    return encodings[targets] + noise
+
+
+def face_distance(encodings, probe):
+    """face_recognition.face_distance (without loading the dlib models): float64 Euclidean distances"""
+    return np.linalg.norm(np.asarray(encodings, dtype=np.float64) - probe, axis=1)
+
+
+def build_gallery(encodings, index, templates=1, centroid_shortlist=0):
+    """Gallery of encodings, each run of templates rows belonging to one worker"""
+    gallery = FaceGallery(capacity=len(encodings), max_templates=templates, centroid_shortlist=centroid_shortlist)
+    for row, encoding in enumerate(encodings):
+        gallery.add(row // templates, f"worker{row // templates}", encoding)
+    started = time.perf_counter()
+    gallery.set_index(index)
+    return gallery, time.perf_counter() - started
+
+
+def run_queries(gallery, probes, k, scope=None):
+    results, latencies = [], []
+    for probe in probes:
+        started = time.perf_counter()
+        slots, distances, _ = gallery.search(probe, k=k, scope=scope)
+        latencies.append(time.perf_counter() - started)
+        results.append((gallery.ids[slots].tolist(), distances.tolist()))
+    return results, np.array(latencies) * 1000
+
+
+def summarize(latencies_ms):
+    return {
+        'mean_ms': float(latencies_ms.mean()),
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+    }
+
+
+def compare(exact_results, results, k):
+    """Recall of the exact top-1/top-k, plus matches the exact scan accepts but the index loses"""
+    top1 = topk = lost = 0
+    for (exact_ids, exact_dist), (ids, dist) in zip(exact_results, results):
+        if ids and ids[0] == exact_ids[0]:
+            top1 += 1
+        topk += len(set(ids) & set(exact_ids)) / max(1, len(exact_ids))
+        exact_match = exact_dist[0] <= MATCH_DISTANCE
+        index_match = bool(ids) and ids[0] == exact_ids[0] and dist[0] <= MATCH_DISTANCE
+        if exact_match and not index_match:
+            lost += 1
+    count = len(exact_results)
+    return {
+        'recall_at_1': top1 / count,
+        f'recall_at_{k}': topk / count,
+        'lost_matches': lost,
+    }
+
+
+def distance_errors(gallery, encodings, probes, results, samples=20):
+    """
+    Largest and mean gap to face_distance of the first-pass distances (all rows, for a sample
+    of probes) and of the distances searches return
+    """
+    first_pass = []
+    pool = np.arange(len(gallery))
+    for probe in probes[:samples]:
+        sq_dist = gallery.sq_norms[pool] + np.dot(probe, probe) - 2.0 * gallery._scan(probe[None, :], pool)[0]
+        approximate = np.sqrt(np.maximum(sq_dist, 0))
+        first_pass.append(np.abs(approximate - face_distance(encodings[gallery.ids[pool]], probe)))
+    first_pass = np.concatenate(first_pass)
+    returned = np.array([
+        abs(distance - face_distance(encodings[worker_id][None, :], probe)[0])
+        for probe, (ids, distances) in zip(probes, results)
+        for worker_id, distance in zip(ids, distances)
+    ])
+    return {
+        'first_pass_max_error': float(first_pass.max()),
+        'first_pass_mean_error': float(first_pass.mean()),
+        'result_max_error': float(returned.max()),
+    }
+
+
+def compare_precisions(encodings, probes, k, precisions):
+    """Scoped whole-gallery searches at each precision against the float32 gallery"""
+    rows, reference = [], None
+    worker_ids = list(range(len(encodings)))
+    for precision in ['float32'] + [p for p in precisions if p != 'float32']:
+        gallery = FaceGallery.from_arrays(
+            encodings, worker_ids, [f"worker{i}" for i in worker_ids], [0] * len(encodings), precision=precision
+        )
+        results, latency = run_queries(gallery, probes, k, scope=0)
+        if reference is None:
+            reference = results
+        row = {
+            **gallery.memory_stats(),
+            **summarize(latency),
+            **compare(reference, results, k),
+            **distance_errors(gallery, encodings, probes, results)
+        }
+        if precision in precisions:
+            rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=100000, help='Number of enrolled encodings')
+    parser.add_argument('--queries', type=int, default=500, help='Number of probe encodings')
+    parser.add_argument('--k', type=int, default=3, help='Candidates per search')
+    parser.add_argument('--nlist', type=int, default=0, help='IVF bucket count (0 = automatic)')
+    parser.add_argument('--nprobe', type=int, nargs='*', default=[1, 4, 8, 16, 32], help='IVF settings to compare (none skips IVF)')
+    parser.add_argument('--templates', type=int, default=1, help='Encodings per synthetic worker')
+    parser.add_argument('--centroid-shortlist', type=int, nargs='*', default=[16], help='Centroid pre-pass settings to compare')
+    parser.add_argument('--precision', nargs='*', choices=PRECISIONS, default=[], help='Gallery precisions to compare')
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    args = parser.parse_args()
+
+    print(f"Building synthetic gallery of {args.size} encodings...")
+    encodings = synthetic_gallery(args.size, templates=args.templates)
+    probes = synthetic_probes(encodings, min(args.queries, args.size))
+
+    # The reference scores every template
+    gallery, _ = build_gallery(encodings, make_index('exact'), args.templates)
+    exact_results, exact_latency = run_queries(gallery, probes, args.k)
+    report = {
+        'size': args.size,
+        'templates': args.templates,
+        'queries': len(probes),
+        'k': args.k,
+        'exact': summarize(exact_latency),
+        'centroid': [],
+        'ivf': []
+    }
+    print(f"exact         mean {report['exact']['mean_ms']:.3f} ms  p99 {report['exact']['p99_ms']:.3f} ms")
+
+    for shortlist in args.centroid_shortlist:
+        gallery.centroid_shortlist = shortlist
+        results, latency = run_queries(gallery, probes, args.k)
+        row = {'centroid_shortlist': shortlist, **summarize(latency), **compare(exact_results, results, args.k)}
+        report['centroid'].append(row)
+        print(
+            f"centroid shortlist={shortlist:<4} mean {row['mean_ms']:.3f} ms  p99 {row['p99_ms']:.3f} ms  "
+            f"recall@1 {row['recall_at_1']:.4f}  lost matches {row['lost_matches']}"
+        )
+
+    index = make_index('ivf', nlist=args.nlist or None, min_train_size=1)
+    if args.nprobe:
+        gallery, build_seconds = build_gallery(encodings, index, args.templates)
+        report['ivf_build_seconds'] = build_seconds
+        print(f"ivf trained in {build_seconds:.2f}s ({index.stats()['nlist']} buckets)")
+
+    for nprobe in args.nprobe:
+        index.nprobe = nprobe
+        results, latency = run_queries(gallery, probes, args.k)
+        row = {'nprobe': nprobe, **summarize(latency), **compare(exact_results, results, args.k)}
+        report['ivf'].append(row)
+        print(
+            f"ivf nprobe={nprobe:<4} mean {row['mean_ms']:.3f} ms  p99 {row['p99_ms']:.3f} ms  "
+            f"recall@1 {row['recall_at_1']:.4f}  lost matches {row['lost_matches']}"
+        )
+
+    if args.precision:
+        report['precision'] = compare_precisions(encodings, probes, args.k, args.precision)
+    for row in report.get('precision', []):
+        print(
+            f"{row['precision']:<8} scoped mean {row['mean_ms']:.3f} ms  p99 {row['p99_ms']:.3f} ms  "
+            f"scan {row['scan_bytes_per_row']:.0f} B/row  exact rows {row['exact_rows']}  recall@1 {row['recall_at_1']:.4f}  "
+            f"lost matches {row['lost_matches']}  first-pass error {row['first_pass_max_error']:.2e}  "
+            f"result error {row['result_max_error']:.2e}"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Face Recognition Service Benchmark
+Headless, repeatable timings of the service's request paths, written as JSON so runs can be
+compared across commits:
+
+- in-process, per synthetic gallery size (random 128-d vectors around face-like clusters):
+  decode (process_image on a base64 payload), detect_encode, match (gallery search of a
+  synthetic probe), and register, recognize and delete of every probe photo
+- over HTTP with --url, against the running service and its own gallery:
+  /recognize, /register and /delete_worker of every probe photo (synthetic worker ids)
+
+Probe photos are single-face images from --images (default ../backend/face_images). The
+in-process service uses a throwaway encoding store and has the recognition cache disabled,
+so every recognize runs the full pipeline. Operations run back to back on one thread;
+see load_test.py for throughput under concurrency.
+
+Usage:
+  python benchmark_service.py --sizes 1000 10000 100000 --output before.json
+  python benchmark_service.py --sizes 1000 10000 100000 --baseline before.json --output after.json
+  python benchmark_service.py --sizes 1000 --url http://localhost:5000
+"""
+import argparse
+import base64
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmark_index import synthetic_gallery, synthetic_probes
+
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png')
+
+
+def summarize(latencies):
+    latencies_ms = np.array(latencies) * 1000
+    total = float(np.sum(latencies))
+    return {
+        'count': len(latencies),
+        'mean_ms': float(latencies_ms.mean()),
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'ops_per_second': len(latencies) / total if total else 0.0,
+    }
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def load_probes(folder, limit):
+    paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(folder, pattern)))
+    if limit:
+        paths = paths[:limit]
+    probes = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        mime = 'image/png' if path.lower().endswith('.png') else 'image/jpeg'
+        probes.append({
+            'path': path,
+            'data': data,
+            'base64': f"data:{mime};base64," + base64.b64encode(data).decode()
+        })
+    return probes
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_service(store_dir):
+    """Import the server module as an idle, cache-less service over a throwaway store"""
+    os.environ['FACE_DEFER_START'] = 'true'
+    os.environ['FACE_STORE_DIR'] = store_dir
+    os.environ['FACE_CACHE_SIZE'] = '0'
+    import face_recognition_server as server
+    server.face_service.start()
+    server.face_service.readiness.wait()
+    return server
+
+
+def bench_in_process(server, sizes, probes, queries, repeat, id_base):
+    service = server.face_service
+    results = []
+
+    def record(size, operation, latencies):
+        if latencies:
+            results.append({'mode': 'in_process', 'gallery_size': size, 'operation': operation, **summarize(latencies)})
+
+    # Decode and detection do not depend on the gallery
+    decode, detect, frames = [], [], []
+    for pass_number in range(repeat):
+        for probe in probes:
+            elapsed, frame = timed(service.process_image, probe['base64'])
+            decode.append(elapsed)
+            if frame is None:
+                continue
+            elapsed, (face_locations, _) = timed(service.detect_and_encode, frame)
+            detect.append(elapsed)
+            if pass_number == 0 and len(face_locations) == 1:
+                frames.append(frame)
+    record(None, 'decode', decode)
+    record(None, 'detect_encode', detect)
+    if probes and not frames:
+        print("No probe photo had exactly one detectable face; register/recognize/delete are skipped")
+
+    for size in sizes:
+        encodings = synthetic_gallery(size)
+        worker_ids = list(range(size))
+        started = time.perf_counter()
+        with service.write_lock:
+            service.publish(server.FaceGallery.from_arrays(
+                encodings, worker_ids, [f"worker{i}" for i in worker_ids], [None] * size,
+                index=server.build_index(), **server.GALLERY_OPTIONS
+            ))
+        print(f"Gallery of {size} built in {time.perf_counter() - started:.1f} s")
+
+        record(size, 'match', [timed(service.match_encoding, probe)[0] for probe in synthetic_probes(encodings, min(queries, size))])
+
+        register, recognize, delete = [], [], []
+        for _ in range(repeat):
+            for i, frame in enumerate(frames):
+                worker_id = id_base + i
+                elapsed, (success, message, _) = timed(service.register_face, frame, worker_id, f"Probe {worker_id}")
+                if not success:
+                    print(f"Register of probe {i} failed: {message}")
+                    continue
+                register.append(elapsed)
+                recognize.append(timed(service.recognize_face, frame)[0])
+            for i in range(len(frames)):
+                elapsed, (success, _, _) = timed(service.delete_worker, id_base + i)
+                if success:
+                    delete.append(elapsed)
+        service.persistence.flush(timeout=60)
+        record(size, 'register', register)
+        record(size, 'recognize', recognize)
+        record(size, 'delete', delete)
+    return results
+
+
+def bench_http(url, probes, repeat, id_base):
+    import requests
+
+    session = requests.Session()
+    gallery_size = session.get(f"{url}/health", timeout=10).json().get('templates')
+    register, recognize, delete = [], [], []
+    for _ in range(repeat):
+        registered = []
+        for i, probe in enumerate(probes):
+            worker_id = id_base + i
+            elapsed, response = timed(lambda: session.post(f"{url}/register", json={
+                'image': probe['base64'], 'worker_id': worker_id, 'worker_name': f"Probe {worker_id}"
+            }, timeout=60))
+            if response.status_code != 200 or not response.json().get('success'):
+                continue
+            register.append(elapsed)
+            registered.append(worker_id)
+            recognize.append(timed(lambda: session.post(f"{url}/recognize", json={'image': probe['base64']}, timeout=60))[0])
+        for worker_id in registered:
+            delete.append(timed(lambda: session.post(f"{url}/delete_worker", json={'worker_id': worker_id}, timeout=60))[0])
+    session.close()
+    return [
+        {'mode': 'http', 'gallery_size': gallery_size, 'operation': operation, **summarize(latencies)}
+        for operation, latencies in (('register', register), ('recognize', recognize), ('delete', delete))
+        if latencies
+    ]
+
+
+def result_key(row):
+    return (row['mode'], row['gallery_size'], row['operation'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Synthetic gallery sizes')
+    parser.add_argument('--images', default=os.path.join('..', 'backend', 'face_images'), help='Folder of single-face probe photos')
+    parser.add_argument('--limit', type=int, default=20, help='Use at most this many probe photos (0 = all)')
+    parser.add_argument('--queries', type=int, default=500, help='Synthetic probes matched per gallery size')
+    parser.add_argument('--repeat', type=int, default=3, help='Passes over the probe photos')
+    parser.add_argument('--id-base', type=int, default=990000, help='First worker id used for probe registrations')
+    parser.add_argument('--url', help='Also benchmark a running service at this base URL')
+    parser.add_argument('--skip-in-process', action='store_true', help='Only benchmark over HTTP')
+    parser.add_argument('--label', default='run', help='Name for this run in the report')
+    parser.add_argument('--baseline', help='Earlier --output report to compare against')
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    args = parser.parse_args()
+
+    probes = load_probes(args.images, args.limit)
+    print(f"{len(probes)} probe photo(s) from {args.images}")
+
+    results = []
+    if not args.skip_in_process:
+        with tempfile.TemporaryDirectory(prefix='face_bench_') as store_dir:
+            server = load_service(store_dir)
+            try:
+                results += bench_in_process(server, args.sizes, probes, args.queries, args.repeat, args.id_base)
+            finally:
+                server.face_service.stop()
+    if args.url:
+        results += bench_http(args.url.rstrip('/'), probes, args.repeat, args.id_base)
+
+    report = {
+        'label': args.label,
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'index_backend': os.environ.get('FACE_INDEX_BACKEND', 'exact'),
+        'probes': len(probes),
+        'results': results,
+    }
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['baseline'] = json.load(f)
+        baseline = {result_key(row): row for row in report['baseline']['results']}
+
+    for row in results:
+        size = '-' if row['gallery_size'] is None else row['gallery_size']
+        line = (f"{row['mode']:<10} {size:>8} {row['operation']:<14} {row['ops_per_second']:9.1f} op/s  "
+                f"p50 {row['p50_ms']:8.2f} ms  p99 {row['p99_ms']:8.2f} ms")
+        before = baseline.get(result_key(row))
+        if before:
+            line += f"  (p50 {row['p50_ms'] - before['p50_ms']:+.2f} ms, p99 {row['p99_ms'] - before['p99_ms']:+.2f} ms)"
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
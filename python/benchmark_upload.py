@@ -0,0 +1,117 @@
+"""
+Image Upload Benchmark
+Compares the three ways /recognize and /register accept an image: base64 JSON (legacy),
+multipart upload and a raw image/jpeg body. Reports the request size on the wire and the
+peak memory allocated while parsing the request and decoding the image.
+
+Peak memory is traced with tracemalloc, which sees Python and NumPy allocations
+(JSON text, base64 strings, decoded bytes, the RGB array) but not PIL's internal buffers.
+
+Usage: python benchmark_upload.py --image photo.jpg --repeat 5
+"""
+import argparse
+import base64
+import json
+import time
+import tracemalloc
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from image_io import decode_image
+
+
+def synthetic_jpeg(width=4000, height=3000, quality=90, seed=0):
+    """Phone-camera sized JPEG with enough texture to compress realistically"""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def build_request(mode, jpeg):
+    """WSGI environ for one /recognize request in the given encoding, plus its body size"""
+    if mode == 'json':
+        body = json.dumps({'image': 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode()}).encode()
+        builder = EnvironBuilder(method='POST', path='/recognize', data=body, content_type='application/json')
+    elif mode == 'multipart':
+        builder = EnvironBuilder(
+            method='POST', path='/recognize',
+            data={'image': (BytesIO(jpeg), 'frame.jpg', 'image/jpeg')}
+        )
+    else:
+        builder = EnvironBuilder(method='POST', path='/recognize', data=jpeg, content_type='image/jpeg')
+    environ = builder.get_environ()
+    return environ, int(environ['CONTENT_LENGTH'])
+
+
+def handle(mode, environ):
+    """Parse the body the way request_fields() does and decode the image"""
+    environ['wsgi.input'].seek(0)
+    request = Request(environ)
+    if mode == 'json':
+        source = request.get_json()['image']
+    elif mode == 'multipart':
+        source = request.files['image'].stream
+    else:
+        source = request.stream
+    return decode_image(source)
+
+
+def measure(mode, jpeg, repeat):
+    environ, wire_bytes = build_request(mode, jpeg)
+    peaks, latencies = [], []
+    for _ in range(repeat):
+        tracemalloc.start()
+        started = time.perf_counter()
+        image_array = handle(mode, environ)
+        latencies.append(time.perf_counter() - started)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        del image_array
+    return {
+        'mode': mode,
+        'wire_bytes': wire_bytes,
+        'peak_memory_bytes': int(np.median(peaks)),
+        'decode_ms': float(np.median(latencies) * 1000),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--image', help='JPEG to upload (default: synthetic 4000x3000 frame)')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per mode; medians are reported')
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, 'rb') as f:
+            jpeg = f.read()
+    else:
+        jpeg = synthetic_jpeg()
+    print(f"Image: {len(jpeg) / 1e6:.2f} MB JPEG")
+
+    report = {'jpeg_bytes': len(jpeg), 'modes': [measure(mode, jpeg, args.repeat) for mode in ('json', 'multipart', 'raw')]}
+    legacy = report['modes'][0]
+    for row in report['modes']:
+        print(
+            f"{row['mode']:<10} wire {row['wire_bytes'] / 1e6:7.2f} MB ({row['wire_bytes'] / legacy['wire_bytes']:.0%})  "
+            f"peak {row['peak_memory_bytes'] / 1e6:7.1f} MB ({row['peak_memory_bytes'] / legacy['peak_memory_bytes']:.0%})  "
+            f"decode {row['decode_ms']:.1f} ms"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
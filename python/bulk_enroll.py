@@ -0,0 +1,324 @@
+"""
+Bulk Enrolment
+Rebuilds gallery templates from stored capture files (worker_<id>_<timestamp>.jpg, as the
+backend writes them to backend/face_images) instead of one /register call per image.
+Images are read from a directory or streamed from a tarball, decoded and encoded on a
+process pool, de-duplicated per worker and written to the encoding store as one new
+generation, so readers see either the old gallery or the complete new one.
+
+The command writes the store directly: stop the service first, or send the tarball to
+the running service's /bulk_register endpoint instead.
+
+Usage: python bulk_enroll.py ../backend/face_images --workers workers.csv --processes 8
+       python bulk_enroll.py captures.tar.gz --mode replace --report report.json
+"""
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import tarfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from io import BytesIO
+import numpy as np
+
+from encoding_store import EncodingStore, StoreLocked
+from face_detectors import resolve_detector
+from image_io import decode_frame
+from inference_pool import detect_and_encode
+
+logger = logging.getLogger(__name__)
+
+FILENAME_PATTERN = re.compile(r'^worker_(\d+)_(\d+)\.(?:jpe?g|png)$', re.IGNORECASE)
+MODES = ('merge', 'replace')  # merge keeps workers missing from the import, replace drops them
+
+# Same environment as the service, without importing (and starting) it
+ENCODINGS_DIR = os.environ.get('FACE_STORE_DIR', 'face_store')
+DETECT_MAX_SIDE = int(os.environ.get('FACE_DETECT_MAX_SIDE', 960))
+MAX_TEMPLATES = int(os.environ.get('FACE_MAX_TEMPLATES', 5))
+TEMPLATE_MIN_DISTANCE = float(os.environ.get('FACE_TEMPLATE_MIN_DISTANCE', 0.06))
+ENROL_DETECTOR = os.environ.get('FACE_ENROL_DETECTOR', os.environ.get('FACE_DETECTOR', 'hog'))
+ENROL_DETECTOR_REPORT = os.environ.get('FACE_ENROL_DETECTOR_REPORT', 'detectors_enrol.json')
+DETECTOR_MIN_RECALL = float(os.environ.get('FACE_DETECTOR_MIN_RECALL', 0.95))
+
+
+def parse_filename(name):
+    """(worker_id, timestamp) from a capture file name, or None if it does not follow the pattern"""
+    match = FILENAME_PATTERN.match(os.path.basename(name))
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def iter_directory(path):
+    """(name, bytes) for every file in a directory, in name order"""
+    for entry in sorted(os.scandir(path), key=lambda entry: entry.name):
+        if entry.is_file():
+            with open(entry.path, 'rb') as f:
+                yield entry.name, f.read()
+
+
+def iter_tarball(fileobj):
+    """(name, bytes) for every file in a tar stream, compressed or not, read front to back"""
+    with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+        for member in archive:
+            if member.isfile():
+                yield member.name, archive.extractfile(member).read()
+
+
+def iter_source(path):
+    """Images of a directory or a tarball on disk"""
+    if os.path.isdir(path):
+        yield from iter_directory(path)
+    else:
+        with open(path, 'rb') as f:
+            yield from iter_tarball(f)
+
+
+def _encode(data, detect_max_side, detector=None):
+    """Runs on a pool process: (encoding, None) or (None, failure reason)"""
+    try:
+        frame = decode_frame(BytesIO(data), detect_max_side)
+    except Exception:
+        return None, 'unreadable_image'
+    face_locations, face_encodings, _ = detect_and_encode(frame.array, 1, frame.detection, detector=detector)
+    if not face_locations:
+        return None, 'no_face'
+    if len(face_locations) > 1:
+        return None, 'multiple_faces'
+    if not face_encodings:
+        return None, 'no_encoding'
+    return np.asarray(face_encodings[0], dtype=np.float32), None
+
+
+def _pool_context():
+    """
+    Start method for the encoding processes. Forking the service while another of its threads
+    holds a lock (logging, the allocator, a request's) can leave the child deadlocked, so they
+    come from a single-threaded fork server, or are spawned where there is none
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    # The server imports only this module (and the models through it), never the service's __main__
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+def encode_images(items, processes=None, detect_max_side=0, report=None, detector=None):
+    """
+    Encode (name, bytes) items on a process pool. Yields (worker_id, timestamp, encoding)
+    for every usable image; skipped and failed images are counted in report
+    """
+    report = report if report is not None else new_report()
+    processes = processes or os.cpu_count() or 1
+    context = _pool_context()
+    seen = set()
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        pending = {}
+        for name, data in items:
+            report['images'] += 1
+            parsed = parse_filename(name)
+            if parsed is None:
+                report['failures'].append({'file': name, 'reason': 'unrecognized_filename'})
+                continue
+            # The same capture stored twice is only encoded once
+            digest = (parsed[0], hashlib.blake2b(data, digest_size=16).digest())
+            if digest in seen:
+                report['duplicate_images'] += 1
+                continue
+            seen.add(digest)
+
+            pending[executor.submit(_encode, data, detect_max_side, detector)] = (name, parsed)
+            # Keep a few images per process queued; the rest of the source is not read yet
+            if len(pending) >= processes * 4:
+                yield from _collect(pending, report)
+        while pending:
+            yield from _collect(pending, report)
+
+
+def _collect(pending, report):
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        name, (worker_id, timestamp) = pending.pop(future)
+        try:
+            encoding, reason = future.result()
+        except Exception as e:
+            encoding, reason = None, f'error: {e}'
+        if encoding is None:
+            report['failures'].append({'file': name, 'worker_id': worker_id, 'reason': reason})
+            continue
+        report['encoded'] += 1
+        yield worker_id, timestamp, encoding
+
+
+def select_templates(encoded, max_templates, min_distance):
+    """
+    Templates per worker: the newest captures first, skipping any closer than min_distance
+    to one already kept, up to max_templates. Returns {worker_id: [encodings]}
+    """
+    by_worker = {}
+    for worker_id, timestamp, encoding in encoded:
+        by_worker.setdefault(worker_id, []).append((timestamp, encoding))
+
+    templates = {}
+    for worker_id, captures in by_worker.items():
+        kept = []
+        for _, encoding in sorted(captures, key=lambda capture: capture[0], reverse=True):
+            if len(kept) >= max_templates:
+                break
+            if kept and np.linalg.norm(np.asarray(kept) - encoding, axis=1).min() < min_distance:
+                continue
+            kept.append(encoding)
+        templates[worker_id] = kept
+    return templates
+
+
+def merge_arrays(current, templates, workers=None, mode='merge'):
+    """
+    Gallery arrays with the imported templates applied to current (encodings, ids, names, scopes).
+    Imported workers replace their existing rows and keep their name and location unless
+    workers ({worker_id: {'name': ..., 'location_id': ...}}) says otherwise
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode!r}, expected one of {MODES}")
+    workers = workers or {}
+    encodings, worker_ids, worker_names, scopes = current
+
+    known = {}
+    rows = []
+    for row, (worker_id, worker_name, scope) in enumerate(zip(worker_ids, worker_names, scopes)):
+        worker_id = int(worker_id)
+        known.setdefault(worker_id, (worker_name, scope))
+        if mode == 'merge' and worker_id not in templates:
+            rows.append(row)
+
+    new_encodings = [np.asarray(encodings[rows], dtype=np.float32).reshape(-1, encodings.shape[1])]
+    new_ids = [int(worker_ids[row]) for row in rows]
+    new_names = [worker_names[row] for row in rows]
+    new_scopes = [scopes[row] for row in rows]
+    for worker_id, kept in sorted(templates.items()):
+        if not kept:
+            continue
+        worker_name, scope = known.get(worker_id, (f"Worker {worker_id}", None))
+        info = workers.get(worker_id, {})
+        worker_name = info.get('name') or worker_name
+        scope = info.get('location_id', scope)
+        new_encodings.append(np.asarray(kept, dtype=np.float32))
+        new_ids.extend([worker_id] * len(kept))
+        new_names.extend([worker_name] * len(kept))
+        new_scopes.extend([scope] * len(kept))
+    return np.concatenate(new_encodings), new_ids, new_names, new_scopes
+
+
+def new_report():
+    return {
+        'images': 0,
+        'encoded': 0,
+        'duplicate_images': 0,
+        'workers': 0,
+        'templates': 0,
+        'failures': []
+    }
+
+
+def enroll(items, processes=None, detect_max_side=0, max_templates=5, min_distance=0.06, detector=None):
+    """Encode and select templates for (name, bytes) items. Returns ({worker_id: [encodings]}, report)"""
+    started = time.perf_counter()
+    report = new_report()
+    templates = select_templates(
+        encode_images(items, processes, detect_max_side, report, detector),
+        max_templates,
+        min_distance
+    )
+    report['workers'] = sum(1 for kept in templates.values() if kept)
+    report['templates'] = sum(len(kept) for kept in templates.values())
+    report['elapsed_s'] = round(time.perf_counter() - started, 2)
+    return templates, report
+
+
+def parse_workers(records):
+    """
+    {worker_id: {'name', 'location_id'}} from records with worker_id, worker_name and optional
+    location_id fields (CSV rows exported from the pekerja table, or a request's JSON list)
+    """
+    workers = {}
+    for record in records:
+        info = {'name': record.get('worker_name') or None}
+        # Without a location_id field the worker keeps its current location
+        if 'location_id' in record:
+            location_id = record['location_id']
+            info['location_id'] = int(location_id) if location_id not in (None, '') else None
+        workers[int(record['worker_id'])] = info
+    return workers
+
+
+def load_workers(path):
+    """Worker names and locations from a CSV with worker_id, worker_name, location_id columns"""
+    with open(path, newline='', encoding='utf-8') as f:
+        return parse_workers(csv.DictReader(f))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help='Directory or tarball of worker_<id>_<timestamp>.jpg captures')
+    parser.add_argument('--store', default=ENCODINGS_DIR, help='Encoding store directory')
+    parser.add_argument('--workers', help='CSV with worker_id, worker_name, location_id columns')
+    parser.add_argument('--mode', choices=MODES, default='merge')
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--detect-max-side', type=int, default=DETECT_MAX_SIDE)
+    parser.add_argument('--max-templates', type=int, default=MAX_TEMPLATES)
+    parser.add_argument('--min-distance', type=float, default=TEMPLATE_MIN_DISTANCE)
+    parser.add_argument('--detector', default=ENROL_DETECTOR, help='hog[:upsample], cnn[:upsample], opencv_dnn[:size] or auto')
+    parser.add_argument('--dry-run', action='store_true', help='Encode and report without writing the store')
+    parser.add_argument('--report', help='Write the report as JSON to this file')
+    args = parser.parse_args()
+
+    if not args.dry_run:
+        # Fail before encoding, not after, if the service is running on the store
+        store = EncodingStore(args.store)
+        try:
+            store.acquire_writer()
+        except StoreLocked as e:
+            parser.error(f"{e}; stop it or use POST /bulk_register")
+
+    templates, report = enroll(
+        iter_source(args.source),
+        args.processes,
+        args.detect_max_side,
+        args.max_templates,
+        args.min_distance,
+        resolve_detector(args.detector, ENROL_DETECTOR_REPORT, DETECTOR_MIN_RECALL)
+    )
+
+    if not args.dry_run:
+        arrays = merge_arrays(
+            store.load(),
+            templates,
+            load_workers(args.workers) if args.workers else None,
+            args.mode
+        )
+        store.compact(*arrays)
+        report['gallery_rows'] = len(arrays[1])
+
+    print(
+        f"{report['images']} image(s): {report['encoded']} encoded, {report['duplicate_images']} duplicate, "
+        f"{len(report['failures'])} failed -> {report['workers']} worker(s), {report['templates']} template(s) "
+        f"in {report['elapsed_s']} s"
+    )
+    for failure in report['failures']:
+        print(f"  {failure['file']}: {failure['reason']}")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
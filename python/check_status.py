@@ -1,13 +1,17 @@
 """
 Face Recognition Service Status Checker
 """
+import os
 import requests
 import json
 
+FACE_SERVICE_URL = os.environ.get('FACE_SERVICE_URL', 'http://localhost:5000')  # Same variable the backend reads
+BACKEND_URL = os.environ.get('BACKEND_URL', 'http://localhost:3000')  # Node backend, PORT defaults to 3000
+
 def check_service_status():
     """Check if face recognition service is running"""
     try:
-        response = requests.get('http://localhost:5001/health', timeout=5)
+        response = requests.get(f'{FACE_SERVICE_URL}/health', timeout=5)
         result = response.json()
         print("✅ Face Recognition Service is running")
         print(f"Status: {result.get('status')}")
@@ -21,7 +25,7 @@ def check_service_status():
 def list_registered_faces():
     """List all registered faces"""
     try:
-        response = requests.get('http://localhost:5001/list_registered', timeout=5)
+        response = requests.get(f'{FACE_SERVICE_URL}/list_registered', timeout=5)
         result = response.json()
         
         if result.get('success'):
@@ -39,7 +43,7 @@ def list_registered_faces():
 def check_backend_connection():
     """Check backend face API"""
     try:
-        response = requests.get('http://localhost:5000/api/face/health', timeout=5)
+        response = requests.get(f'{BACKEND_URL}/api/face/health', timeout=5)
         result = response.json()
         print("✅ Backend Face API is accessible")
         print(f"Response: {json.dumps(result, indent=2)}")
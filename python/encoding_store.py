@@ -0,0 +1,470 @@
+# Encoding Store
+# Append-only on-disk persistence for the face gallery:
+#   vectors.<gen>.f32  fixed-stride float32 rows, opened with np.memmap on startup
+#   journal.<gen>.log  one JSON record per line: inserts (pointing at a vector row),
+#                      tombstones and location changes
+#   CURRENT            name of the live generation, swapped atomically on compaction
+#   LOCK               flock()ed by the one process allowed to write
+# Appends are fsynced; compaction writes temp files, fsyncs and renames them.
+# One process writes a store; others may follow it by reading the journal past the
+# offset they last saw (read_delta) and only reload fully after a compaction.
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, run a single writer by hand
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def _fsync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _fsync_directory(path):
+    """Make renames inside a directory durable (not supported on Windows)"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class StoreLocked(Exception):
+    """Raised when another process holds a store's writer lock"""
+
+
+class EncodingStore:
+    """Journaled encoding files; every register/delete costs O(1) I/O"""
+
+    def __init__(self, directory, dim=128, compact_ratio=0.5, compact_min_rows=1024):
+        self.directory = directory
+        self.dim = dim
+        self.stride = dim * np.dtype(np.float32).itemsize
+        self.compact_ratio = compact_ratio
+        self.compact_min_rows = compact_min_rows
+        self.generation = 0
+        self.total_rows = 0
+        self.live_count = 0
+        self.live_rows = {}
+        self.signature = None
+        self.journal_offset = 0
+        # Vector rows and journal bytes this instance wrote for a batch that has not completed;
+        # a retry overwrites them instead of taking them for another process's writes
+        self.unjournaled_rows = 0
+        self.journal_incomplete = False
+        # Whether this instance has read the store it would write; see _check_loaded
+        self.loaded = False
+        # Open LOCK file while this instance is the store's writer
+        self.writer = None
+        # apply() runs on the persistence thread while request threads may read deltas
+        self.lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _vectors_path(self, generation=None):
+        return self._path(f"vectors.{self.generation if generation is None else generation}.f32")
+
+    def _journal_path(self, generation=None):
+        return self._path(f"journal.{self.generation if generation is None else generation}.log")
+
+    def acquire_writer(self, timeout=0):
+        """
+        Become the store's only writer until release_writer() or exit. Waits up to timeout
+        seconds (for a worker being replaced on reload) and raises StoreLocked after that
+        """
+        if self.writer is not None or fcntl is None:
+            return
+        f = open(self._path('LOCK'), 'a+')
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    f.seek(0)
+                    holder = f.read().strip() or 'another process'
+                    f.close()
+                    raise StoreLocked(f"Encoding store {self.directory} is being written by {holder}")
+                time.sleep(0.1)
+        f.seek(0)
+        f.truncate()
+        f.write(f"pid {os.getpid()}")
+        f.flush()
+        self.writer = f
+
+    def release_writer(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    @contextmanager
+    def _writing(self):
+        """Hold the writer lock for one write, unless this instance already holds it for good"""
+        if self.writer is not None or fcntl is None:
+            yield
+            return
+        self.acquire_writer()
+        try:
+            yield
+        finally:
+            self.release_writer()
+
+    def exists(self):
+        return os.path.exists(self._path('CURRENT'))
+
+    def _disk_signature(self):
+        """(generation, vector bytes, journal bytes) as currently on disk"""
+        if not self.exists():
+            return None
+        with open(self._path('CURRENT')) as f:
+            generation = int(f.read().strip())
+        sizes = [
+            os.path.getsize(path) if os.path.exists(path) else 0
+            for path in (self._vectors_path(generation), self._journal_path(generation))
+        ]
+        return (generation, *sizes)
+
+    def is_stale(self):
+        """Whether the files changed since this instance last loaded or wrote them"""
+        return self._disk_signature() != self.signature
+
+    @property
+    def dead_rows(self):
+        return self.total_rows - self.live_count
+
+    def load(self):
+        """
+        Map the vector file and replay the journal.
+        Returns (encodings, worker_ids, worker_names, scopes) for the live rows in insert order
+        """
+        vectors, rows, worker_ids, worker_names, scopes = self.load_mapped()
+        encodings = np.asarray(vectors[rows]) if rows else np.zeros((0, self.dim), dtype=np.float32)
+        return encodings, worker_ids, worker_names, scopes
+
+    def load_mapped(self):
+        """
+        load() without copying the rows out of the vector file.
+        Returns (vectors, rows, worker_ids, worker_names, scopes): the read-only memory map of
+        the vector file and the row of each live encoding in it. The map stays valid after a
+        compaction replaces the file, which keeps its disk space until the map is dropped
+        """
+        with self.lock:
+            return self._load()
+
+    def _load(self):
+        empty = np.zeros((0, self.dim), dtype=np.float32)
+        self.loaded = False
+        if not self.exists():
+            self.loaded = True
+            return empty, [], [], [], []
+
+        with open(self._path('CURRENT')) as f:
+            self.generation = int(f.read().strip())
+
+        vectors = self._open_vectors()
+        entries = self._replay_journal(len(vectors))
+
+        rows = [row for row, _, _, _ in entries]
+        self.live_rows = {}
+        for row, worker_id, _, _ in entries:
+            self.live_rows.setdefault(worker_id, []).append(row)
+        self.live_count = len(rows)
+
+        self.signature = self._disk_signature()
+        self.loaded = True
+        logger.info(f"Mapped {self.total_rows} stored rows ({len(rows)} live) from generation {self.generation}")
+        return (
+            vectors,
+            rows,
+            [worker_id for _, worker_id, _, _ in entries],
+            [worker_name for _, _, worker_name, _ in entries],
+            [scope for _, _, _, scope in entries]
+        )
+
+    def _open_vectors(self):
+        """Memory-map the whole rows of the vector file; a torn trailing row is cut by the next append"""
+        path = self._vectors_path()
+        self.total_rows = os.path.getsize(path) // self.stride if os.path.exists(path) else 0
+        if self.total_rows == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.memmap(path, dtype=np.float32, mode='r', shape=(self.total_rows, self.dim))
+
+    def _replay_journal(self, row_count):
+        """Fold the journal into the ordered list of live (row, worker_id, worker_name, scope)"""
+        path = self._journal_path()
+        data = b''
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+        # A torn last line is an interrupted append, or one the writer is making right now:
+        # it is skipped, and only cut off by the writer (here, or before its next append)
+        if data and not data.endswith(b'\n'):
+            data = data[:data.rfind(b'\n') + 1]
+            if self.writer is not None:
+                with open(path, 'r+b') as f:
+                    f.truncate(len(data))
+        self.journal_offset = len(data)
+        self.unjournaled_rows = 0
+        self.journal_incomplete = False
+
+        live = {}
+        rows_by_worker = {}
+        for record in self._parse_records(data, path):
+            op = record['op']
+            worker_id = record['worker_id']
+            if op == 'add' and record['row'] < row_count:
+                live[record['row']] = [worker_id, record['name'], record.get('scope')]
+                rows_by_worker.setdefault(worker_id, []).append(record['row'])
+            elif op == 'del':
+                for row in rows_by_worker.pop(worker_id, []):
+                    del live[row]
+            elif op == 'scope':
+                for row in rows_by_worker.get(worker_id, []):
+                    live[row][2] = record.get('scope')
+        return [(row, *live[row]) for row in sorted(live)]
+
+    @staticmethod
+    def _parse_records(data, path):
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping unreadable journal record in {path}")
+
+    def read_delta(self):
+        """
+        Changes another process appended since this instance last loaded, wrote or read a delta,
+        as ('add', worker_id, worker_name, encoding, scope), ('delete', worker_id) and
+        ('scope', worker_id, scope) ops in journal order (see FaceGallery.apply).
+        Returns None when the store was compacted into a new generation and needs a full load
+        """
+        with self.lock:
+            signature = self._disk_signature()
+            if signature == self.signature:
+                return []
+            if signature is None or signature[0] != self.generation:
+                return None
+
+            path = self._journal_path()
+            with open(path, 'rb') as f:
+                f.seek(self.journal_offset)
+                data = f.read()
+            # A record still being appended is picked up by the next call
+            data = data[:data.rfind(b'\n') + 1]
+            records = list(self._parse_records(data, path))
+
+            # Vector rows are durable before the records that point at them
+            row_count = os.path.getsize(self._vectors_path()) // self.stride
+            if row_count:
+                vectors = np.memmap(self._vectors_path(), dtype=np.float32, mode='r', shape=(row_count, self.dim))
+            ops = []
+            for record in records:
+                worker_id = record['worker_id']
+                if record['op'] == 'add' and record['row'] < row_count:
+                    ops.append(('add', worker_id, record['name'], np.array(vectors[record['row']]), record.get('scope')))
+                    self.live_rows.setdefault(worker_id, []).append(record['row'])
+                    self.live_count += 1
+                elif record['op'] == 'del':
+                    ops.append(('delete', worker_id))
+                    self.live_count -= len(self.live_rows.pop(worker_id, []))
+                elif record['op'] == 'scope':
+                    ops.append(('scope', worker_id, record.get('scope')))
+
+            self.total_rows = row_count
+            self.journal_offset += len(data)
+            self.signature = (self.generation, row_count * self.stride, self.journal_offset)
+            return ops
+
+    def _check_loaded(self):
+        """Refuse to write over an existing store this instance never loaded (or failed to)"""
+        if self.exists() and not self.loaded:
+            raise RuntimeError(f"Encoding store {self.directory} was not loaded; refusing to write over it")
+
+    def _ensure_initialized(self):
+        if not self.exists():
+            self.compact(np.zeros((0, self.dim), dtype=np.float32), [], [], [])
+
+    def apply(self, ops):
+        """
+        Persist a batch of operations with one vector append, one journal append and one fsync each.
+        ops are ('add', worker_id, worker_name, encoding, scope), ('replace', ...same...),
+        ('templates', worker_id, worker_name, [encodings], scope) which replaces every row of
+        the worker, ('delete', worker_id) or ('scope', worker_id, scope)
+        """
+        with self.lock, self._writing():
+            self._apply(ops)
+
+    def _apply(self, ops):
+        self._check_loaded()
+        self._ensure_initialized()
+        vectors, records = [], []
+        row = self.total_rows
+        for op in ops:
+            kind, worker_id = op[0], int(op[1])
+            if kind in ('delete', 'replace', 'templates'):
+                records.append({'op': 'del', 'worker_id': worker_id})
+            if kind in ('add', 'replace', 'templates'):
+                _, _, worker_name, encodings, scope = op
+                if kind != 'templates':
+                    encodings = [encodings]
+                for encoding in encodings:
+                    vectors.append(np.asarray(encoding, dtype=np.float32).tobytes())
+                    records.append({
+                        'op': 'add',
+                        'row': row,
+                        'worker_id': worker_id,
+                        'name': worker_name,
+                        'scope': scope
+                    })
+                    row += 1
+            elif kind == 'scope':
+                records.append({'op': 'scope', 'worker_id': worker_id, 'scope': op[2]})
+
+        # Vector rows must be durable before any journal record points at them
+        if vectors:
+            with open(self._vectors_path(), 'ab') as f:
+                # Size is re-read under the writer lock: whole rows this instance does not
+                # know about mean the store was written behind its back, and are never cut
+                size = os.fstat(f.fileno()).st_size
+                if not self.total_rows <= size // self.stride <= self.total_rows + self.unjournaled_rows:
+                    raise RuntimeError(
+                        f"Vector file has {size // self.stride} rows, expected {self.total_rows}; "
+                        "the store was changed by another process, reload before writing"
+                    )
+                # Drop a torn row left by an interrupted append, and rows of a failed batch
+                f.truncate(self.total_rows * self.stride)
+                self.unjournaled_rows = len(vectors)
+                f.write(b''.join(vectors))
+                _fsync(f)
+        with open(self._journal_path(), 'a') as f:
+            # Past the last whole record this instance read there can only be a torn line,
+            # or records of its own failed batch
+            size = os.fstat(f.fileno()).st_size
+            if size > self.journal_offset:
+                with open(self._journal_path(), 'rb') as journal:
+                    journal.seek(self.journal_offset)
+                    if b'\n' in journal.read() and not self.journal_incomplete:
+                        raise RuntimeError("Journal has records this instance has not read; reload before writing")
+                f.truncate(self.journal_offset)
+            self.journal_incomplete = True
+            f.write(''.join(json.dumps(record) + '\n' for record in records))
+            _fsync(f)
+            journal_size = f.tell()
+        self.unjournaled_rows = 0
+        self.journal_incomplete = False
+
+        # Only account for the batch once it is on disk
+        self.total_rows = row
+        self.journal_offset = journal_size
+        for record in records:
+            if record['op'] == 'del':
+                self.live_count -= len(self.live_rows.pop(record['worker_id'], []))
+            elif record['op'] == 'add':
+                self.live_rows.setdefault(record['worker_id'], []).append(record['row'])
+                self.live_count += 1
+        self.signature = self._disk_signature()
+
+    def append(self, worker_id, worker_name, encoding, scope=None):
+        """Append one encoding row and its journal record"""
+        self.apply([('add', worker_id, worker_name, encoding, scope)])
+
+    def delete(self, worker_id):
+        """Tombstone every row of a worker"""
+        self.apply([('delete', worker_id)])
+
+    def replace(self, worker_id, worker_name, encoding, scope=None):
+        """Tombstone a worker's rows and append a new one"""
+        self.apply([('replace', worker_id, worker_name, encoding, scope)])
+
+    def set_scope(self, worker_id, scope):
+        self.apply([('scope', worker_id, scope)])
+
+    def needs_compaction(self):
+        return (
+            self.dead_rows >= self.compact_min_rows
+            and self.dead_rows >= self.total_rows * self.compact_ratio
+        )
+
+    def compact(self, encodings, worker_ids, worker_names, scopes):
+        """Write the given live rows as a new generation and switch CURRENT over to it"""
+        with self.lock, self._writing():
+            self._compact(encodings, worker_ids, worker_names, scopes)
+
+    def _compact(self, encodings, worker_ids, worker_names, scopes):
+        self._check_loaded()
+        previous = self.generation if self.exists() else None
+        generation = (previous or 0) + 1
+        count = len(worker_ids)
+
+        # New generation files are written under temporary names, fsynced and renamed;
+        # CURRENT only flips once both are complete on disk
+        vectors_tmp = self._vectors_path(generation) + '.tmp'
+        with open(vectors_tmp, 'wb') as f:
+            f.write(np.ascontiguousarray(encodings[:count], dtype=np.float32).tobytes())
+            _fsync(f)
+        journal_tmp = self._journal_path(generation) + '.tmp'
+        with open(journal_tmp, 'w') as f:
+            for row, (worker_id, worker_name, scope) in enumerate(zip(worker_ids, worker_names, scopes)):
+                f.write(json.dumps({
+                    'op': 'add',
+                    'row': row,
+                    'worker_id': int(worker_id),
+                    'name': worker_name,
+                    'scope': scope
+                }) + '\n')
+            _fsync(f)
+            journal_size = f.tell()
+        os.replace(vectors_tmp, self._vectors_path(generation))
+        os.replace(journal_tmp, self._journal_path(generation))
+
+        current_tmp = self._path('CURRENT.tmp')
+        with open(current_tmp, 'w') as f:
+            f.write(str(generation))
+            _fsync(f)
+        os.replace(current_tmp, self._path('CURRENT'))
+        _fsync_directory(self.directory)
+
+        self.generation = generation
+        self.total_rows = count
+        self.journal_offset = journal_size
+        self.unjournaled_rows = 0
+        self.journal_incomplete = False
+        self.live_rows = {}
+        for row, worker_id in enumerate(worker_ids):
+            self.live_rows.setdefault(int(worker_id), []).append(row)
+        self.live_count = count
+        self.signature = self._disk_signature()
+        self.loaded = True
+
+        if previous is not None:
+            for path in (self._vectors_path(previous), self._journal_path(previous)):
+                if os.path.exists(path):
+                    try:
+                        os.remove(path)
+                    except OSError as e:
+                        # Windows refuses while a gallery still maps the file (see load_mapped)
+                        logger.warning(f"Could not remove {path}: {e}")
+        logger.info(f"Compacted encoding store to generation {generation} ({count} rows)")
+
+    def stats(self):
+        return {
+            'generation': self.generation,
+            'rows': self.total_rows,
+            'dead_rows': self.dead_rows
+        }
@@ -0,0 +1,161 @@
+# Face Detectors
+# Pluggable face detection backends. A detector is named by a spec string, 'backend' or
+# 'backend:option' (hog:2, cnn:1, opencv_dnn:600), which is cheap to send to inference
+# processes; each process builds and caches the detector the first time a spec is used.
+# 'auto' picks the cheapest backend that reached a recall target in a benchmark_detectors.py
+# report, so kiosks (small, distant faces) and enrolment (large faces) can each get their own.
+import os
+import json
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DETECTOR = 'hog'
+DNN_MODEL = os.environ.get('FACE_DNN_MODEL', 'models/res10_300x300_ssd_iter_140000.caffemodel')  # OpenCV DNN weights
+DNN_CONFIG = os.environ.get('FACE_DNN_CONFIG', 'models/deploy.prototxt')  # OpenCV DNN network definition
+DNN_CONFIDENCE = float(os.environ.get('FACE_DNN_CONFIDENCE', 0.5))  # Least score kept by the OpenCV DNN detector
+
+
+class HogDetector:
+    """dlib HOG + linear SVM; the service's original detector. Option: times to upsample (default 1)"""
+
+    name = 'hog'
+    model = 'hog'
+
+    def __init__(self, option=None):
+        # Each upsample doubles the image, finding faces half the size at about 4x the cost
+        self.upsample = 1 if option is None else int(option)
+
+    def detect(self, image):
+        """(top, right, bottom, left) boxes of the faces in an RGB array"""
+        import face_recognition
+        return face_recognition.face_locations(image, self.upsample, self.model)
+
+    @property
+    def spec(self):
+        return f"{self.name}:{self.upsample}"
+
+
+class CnnDetector(HogDetector):
+    """dlib MMOD CNN on the CPU: finds turned and small faces HOG misses, at many times the cost"""
+
+    name = 'cnn'
+    model = 'cnn'
+
+
+class OpenCvDnnDetector:
+    """
+    OpenCV DNN SSD face detector (res10 300x300 by default, see FACE_DNN_MODEL/FACE_DNN_CONFIG).
+    Option: network input side (default 300); larger finds smaller faces
+    """
+
+    name = 'opencv_dnn'
+
+    def __init__(self, option=None):
+        import cv2
+        if not os.path.exists(DNN_MODEL):
+            raise FileNotFoundError(f"OpenCV DNN model {DNN_MODEL} not found, set FACE_DNN_MODEL")
+        self.cv2 = cv2
+        self.size = 300 if option is None else int(option)
+        self.net = cv2.dnn.readNet(DNN_MODEL, DNN_CONFIG if os.path.exists(DNN_CONFIG) else '')
+        # One net per process; forward() on it is not safe from several threads
+        self.lock = threading.Lock()
+
+    def detect(self, image):
+        height, width = image.shape[:2]
+        # The network was trained on BGR input with these channel means
+        blob = self.cv2.dnn.blobFromImage(
+            np.ascontiguousarray(image[:, :, ::-1]), 1.0, (self.size, self.size), (104.0, 177.0, 123.0)
+        )
+        with self.lock:
+            self.net.setInput(blob)
+            detections = self.net.forward()
+        boxes = []
+        for detection in detections.reshape(-1, 7):
+            if detection[2] < DNN_CONFIDENCE:
+                continue
+            left, top, right, bottom = detection[3:7] * (width, height, width, height)
+            box = (max(0, int(top)), min(width, int(right)), min(height, int(bottom)), max(0, int(left)))
+            if box[2] > box[0] and box[1] > box[3]:
+                boxes.append(box)
+        return boxes
+
+    @property
+    def spec(self):
+        return f"{self.name}:{self.size}"
+
+
+DETECTOR_BACKENDS = {
+    HogDetector.name: HogDetector,
+    CnnDetector.name: CnnDetector,
+    OpenCvDnnDetector.name: OpenCvDnnDetector,
+}
+
+_detectors = {}
+_detectors_lock = threading.Lock()
+
+
+def parse_spec(spec):
+    """(backend, option) of a detector spec; raises ValueError for unknown backends"""
+    backend, _, option = (spec or DEFAULT_DETECTOR).partition(':')
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(f"Unknown detector backend '{backend}'. Choose from: {', '.join(DETECTOR_BACKENDS)}, auto")
+    return backend, option or None
+
+
+def make_detector(spec):
+    """Create a detector from its spec"""
+    backend, option = parse_spec(spec)
+    return DETECTOR_BACKENDS[backend](option)
+
+
+def get_detector(spec=None):
+    """This process's detector for spec, created (and its model loaded) on first use"""
+    spec = spec or DEFAULT_DETECTOR
+    detector = _detectors.get(spec)
+    if detector is None:
+        with _detectors_lock:
+            detector = _detectors.get(spec)
+            if detector is None:
+                detector = _detectors[spec] = make_detector(spec)
+    return detector
+
+
+def select_detector(results, min_recall):
+    """
+    From benchmark rows (detector, recall, detect_ms_p50), the fastest whose recall reaches
+    min_recall; when none does, the one with the best recall. None if there are no usable rows
+    """
+    usable = [row for row in results if row.get('recall') is not None]
+    if not usable:
+        return None
+    passing = [row for row in usable if row['recall'] >= min_recall]
+    if passing:
+        return min(passing, key=lambda row: row['detect_ms_p50'])
+    return max(usable, key=lambda row: (row['recall'], -row['detect_ms_p50']))
+
+
+def resolve_detector(spec, report_path=None, min_recall=0.95):
+    """
+    Concrete spec for a configured detector. 'auto' reads the benchmark report and selects from
+    it, falling back to the default detector when the report is missing or empty
+    """
+    if spec != 'auto':
+        parse_spec(spec)
+        return spec or DEFAULT_DETECTOR
+    if not report_path or not os.path.exists(report_path):
+        logger.warning(f"Detector report {report_path} not found, using {DEFAULT_DETECTOR}; run benchmark_detectors.py")
+        return DEFAULT_DETECTOR
+    with open(report_path) as f:
+        report = json.load(f)
+    row = select_detector(report.get('results', []), min_recall)
+    if row is None:
+        logger.warning(f"Detector report {report_path} has no usable results, using {DEFAULT_DETECTOR}")
+        return DEFAULT_DETECTOR
+    if row['recall'] < min_recall:
+        logger.warning(f"No detector in {report_path} reaches recall {min_recall}, using the best: {row['detector']}")
+    logger.info(f"Selected detector {row['detector']} from {report_path} "
+                f"(recall {row['recall']:.3f}, detect p50 {row['detect_ms_p50']:.1f} ms)")
+    return row['detector']
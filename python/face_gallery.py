@@ -0,0 +1,581 @@
+# Face Gallery
+# In-memory store of registered face encodings kept as one contiguous float32 matrix,
+# or as int8 codes that scans read with the float32 rows left on disk for the re-rank
+import copy
+import tempfile
+import numpy as np
+from face_index import ExactIndex, SlotBuckets
+
+ENCODING_DIM = 128
+INITIAL_CAPACITY = 1024
+MAX_TEMPLATES = 5
+CENTROID_SHORTLIST = 16
+PRECISIONS = ('float32', 'int8')  # Element type of the matrix first-pass scans read
+RERANK_FACTOR = 4  # Shortlist widening for int8 scans, so quantization error cannot drop a true match
+SCAN_CHUNK = 4096  # Rows gathered per block in a scan; a block stays in cache while it is scored
+
+
+class MappedRows:
+    """
+    Append-only float32 rows read through memory maps instead of held in process memory:
+    the vector file of the store a gallery was loaded from (base), then the rows added
+    since, appended to an unlinked temporary file in directory. The page cache keeps the
+    rows in use and the kernel can drop them again. Rows never change once written, so
+    every version of a gallery shares one MappedRows; only the gallery's writer appends
+    """
+
+    def __init__(self, dim=ENCODING_DIM, base=None, directory=None):
+        self.dim = dim
+        self.base = np.zeros((0, dim), dtype=np.float32) if base is None else base
+        self.directory = directory
+        self.file = None
+        self.added = np.zeros((0, dim), dtype=np.float32)
+        self.count = 0
+
+    def __len__(self):
+        return len(self.base) + self.count
+
+    def append(self, rows):
+        """Write rows after the last one; returns their row numbers"""
+        rows = np.asarray(rows, dtype=np.float32).reshape(-1, self.dim)
+        end = self.count + len(rows)
+        if end > len(self.added):
+            self._grow(end)
+        self.added[self.count:end] = rows
+        numbers = np.arange(len(self.base) + self.count, len(self.base) + end)
+        self.count = end
+        return numbers
+
+    def _grow(self, min_rows):
+        if self.file is None:
+            self.file = tempfile.TemporaryFile(dir=self.directory)
+        capacity = max(INITIAL_CAPACITY, len(self.added))
+        while capacity < min_rows:
+            capacity *= 2
+        self.file.truncate(capacity * self.dim * 4)
+        # Readers holding the previous, shorter map still find every row they know of in it
+        self.added = np.memmap(self.file, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+
+    def __getitem__(self, numbers):
+        """Copy of the rows with the given numbers"""
+        numbers = np.asarray(numbers)
+        base, added = self.base, self.added
+        in_base = numbers < len(base)
+        rows = np.empty(numbers.shape + (self.dim,), dtype=np.float32)
+        rows[in_base] = base[numbers[in_base]]
+        rows[~in_base] = added[numbers[~in_base] - len(base)]
+        return rows
+
+
+class FaceGallery:
+    """
+    Preallocated, growable encoding matrix with precomputed norms and a parallel id array.
+    Worker ids map to their row slots and names through O(1) lookups, and rows are deleted
+    by moving the last row into the hole. Each worker has up to max_templates rows (templates)
+    and one centroid row; full scans rank centroids first and re-rank the templates of the
+    centroid_shortlist closest workers, or score every template when it is 0. Rows may carry a scope (project location id); each scope is kept as its
+    own shard of slots. version numbers the snapshots a service publishes (see copy()).
+
+    With precision 'int8', template scans score per-row scaled int8 codes, moving ~4x fewer
+    bytes, over a shortlist widened by rerank_factor; the shortlist is then re-ranked exactly
+    on the float32 rows, so returned distances are exact. Those rows are then not held in
+    memory: each slot keeps its row number in a MappedRows (in row_directory for new rows)
+    """
+
+    def __init__(self, capacity=INITIAL_CAPACITY, dim=ENCODING_DIM, index=None,
+                 max_templates=MAX_TEMPLATES, centroid_shortlist=CENTROID_SHORTLIST,
+                 precision='float32', rerank_factor=RERANK_FACTOR, row_directory=None):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown gallery precision '{precision}'. Choose from: {', '.join(PRECISIONS)}")
+        self.dim = dim
+        self.size = 0
+        self.sq_norms = np.zeros(capacity, dtype=np.float32)
+        self.precision = precision
+        self.rerank_factor = rerank_factor
+        if precision == 'float32':
+            # Scans and the re-rank read the encodings; nothing else holds the rows
+            self.encodings = np.zeros((capacity, dim), dtype=np.float32)
+            self.rows = self.row_numbers = self.codes = self.code_scales = None
+        else:
+            # Scans read the codes and their row scales; the re-rank reads row_numbers from rows
+            self.encodings = None
+            self.rows = MappedRows(dim, directory=row_directory)
+            self.row_numbers = np.zeros(capacity, dtype=np.int64)
+            self.codes = np.zeros((capacity, dim), dtype=np.int8)
+            self.code_scales = np.zeros(capacity, dtype=np.float32)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.names = {}
+        self.scopes = SlotBuckets()
+        self.templates = SlotBuckets()
+        self.max_templates = max_templates
+        self.most_templates = 0
+        self.centroid_shortlist = centroid_shortlist
+        self.worker_count = 0
+        self.centroids = np.zeros((INITIAL_CAPACITY, dim), dtype=np.float32)
+        self.centroid_sq_norms = np.zeros(INITIAL_CAPACITY, dtype=np.float32)
+        self.centroid_ids = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self.centroid_rows = {}
+        self.version = 0
+        self.index = index or ExactIndex()
+        self.index.attach(self)
+
+    def __len__(self):
+        return self.size
+
+    @classmethod
+    def from_lists(cls, encodings, names, scopes=None, index=None, **options):
+        """Build a gallery from the legacy parallel encodings/names lists"""
+        gallery = cls(capacity=max(INITIAL_CAPACITY, len(encodings)), **options)
+        scopes = scopes or [None] * len(encodings)
+        for encoding, name, scope in zip(encodings, names, scopes):
+            worker_id, worker_name = name.split('_', 1)
+            gallery.add(int(worker_id), worker_name, encoding, scope=scope)
+        # Attach the index once all rows are in so it trains a single time
+        if index is not None:
+            gallery.set_index(index)
+        return gallery
+
+    @classmethod
+    def from_arrays(cls, encodings, worker_ids, worker_names, scopes, index=None, rows=None, **options):
+        """
+        Bulk-build a gallery from a stored encoding matrix and its row metadata. With rows,
+        encodings is a store's mapped vector file and rows the row of each entry in it
+        (see EncodingStore.load_mapped); an int8 gallery re-ranks from that file in place
+        """
+        count = len(worker_ids)
+        gallery = cls(capacity=max(INITIAL_CAPACITY, count), **options)
+        if count:
+            if gallery.encodings is not None:
+                gallery.encodings[:count] = encodings[:count] if rows is None else encodings[rows]
+            elif rows is None:
+                gallery.row_numbers[:count] = gallery.rows.append(encodings[:count])
+            else:
+                gallery.rows.base = encodings
+                gallery.row_numbers[:count] = rows
+            # A block at a time, so mapped rows are never all read into memory at once
+            for start in range(0, count, SCAN_CHUNK):
+                block = slice(start, min(start + SCAN_CHUNK, count))
+                vectors = gallery.vectors(block)
+                gallery.sq_norms[block] = np.einsum('ij,ij->i', vectors, vectors)
+                gallery._set_codes(block, vectors)
+            gallery.ids[:count] = worker_ids
+            gallery.names = {int(worker_id): worker_name for worker_id, worker_name in zip(worker_ids, worker_names)}
+            gallery.size = count
+            for slot, (worker_id, scope) in enumerate(zip(worker_ids, scopes)):
+                gallery.templates.insert(slot, int(worker_id))
+                if scope is not None:
+                    gallery.scopes.insert(slot, scope)
+            gallery._build_centroids()
+        if index is not None:
+            gallery.set_index(index)
+        else:
+            gallery.index.attach(gallery)
+        return gallery
+
+    def to_arrays(self):
+        """Export (encodings, worker_ids, worker_names, scopes) for the live rows"""
+        n = self.size
+        return (
+            self.vectors(slice(0, n)),
+            self.ids[:n].tolist(),
+            [self.names[worker_id] for worker_id in self.ids[:n].tolist()],
+            [self.scopes.bucket_of(slot) for slot in range(n)]
+        )
+
+    def vectors(self, slots):
+        """float32 rows at slots (an index array or a slice), read from the mapped rows at int8"""
+        if self.encodings is not None:
+            return self.encodings[slots]
+        return self.rows[self.row_numbers[slots]]
+
+    def _set_codes(self, slots, rows):
+        """Store the int8 form of float32 rows at slots"""
+        if self.codes is None:
+            return
+        # Symmetric per-row scale: the largest component maps to +-127
+        scales = np.abs(rows).max(axis=-1) / 127
+        scales = np.where(scales > 0, scales, 1).astype(np.float32)
+        self.codes[slots] = np.rint(rows / scales[..., None])
+        self.code_scales[slots] = scales
+
+    def _build_centroids(self):
+        """Compute every worker's centroid in one pass over the rows"""
+        n = self.size
+        worker_ids, inverse, counts = np.unique(self.ids[:n], return_inverse=True, return_counts=True)
+        order = np.argsort(inverse, kind='stable')
+        sums = np.zeros((len(worker_ids), self.dim), dtype=np.float32)
+        # Rows grouped by worker, summed a block at a time; a worker may straddle two blocks
+        for start in range(0, n, SCAN_CHUNK):
+            slots = order[start:start + SCAN_CHUNK]
+            owners = inverse[slots]
+            starts = np.flatnonzero(np.concatenate(([True], owners[1:] != owners[:-1])))
+            sums[owners[starts]] += np.add.reduceat(self.vectors(slots), starts, axis=0)
+        self._grow_centroids(len(worker_ids))
+        count = len(worker_ids)
+        self.centroids[:count] = sums / counts[:, None]
+        self.centroid_sq_norms[:count] = np.einsum('ij,ij->i', self.centroids[:count], self.centroids[:count])
+        self.centroid_ids[:count] = worker_ids
+        self.centroid_rows = {int(worker_id): row for row, worker_id in enumerate(worker_ids)}
+        self.worker_count = count
+        self.most_templates = int(counts.max())
+
+    def _grow_centroids(self, min_capacity):
+        capacity = len(self.centroid_ids)
+        if capacity >= min_capacity:
+            return
+        while capacity < min_capacity:
+            capacity *= 2
+        count = self.worker_count
+        centroids = np.zeros((capacity, self.dim), dtype=np.float32)
+        centroids[:count] = self.centroids[:count]
+        sq_norms = np.zeros(capacity, dtype=np.float32)
+        sq_norms[:count] = self.centroid_sq_norms[:count]
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:count] = self.centroid_ids[:count]
+        self.centroids, self.centroid_sq_norms, self.centroid_ids = centroids, sq_norms, ids
+
+    def _refresh_centroid(self, worker_id):
+        """Recompute one worker's centroid from its templates, dropping it when none are left"""
+        slots = self.templates.get(worker_id)
+        row = self.centroid_rows.get(worker_id)
+        if len(slots) == 0:
+            if row is None:
+                return
+            # Swap the last centroid into the freed row
+            last = self.worker_count - 1
+            if row != last:
+                self.centroids[row] = self.centroids[last]
+                self.centroid_sq_norms[row] = self.centroid_sq_norms[last]
+                self.centroid_ids[row] = self.centroid_ids[last]
+                self.centroid_rows[int(self.centroid_ids[row])] = row
+            self.centroids[last] = 0
+            self.centroid_sq_norms[last] = 0
+            del self.centroid_rows[worker_id]
+            self.worker_count = last
+            return
+        if row is None:
+            self._grow_centroids(self.worker_count + 1)
+            row = self.centroid_rows[worker_id] = self.worker_count
+            self.centroid_ids[row] = worker_id
+            self.worker_count += 1
+        centroid = self.vectors(slots).mean(axis=0)
+        self.centroids[row] = centroid
+        self.centroid_sq_norms[row] = np.dot(centroid, centroid)
+        self.most_templates = max(self.most_templates, len(slots))
+
+    def copy(self):
+        """
+        Independent next version of this gallery, for changes that must not be seen by
+        readers of this one until the copy is published in its place
+        """
+        clone = copy.copy(self)
+        rows = {name: self.size for name in ('encodings', 'sq_norms', 'ids', 'row_numbers', 'codes', 'code_scales')}
+        rows.update(dict.fromkeys(('centroids', 'centroid_sq_norms', 'centroid_ids'), self.worker_count))
+        for name, count in rows.items():
+            value = getattr(self, name)
+            if value is not None:
+                # Only the used rows are copied; the spare capacity stays untouched zero pages
+                value_copy = np.zeros(value.shape, dtype=value.dtype)
+                value_copy[:count] = value[:count]
+                value = value_copy
+            setattr(clone, name, value)
+        clone.names = dict(self.names)
+        clone.centroid_rows = dict(self.centroid_rows)
+        clone.scopes = self.scopes.copy()
+        clone.templates = self.templates.copy()
+        clone.index = self.index.copy(clone)
+        return clone
+
+    def apply(self, ops):
+        """
+        Replay store operations: ('add', worker_id, worker_name, encoding, scope),
+        ('delete', worker_id) and ('scope', worker_id, scope), as EncodingStore.read_delta returns them
+        """
+        for op in ops:
+            kind, worker_id = op[0], int(op[1])
+            if kind == 'add':
+                _, _, worker_name, encoding, scope = op
+                self.add(worker_id, worker_name, encoding, scope=scope)
+            elif kind == 'delete':
+                self.remove_worker(worker_id)
+            elif kind == 'scope':
+                self.set_scope(worker_id, op[2])
+
+    def set_index(self, index):
+        """Swap the search backend, rebuilding it over the current rows"""
+        self.index = index
+        self.index.attach(self)
+
+    def _grow(self, min_capacity):
+        """Double the capacity of the backing arrays until min_capacity fits"""
+        capacity = len(self.ids)
+        while capacity < min_capacity:
+            capacity *= 2
+
+        for name in ('encodings', 'sq_norms', 'ids', 'row_numbers', 'codes', 'code_scales'):
+            value = getattr(self, name)
+            if value is not None:
+                grown = np.zeros((capacity,) + value.shape[1:], dtype=value.dtype)
+                grown[:self.size] = value[:self.size]
+                setattr(self, name, grown)
+
+    def add(self, worker_id, worker_name, encoding, scope=None):
+        """Append an encoding for a worker and return its row slot"""
+        if self.size == len(self.ids):
+            self._grow(self.size + 1)
+
+        slot = self.size
+        row = np.asarray(encoding, dtype=np.float32)
+        if self.encodings is not None:
+            self.encodings[slot] = row
+        else:
+            self.row_numbers[slot] = self.rows.append(row)[0]
+        self.sq_norms[slot] = np.dot(row, row)
+        self._set_codes(slot, row)
+        self.ids[slot] = worker_id
+        self.names[int(worker_id)] = worker_name
+        self.size += 1
+        self.templates.insert(slot, int(worker_id))
+        if scope is not None:
+            self.scopes.insert(slot, scope)
+        self._refresh_centroid(int(worker_id))
+        self.index.on_add(slot)
+        return slot
+
+    def add_template(self, worker_id, worker_name, encoding, scope=None):
+        """
+        Add a template for a worker, keeping at most max_templates. Past the limit the template
+        farthest from the worker's centroid is evicted, which may be the new one.
+        Returns (slot of the new template or None if it was evicted, whether a template was evicted)
+        """
+        slot = self.add(worker_id, worker_name, encoding, scope=scope)
+        slots = self.templates.get(int(worker_id))
+        if len(slots) <= self.max_templates:
+            return slot, False
+
+        centroid = self.centroids[self.centroid_rows[int(worker_id)]]
+        outlier = int(slots[np.argmax(np.linalg.norm(self.vectors(slots) - centroid, axis=1))])
+        self._remove_slot(outlier)
+        self._refresh_centroid(int(worker_id))
+        if outlier == slot:
+            return None, True
+        # The new template was the last row, so it now fills the evicted slot
+        return outlier, True
+
+    def templates_of(self, worker_id):
+        """Row slots holding a worker's templates"""
+        return self.templates.get(int(worker_id)).copy()
+
+    def template_count(self, worker_id):
+        return self.templates.size(int(worker_id))
+
+    def name_of(self, worker_id):
+        return self.names.get(int(worker_id))
+
+    def worker_ids(self):
+        """Registered worker ids, one per worker"""
+        return self.centroid_ids[:self.worker_count].tolist()
+
+    def has_worker(self, worker_id):
+        return int(worker_id) in self.centroid_rows
+
+    def scope_of(self, slot):
+        return self.scopes.bucket_of(slot)
+
+    def set_scope(self, worker_id, scope):
+        """Move every encoding of a worker into another scope (None clears it). Returns rows moved"""
+        slots = self.templates.get(int(worker_id))
+        for slot in slots:
+            self.scopes.remove(slot)
+            if scope is not None:
+                self.scopes.insert(slot, scope)
+        return len(slots)
+
+    def scope_sizes(self):
+        return {scope: self.scopes.size(scope) for scope in self.scopes.keys()}
+
+    def remove_worker(self, worker_id):
+        """Remove every template of a worker. Returns the number of rows removed"""
+        worker_id = int(worker_id)
+        slots = self.templates_of(worker_id)
+        # Highest slot first, so the row swapped in is never one still to be removed
+        for slot in sorted(slots.tolist(), reverse=True):
+            self._remove_slot(slot)
+        if len(slots):
+            self._refresh_centroid(worker_id)
+            del self.names[worker_id]
+        return len(slots)
+
+    def _remove_slot(self, slot):
+        """Delete one row by moving the last row into its place"""
+        last = self.size - 1
+        self.scopes.remove(slot)
+        self.templates.remove(slot)
+        self.index.on_remove([slot])
+        if slot != last:
+            if self.encodings is not None:
+                self.encodings[slot] = self.encodings[last]
+            else:
+                self.row_numbers[slot] = self.row_numbers[last]
+                self.codes[slot] = self.codes[last]
+                self.code_scales[slot] = self.code_scales[last]
+            self.sq_norms[slot] = self.sq_norms[last]
+            self.ids[slot] = self.ids[last]
+            self.scopes.relabel([last], [slot])
+            self.templates.relabel([last], [slot])
+            self.index.on_relabel([last], [slot])
+
+        # Zero the freed row so stale data never leaks into a search
+        if self.encodings is not None:
+            self.encodings[last] = 0
+        else:
+            self.codes[last] = 0
+        self.sq_norms[last] = 0
+        self.size = last
+
+    def search(self, probe, k=1, scope=None):
+        """
+        Find the k closest workers to probe, optionally only within one scope shard.
+        Returns (slots, distances, margins): each worker's closest template, its distance and
+        margins[i], the distance gap to the next worker
+        """
+        if self.size == 0:
+            return self._empty_result()
+
+        probe = np.asarray(probe, dtype=np.float32)
+
+        # A scope shard is small enough to scan directly; otherwise the index backend
+        # narrows the scan to a candidate subset, or the centroid pass picks the workers
+        if scope is not None:
+            pool = self.scopes.get(scope)
+        else:
+            pool = self.index.candidates(probe)
+            if pool is None:
+                pool = self._centroid_candidates(probe[None, :], k)[0] if self.centroid_shortlist else np.arange(self.size)
+        return self._rank_workers(probe, pool, k)
+
+    def search_batch(self, probes, k=1, scope=None):
+        """
+        search() for many probes at once, scoring them all with one matrix-matrix product.
+        Returns a list of (slots, distances, margins), one per probe
+        """
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, self.dim)
+        if self.size == 0 or len(probes) == 0:
+            return [self._empty_result() for _ in probes]
+
+        if scope is not None:
+            return self._rank_pool(probes, self.scopes.get(scope), k)
+
+        if not isinstance(self.index, ExactIndex):
+            # Approximate backends pick different candidates per probe
+            return [self.search(probe, k) for probe in probes]
+
+        if not self.centroid_shortlist:
+            return self._rank_pool(probes, np.arange(self.size), k)
+        pools = self._centroid_candidates(probes, k)
+        return [self._rank_workers(probe, pool, k) for probe, pool in zip(probes, pools)]
+
+    def _rank_pool(self, probes, pool, k):
+        """_rank_workers over one pool of slots for many probes, with one scan"""
+        if len(pool) == 0:
+            return [self._empty_result() for _ in probes]
+        sq_dist = self.sq_norms[pool][None, :] - 2.0 * self._scan(probes, pool)
+        take = self._first_pass_size(k, len(pool))
+        if take < len(pool):
+            shortlists = pool[np.argpartition(sq_dist, take - 1, axis=1)[:, :take]]
+        else:
+            shortlists = [pool] * len(probes)
+        return [self._rank_shortlist(probe, shortlist, k) for probe, shortlist in zip(probes, shortlists)]
+
+    def _empty_result(self):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+
+    def _shortlist_size(self, k, total):
+        # Each of the k + 1 best workers has its closest template among the first
+        # (k + 1) * most_templates rows by distance
+        return min((k + 1) * max(1, self.most_templates), total)
+
+    def _first_pass_size(self, k, total):
+        """Rows kept from an approximate (int8) scan for the exact re-rank"""
+        take = self._shortlist_size(k, total)
+        if self.codes is not None:
+            take = min(take * self.rerank_factor, total)
+        return take
+
+    def _scan(self, probes, pool):
+        """
+        probes @ encodings[pool].T, from the int8 codes when the gallery has them. Rows are
+        gathered a block at a time, so each gathered block is scored while it is still in cache
+        """
+        dots = np.empty((len(probes), len(pool)), dtype=np.float32)
+        for start in range(0, len(pool), SCAN_CHUNK):
+            block = pool[start:start + SCAN_CHUNK]
+            if self.codes is None:
+                scores = probes @ self.encodings[block].T
+            else:
+                scores = probes @ self.codes[block].astype(np.float32).T
+                scores *= self.code_scales[block]
+            dots[:, start:start + len(block)] = scores
+        return dots
+
+    def memory_stats(self):
+        """
+        Bytes of the live rows: the exact float32 rows (in memory, or mapped from disk at int8)
+        and the matrix template scans read
+        """
+        exact = self.size * self.dim * 4
+        scan = exact if self.codes is None else self.size * (self.dim + self.code_scales.itemsize)
+        return {
+            'precision': self.precision,
+            'rows': self.size,
+            'exact_bytes': exact,
+            'exact_rows': 'memory' if self.encodings is not None else 'mapped',
+            'scan_bytes': scan,
+            'scan_bytes_per_row': scan / self.size if self.size else 0
+        }
+
+    def _centroid_candidates(self, probes, k):
+        """Template slots of the workers whose centroids are closest to each probe"""
+        count = self.worker_count
+        centroids = self.centroids[:count]
+        # ||c - p||^2 up to the per-probe constant ||p||^2, as one matrix-matrix product
+        sq_dist = self.centroid_sq_norms[:count][None, :] - 2.0 * (probes @ centroids.T)
+        take = min(max(k + 1, self.centroid_shortlist), count)
+        if take < count:
+            nearest = np.argpartition(sq_dist, take - 1, axis=1)[:, :take]
+        else:
+            nearest = np.tile(np.arange(count), (len(probes), 1))
+        return [
+            np.concatenate([self.templates.get(int(worker_id)) for worker_id in self.centroid_ids[rows]])
+            for rows in nearest
+        ]
+
+    def _rank_workers(self, probe, pool, k):
+        """Shortlist pool by the norm expansion, then rank workers exactly"""
+        total = len(pool)
+        if total == 0:
+            return self._empty_result()
+
+        # ||e - p||^2 = ||e||^2 + ||p||^2 - 2 e.p, with e.p as a blocked matrix-vector product
+        sq_dist = self.sq_norms[pool] - 2.0 * self._scan(probe[None, :], pool)[0]
+        take = self._first_pass_size(k, total)
+        if take < total:
+            pool = pool[np.argpartition(sq_dist, take - 1)[:take]]
+        return self._rank_shortlist(probe, pool, k)
+
+    def _rank_shortlist(self, probe, shortlist, k):
+        """Exact distances over shortlisted slots, keeping each worker's closest template"""
+        # Recompute the shortlisted distances exactly to avoid cancellation error
+        distances = np.linalg.norm(self.vectors(shortlist) - probe, axis=1)
+        order = np.argsort(distances)
+        top, distances = shortlist[order], distances[order]
+
+        _, first = np.unique(self.ids[top], return_index=True)
+        first.sort()
+        # One extra worker so the last returned one still has a margin
+        top, distances = top[first][:k + 1], distances[first][:k + 1]
+
+        margins = np.full(len(top), np.inf, dtype=np.float32)
+        margins[:-1] = distances[1:] - distances[:-1]
+
+        return top[:k], distances[:k], margins[:k]
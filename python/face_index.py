@@ -0,0 +1,296 @@
+# Face Index
+# Pluggable candidate-selection backends for FaceGallery searches
+import copy
+import numpy as np
+
+ASSIGN_CHUNK = 4096  # Rows assigned to their nearest centroid per block when training
+
+
+class SlotBuckets:
+    """
+    Disjoint groups of gallery slots with O(1) insert, remove and relabel.
+    Each slot belongs to at most one bucket; buckets are keyed by any hashable.
+    Copies share their member and per-slot arrays until one side changes them (copy-on-write).
+    """
+
+    def __init__(self):
+        self.members = {}
+        self.sizes = {}
+        # Per slot: its bucket, and its position in that bucket's member array (-1 for none)
+        self.slot_bucket = np.full(16, None, dtype=object)
+        self.slot_pos = np.full(16, -1, dtype=np.int64)
+        # Buckets whose member array no copy shares, and whether the per-slot arrays are shared
+        self.owned = set()
+        self.slots_owned = True
+
+    def __contains__(self, bucket):
+        return self.sizes.get(bucket, 0) > 0
+
+    def keys(self):
+        return [bucket for bucket, size in self.sizes.items() if size > 0]
+
+    def size(self, bucket):
+        return self.sizes.get(bucket, 0)
+
+    def _position(self, slot):
+        return self.slot_pos[slot] if slot < len(self.slot_pos) else -1
+
+    def bucket_of(self, slot):
+        slot = int(slot)
+        return self.slot_bucket[slot] if self._position(slot) >= 0 else None
+
+    def get(self, bucket):
+        """Slots currently in a bucket, as a view"""
+        if bucket not in self.members:
+            return np.zeros(0, dtype=np.int64)
+        return self.members[bucket][:self.sizes[bucket]]
+
+    def insert(self, slot, bucket):
+        slot = int(slot)
+        members = self.members.get(bucket)
+        if members is None:
+            members = self.members[bucket] = np.zeros(16, dtype=np.int64)
+            self.sizes[bucket] = 0
+            self.owned.add(bucket)
+        else:
+            members = self._own(bucket)
+        size = self.sizes[bucket]
+        if size == len(members):
+            grown = np.zeros(len(members) * 2, dtype=np.int64)
+            grown[:size] = members
+            self.members[bucket] = members = grown
+        members[size] = slot
+        self.sizes[bucket] = size + 1
+        self._own_slots(slot)
+        self.slot_bucket[slot] = bucket
+        self.slot_pos[slot] = size
+
+    def remove(self, slot):
+        slot = int(slot)
+        pos = self._position(slot)
+        if pos < 0:
+            return
+        bucket = self.slot_bucket[slot]
+        self._own_slots(slot)
+        self.slot_bucket[slot] = None
+        self.slot_pos[slot] = -1
+        last = self.sizes[bucket] - 1
+        members = self._own(bucket)
+        # Swap the removed member with the bucket's last one
+        if pos != last:
+            moved = int(members[last])
+            members[pos] = moved
+            self.slot_pos[moved] = pos
+        self.sizes[bucket] = last
+
+    def relabel(self, old_slots, new_slots):
+        """Follow rows the gallery moved from old_slots to new_slots"""
+        self._own_slots(max(map(int, new_slots), default=0))
+        entries = []
+        for old in map(int, old_slots):
+            pos = self._position(old)
+            entries.append((self.slot_bucket[old], pos) if pos >= 0 else (None, -1))
+            if pos >= 0:
+                self.slot_bucket[old] = None
+                self.slot_pos[old] = -1
+        for new, (bucket, pos) in zip(new_slots, entries):
+            if pos < 0:
+                continue
+            new = int(new)
+            self._own(bucket)[pos] = new
+            self.slot_bucket[new] = bucket
+            self.slot_pos[new] = pos
+
+    def _own(self, bucket):
+        """Member array of a bucket that is safe to change, copying it if a copy shares it"""
+        if bucket not in self.owned:
+            self.members[bucket] = self.members[bucket].copy()
+            self.owned.add(bucket)
+        return self.members[bucket]
+
+    def _own_slots(self, slot):
+        """Make the per-slot arrays safe to change and long enough to hold slot"""
+        capacity = len(self.slot_pos)
+        if slot < capacity and self.slots_owned:
+            return
+        while capacity <= slot:
+            capacity *= 2
+        slot_bucket = np.full(capacity, None, dtype=object)
+        slot_bucket[:len(self.slot_bucket)] = self.slot_bucket
+        slot_pos = np.full(capacity, -1, dtype=np.int64)
+        slot_pos[:len(self.slot_pos)] = self.slot_pos
+        self.slot_bucket, self.slot_pos = slot_bucket, slot_pos
+        self.slots_owned = True
+
+    def copy(self):
+        clone = SlotBuckets()
+        clone.members = dict(self.members)
+        clone.sizes = dict(self.sizes)
+        clone.slot_bucket = self.slot_bucket
+        clone.slot_pos = self.slot_pos
+        clone.slots_owned = False
+        # Both sides now share every array
+        self.owned = set()
+        self.slots_owned = False
+        return clone
+
+
+class ExactIndex:
+    """
+    Brute-force backend: the index narrows nothing. Whole-gallery searches still score only
+    the templates of the workers the gallery's centroid pass picks, unless its
+    centroid_shortlist is 0 (see FaceGallery)
+    """
+
+    name = 'exact'
+
+    def attach(self, gallery):
+        self.gallery = gallery
+
+    def copy(self, gallery):
+        """Same index state for a copy of the gallery"""
+        clone = ExactIndex()
+        clone.gallery = gallery
+        return clone
+
+    def on_add(self, slot):
+        pass
+
+    def on_remove(self, slots):
+        pass
+
+    def on_relabel(self, old_slots, new_slots):
+        pass
+
+    def candidates(self, probe):
+        """Return the slots to score for probe, or None to scan the whole gallery"""
+        return None
+
+    def stats(self):
+        return {'backend': self.name}
+
+
+class IVFIndex:
+    """
+    Inverted-file backend: rows are bucketed under the nearest of nlist k-means centroids
+    and a search only scores the rows of the nprobe closest buckets.
+    Raising nprobe trades latency for recall; nprobe == nlist is an exact scan.
+    """
+
+    name = 'ivf'
+
+    def __init__(self, nlist=None, nprobe=8, min_train_size=1024, retrain_growth=4.0,
+                 kmeans_iters=10, train_sample_per_list=64, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.retrain_growth = retrain_growth
+        self.kmeans_iters = kmeans_iters
+        self.train_sample_per_list = train_sample_per_list
+        self.seed = seed
+        self.centroids = None
+        self.trained_size = 0
+        self.buckets = SlotBuckets()
+
+    def attach(self, gallery):
+        self.gallery = gallery
+        self.centroids = None
+        self.trained_size = 0
+        self.buckets = SlotBuckets()
+        if len(gallery) >= self.min_train_size:
+            self.train()
+
+    def copy(self, gallery):
+        """Same centroids and buckets for a copy of the gallery, without retraining"""
+        clone = copy.copy(self)
+        clone.gallery = gallery
+        clone.buckets = self.buckets.copy()
+        return clone
+
+    def _nearest_centroids(self, vectors, count=1):
+        """Squared-distance ranking of centroids for a batch of vectors"""
+        sq_dist = (
+            np.einsum('ij,ij->i', self.centroids, self.centroids)[None, :]
+            - 2.0 * (vectors @ self.centroids.T)
+        )
+        if count == 1:
+            return np.argmin(sq_dist, axis=1)[:, None]
+        count = min(count, len(self.centroids))
+        return np.argpartition(sq_dist, count - 1, axis=1)[:, :count]
+
+    def train(self):
+        """Run k-means over the current gallery and rebuild every bucket"""
+        n = len(self.gallery)
+        nlist = self.nlist or max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+
+        # k-means runs on a sample; the full gallery is only assigned once at the end
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(n, nlist * self.train_sample_per_list)
+        sample = self.gallery.vectors(rng.choice(n, sample_size, replace=False))
+        centroids = sample[:nlist].copy()
+        for _ in range(self.kmeans_iters):
+            self.centroids = centroids
+            assign = self._nearest_centroids(sample)[:, 0]
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+
+        self.centroids = centroids
+        self.trained_size = n
+        self.buckets = SlotBuckets()
+        # A block at a time: rows may be mapped from disk, and the distances are rows x nlist
+        assign = np.concatenate([
+            self._nearest_centroids(self.gallery.vectors(slice(start, min(start + ASSIGN_CHUNK, n))))[:, 0]
+            for start in range(0, n, ASSIGN_CHUNK)
+        ])
+        for slot, bucket in enumerate(assign):
+            self.buckets.insert(slot, int(bucket))
+
+    def on_add(self, slot):
+        if self.centroids is None:
+            if len(self.gallery) >= self.min_train_size:
+                self.train()
+            return
+        if len(self.gallery) >= self.trained_size * self.retrain_growth:
+            self.train()
+            return
+        vector = self.gallery.vectors([slot])
+        self.buckets.insert(slot, int(self._nearest_centroids(vector)[0, 0]))
+
+    def on_remove(self, slots):
+        for slot in slots:
+            self.buckets.remove(slot)
+
+    def on_relabel(self, old_slots, new_slots):
+        self.buckets.relabel(old_slots, new_slots)
+
+    def candidates(self, probe):
+        if self.centroids is None or self.nprobe >= len(self.centroids):
+            return None
+        nearest = self._nearest_centroids(probe[None, :], self.nprobe)[0]
+        return np.concatenate([self.buckets.get(int(bucket)) for bucket in nearest])
+
+    def stats(self):
+        return {
+            'backend': self.name,
+            'trained': self.centroids is not None,
+            'nlist': 0 if self.centroids is None else len(self.centroids),
+            'nprobe': self.nprobe,
+            'trained_size': self.trained_size
+        }
+
+
+INDEX_BACKENDS = {
+    ExactIndex.name: ExactIndex,
+    IVFIndex.name: IVFIndex,
+}
+
+
+def make_index(backend='exact', **params):
+    """Create an index backend by name"""
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown index backend '{backend}'. Choose from: {', '.join(INDEX_BACKENDS)}")
+    return INDEX_BACKENDS[backend](**params)
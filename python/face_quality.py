@@ -0,0 +1,122 @@
+# Face Quality
+# Cheap checks of a detected face before it is encoded: size, brightness and sharpness.
+# Tiny, dark or blurry faces encode to unreliable embeddings that end in a low-confidence
+# miss and a kiosk retry; rejecting them with a reason code skips the encoder instead.
+import threading
+import numpy as np
+from PIL import Image
+
+CHIP_SIZE = 150  # Side of the aligned face chip dlib's encoder reads; sharpness is measured at this size
+MESSAGES = {
+    'face_too_small': 'Face is too small, please move closer to the camera',
+    'too_dark': 'Image is too dark, please improve the lighting',
+    'too_bright': 'Image is too bright, please avoid direct light on the face',
+    'blurry': 'Image is blurry, please hold still',
+}
+REASONS = tuple(MESSAGES)
+
+
+class FrameRejected(Exception):
+    """Raised instead of encoding a face that fails the quality checks"""
+
+    def __init__(self, reason, scores, timings=None):
+        # All arguments go to Exception so the error pickles back from inference processes
+        super().__init__(reason, scores, timings)
+        self.reason = reason
+        self.scores = scores
+        self.timings = timings or {}
+
+    @property
+    def message(self):
+        return MESSAGES[self.reason]
+
+
+def face_scores(image, box):
+    """
+    Size (shorter box side, px), brightness (mean grey level, 0-255) and sharpness (variance of
+    the Laplacian) of one (top, right, bottom, left) face box on an RGB array
+    """
+    top, right, bottom, left = box
+    size = min(bottom - top, right - left)
+    if size <= 0:
+        return {'face_px': 0, 'brightness': 0.0, 'sharpness': 0.0}
+    chip = Image.fromarray(np.ascontiguousarray(image[top:bottom, left:right])).convert('L')
+    chip = np.asarray(chip.resize((CHIP_SIZE, CHIP_SIZE), Image.BILINEAR), dtype=np.float32)
+    laplacian = (
+        4 * chip[1:-1, 1:-1]
+        - chip[:-2, 1:-1] - chip[2:, 1:-1] - chip[1:-1, :-2] - chip[1:-1, 2:]
+    )
+    return {
+        'face_px': int(size),
+        'brightness': round(float(chip.mean()), 1),
+        'sharpness': round(float(laplacian.var()), 1)
+    }
+
+
+def assess(scores, thresholds):
+    """Reason code of the first check the scores fail, or None"""
+    if scores['face_px'] < thresholds['min_face_px']:
+        return 'face_too_small'
+    if scores['brightness'] < thresholds['min_brightness']:
+        return 'too_dark'
+    if scores['brightness'] > thresholds['max_brightness']:
+        return 'too_bright'
+    if scores['sharpness'] < thresholds['min_sharpness']:
+        return 'blurry'
+    return None
+
+
+def check_faces(image, face_locations, thresholds):
+    """Raise FrameRejected for the first face that fails the checks"""
+    for box in face_locations:
+        scores = face_scores(image, box)
+        reason = assess(scores, thresholds)
+        if reason is not None:
+            raise FrameRejected(reason, scores)
+
+
+class QualityGate:
+    def __init__(self, min_face_px=50, min_brightness=40, max_brightness=220, min_sharpness=20):
+        """
+        Thresholds for the checks (0, 0, 255 and 0 switch each one off), plus counters of the
+        faces checked and rejected. Encoder time saved is estimated from the running average
+        encode time of the faces that passed
+        """
+        self.thresholds = {
+            'min_face_px': min_face_px,
+            'min_brightness': min_brightness,
+            'max_brightness': max_brightness,
+            'min_sharpness': min_sharpness
+        }
+        self.lock = threading.Lock()
+        self.checked = 0
+        self.rejected = dict.fromkeys(REASONS, 0)
+        self.encode_ms_average = None
+        self.encode_ms_saved = 0.0
+
+    def record(self, reason, timings):
+        """Count one checked frame; returns the encoder milliseconds a rejection saved"""
+        with self.lock:
+            self.checked += 1
+            if reason is not None:
+                self.rejected[reason] += 1
+                saved = self.encode_ms_average or 0.0
+                self.encode_ms_saved += saved
+                return saved
+            encode_ms = timings.get('encode_ms')
+            if encode_ms is not None:
+                if self.encode_ms_average is None:
+                    self.encode_ms_average = encode_ms
+                else:
+                    self.encode_ms_average += 0.05 * (encode_ms - self.encode_ms_average)
+            return 0.0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'thresholds': dict(self.thresholds),
+                'checked': self.checked,
+                'rejected': dict(self.rejected),
+                'encode_ms_average': None if self.encode_ms_average is None else round(self.encode_ms_average, 2),
+                'encode_ms_saved': round(self.encode_ms_saved, 1)
+            }
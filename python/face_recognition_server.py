@@ -2,26 +2,49 @@
 # Requirements: opencv-python, face-recognition, flask, flask-cors, pillow, numpy
 import os
 import sys
+import hmac
 import json
-import base64
 import pickle
-import numpy as np
+import tarfile
+import time
+import atexit
+import signal
+import threading
+import multiprocessing
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from io import BytesIO
-from PIL import Image
+import numpy as np
 import logging
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
+from face_gallery import FaceGallery
+from face_index import make_index
+from face_detectors import resolve_detector
+from face_quality import FrameRejected, QualityGate
+from encoding_store import EncodingStore, StoreLocked
+from persistence import PersistenceWorker
+from inference_pool import InferencePool, PoolBusy, detect_and_encode, warm_up
+from image_io import decode_frame, iter_multipart_frames
+from recognition_cache import RecognitionCache
+from match_batcher import MatchBatcher
+from metrics import Registry
+from profiler import RequestProfiler, fold_stacks
+from readiness import Readiness
+from stream_tracker import StreamSessions
+from bulk_enroll import MODES as BULK_MODES, enroll, iter_directory, iter_tarball, merge_arrays, parse_workers
 
 # Setup logging before imports that might fail
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Try to import face_recognition, with proper error handling
-try:
-    import face_recognition
-except ImportError as e:
+# Check face_recognition is installed; importing it loads the dlib models, which happens in the
+# background after start (see FaceRecognitionService.load) so the process binds at once
+if importlib.util.find_spec('face_recognition') is None:
     logger.error("ERROR: Could not import face_recognition library")
-    logger.error(f"Error details: {e}")
+    logger.error("Error details: No module named 'face_recognition'")
     logger.error("\nTroubleshooting steps:")
     logger.error("1. Make sure dlib is installed correctly: run simple_install.bat")
     logger.error("2. Check if Python version is compatible (3.8-3.10 recommended)")
@@ -38,244 +61,1094 @@ CORS(app)
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
-ENCODINGS_FILE = 'face_encodings.pkl'
+ENCODINGS_FILE = 'face_encodings.pkl'  # Legacy pickle, imported into the store on first start
+ENCODINGS_DIR = os.environ.get('FACE_STORE_DIR', 'face_store')
+PERSIST_WINDOW_MS = int(os.environ.get('FACE_PERSIST_WINDOW_MS', 50))  # Changes within this window share one fsync
+DURABLE_WAIT_TIMEOUT = float(os.environ.get('FACE_DURABLE_WAIT_TIMEOUT', 10))  # Seconds a wait_durable request may block
+WRITER_LOCK_TIMEOUT = float(os.environ.get('FACE_WRITER_LOCK_TIMEOUT', 30))  # Seconds to wait for the store's writer lock (a reloading worker's predecessor)
 CONFIDENCE_THRESHOLD = 0.6  # Lower is more strict
+RECOGNITION_TOP_K = int(os.environ.get('RECOGNITION_TOP_K', 3))  # Candidates returned per match
+INDEX_BACKEND = os.environ.get('FACE_INDEX_BACKEND', 'exact')  # 'exact' or 'ivf'
+INDEX_NPROBE = int(os.environ.get('FACE_INDEX_NPROBE', 8))  # IVF buckets scanned per search, higher is more exact
+INDEX_NLIST = int(os.environ.get('FACE_INDEX_NLIST', 0)) or None  # IVF bucket count, 0 sizes it from the gallery
+SCOPE_FALLBACK = os.environ.get('FACE_SCOPE_FALLBACK', 'true').lower() == 'true'  # Retry globally when a location search misses
+
+BATCH_MAX_IMAGES = int(os.environ.get('FACE_BATCH_MAX_IMAGES', 16))  # Images accepted per /recognize_batch call
+BATCH_WORKERS = int(os.environ.get('FACE_BATCH_WORKERS', os.cpu_count() or 4))  # Threads decoding/detecting a batch
+WORKER_PROCESSES = int(os.environ.get('FACE_WORKER_PROCESSES', 0))  # Inference processes, 0 runs detection in-process
+WORKER_QUEUE = int(os.environ.get('FACE_WORKER_QUEUE', 0)) or None  # Max in-flight inference requests, default 2 per process
+WORKER_TIMEOUT = float(os.environ.get('FACE_WORKER_TIMEOUT', 30))  # Seconds to wait for an inference process
+RETRY_AFTER_SECONDS = int(os.environ.get('FACE_RETRY_AFTER', 1))  # Retry-After sent with 503 when the pool is full
+MAX_UPLOAD_MB = int(os.environ.get('FACE_MAX_UPLOAD_MB', 32))  # Largest request body accepted
+RAW_IMAGE_TYPES = ('image/jpeg', 'image/png', 'application/octet-stream')  # Bodies decoded as a bare image
+CACHE_SIZE = int(os.environ.get('FACE_CACHE_SIZE', 1024))  # Entries per recognition cache level, 0 disables caching
+CACHE_TTL = float(os.environ.get('FACE_CACHE_TTL', 30))  # Seconds a cached recognition result is reused
+CACHE_QUANTUM = float(os.environ.get('FACE_CACHE_QUANTUM', 0.005))  # Encoding quantization step for the embedding cache
+MAX_TEMPLATES = int(os.environ.get('FACE_MAX_TEMPLATES', 5))  # Encodings kept per worker
+CENTROID_SHORTLIST = int(os.environ.get('FACE_CENTROID_SHORTLIST', 16))  # Workers re-ranked by template after the centroid pass, 0 scores every template
+TEMPLATE_MIN_DISTANCE = float(os.environ.get('FACE_TEMPLATE_MIN_DISTANCE', 0.06))  # Closer new templates add nothing and are skipped
+GALLERY_PRECISION = os.environ.get('FACE_GALLERY_PRECISION', 'float32')  # Matrix template scans read: float32 or int8 (exact re-rank from float32 rows mapped from disk)
+GALLERY_RERANK = int(os.environ.get('FACE_GALLERY_RERANK', 4))  # Shortlist widening for the int8 first pass
+GALLERY_OPTIONS = {
+    'max_templates': MAX_TEMPLATES,
+    'centroid_shortlist': CENTROID_SHORTLIST,
+    'precision': GALLERY_PRECISION,
+    'rerank_factor': GALLERY_RERANK,
+    'row_directory': ENCODINGS_DIR
+}
+READ_ONLY = os.environ.get('FACE_READ_ONLY', 'false').lower() == 'true'  # Follow another instance's store instead of writing it
+SYNC_INTERVAL = float(os.environ.get('FACE_SYNC_INTERVAL', 2 if READ_ONLY else 0))  # Seconds between polls of the store for the writer's changes, 0 disables
+DETECT_MAX_SIDE = int(os.environ.get('FACE_DETECT_MAX_SIDE', 960))  # Longest side faces are detected at, 0 detects at full size
+DETECTOR = os.environ.get('FACE_DETECTOR', 'hog')  # Detector for recognition and streams: hog[:upsample], cnn[:upsample], opencv_dnn[:size] or auto
+ENROL_DETECTOR = os.environ.get('FACE_ENROL_DETECTOR', DETECTOR)  # Detector for register, add_template and bulk enrolment
+DETECTOR_REPORT = os.environ.get('FACE_DETECTOR_REPORT', 'detectors_kiosk.json')  # benchmark_detectors.py report 'auto' selects from for recognition
+ENROL_DETECTOR_REPORT = os.environ.get('FACE_ENROL_DETECTOR_REPORT', 'detectors_enrol.json')  # Same, for enrolment photos
+DETECTOR_MIN_RECALL = float(os.environ.get('FACE_DETECTOR_MIN_RECALL', 0.95))  # 'auto' picks the fastest detector with at least this recall
+FACE_IMAGES_DIR = os.environ.get('FACE_IMAGES_DIR', os.path.join('..', 'backend', 'face_images'))  # Captures /bulk_register imports when no archive is sent
+BULK_PROCESSES = int(os.environ.get('FACE_BULK_PROCESSES', 0)) or None  # Encoding processes for /bulk_register, default one per CPU
+BULK_MAX_UPLOAD_MB = int(os.environ.get('FACE_BULK_MAX_UPLOAD_MB', 2048))  # Largest archive accepted by /bulk_register
+PROFILE_ENABLED = os.environ.get('FACE_PROFILE', 'false').lower() == 'true'  # Sample slow requests from startup
+PROFILE_THRESHOLD_MS = float(os.environ.get('FACE_PROFILE_THRESHOLD_MS', 1000))  # Requests at least this slow are kept
+PROFILE_INTERVAL_MS = float(os.environ.get('FACE_PROFILE_INTERVAL_MS', 10))  # Time between stack samples
+PROFILE_BUFFER = int(os.environ.get('FACE_PROFILE_BUFFER', 100))  # Slow requests kept, oldest dropped first
+WARMUP = os.environ.get('FACE_WARMUP', 'true').lower() == 'true'  # Run a dummy inference before reporting ready
+STREAM_MAX_FPS = float(os.environ.get('FACE_STREAM_MAX_FPS', 10))  # Frames processed per second per kiosk stream, the rest are skipped
+STREAM_TRACK_TTL = float(os.environ.get('FACE_STREAM_TRACK_TTL', 1.0))  # Seconds a face may go unseen before its track ends
+STREAM_HALF_LIFE = float(os.environ.get('FACE_STREAM_HALF_LIFE', 2.0))  # Seconds for a track's confidence to halve; it is re-encoded below the threshold
+STREAM_RETRY_MS = float(os.environ.get('FACE_STREAM_RETRY_MS', 300))  # Least time between encodings of one track
+STREAM_REPEAT_SECONDS = float(os.environ.get('FACE_STREAM_REPEAT_SECONDS', 30))  # A worker is reported again at a kiosk only after this long
+STREAM_SESSION_TTL = float(os.environ.get('FACE_STREAM_SESSION_TTL', 300))  # Idle kiosk sessions are dropped after this long
+MATCH_BATCH_WINDOW_MS = float(os.environ.get('FACE_MATCH_BATCH_WINDOW_MS', 2))  # Longest wait for concurrent /recognize probes to share a search, 0 disables
+MATCH_BATCH_MAX = int(os.environ.get('FACE_MATCH_BATCH_MAX', 32))  # Most probes searched together
+MATCH_BATCH_THREADS = int(os.environ.get('FACE_MATCH_BATCH_THREADS', 4))  # Batches (of different locations) searched at once
+QUALITY_GATE = os.environ.get('FACE_QUALITY_GATE', 'true').lower() == 'true'  # Check faces before encoding in /recognize, /register and /add_template
+QUALITY_MIN_FACE_PX = int(os.environ.get('FACE_QUALITY_MIN_FACE_PX', 50))  # Shorter side of the face box, in pixels of the uploaded image
+QUALITY_MIN_BRIGHTNESS = float(os.environ.get('FACE_QUALITY_MIN_BRIGHTNESS', 40))  # Mean grey level of the face, 0-255
+QUALITY_MAX_BRIGHTNESS = float(os.environ.get('FACE_QUALITY_MAX_BRIGHTNESS', 220))
+QUALITY_MIN_SHARPNESS = float(os.environ.get('FACE_QUALITY_MIN_SHARPNESS', 20))  # Laplacian variance of the face at the encoder's 150 px, lower is blurrier
+ADMIN_TOKEN = os.environ.get('FACE_ADMIN_TOKEN', '')  # Required in X-Admin-Token by /admin endpoints, which are off while unset
+ARCHIVE_TYPES = ('application/x-tar', 'application/gzip', 'application/x-gzip', 'application/x-xz', 'application/x-bzip2')  # Bodies read as a tarball
 
 # Ensure upload folder exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Oversized bodies are refused with 413 before they are read
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024
+
+# Shared pool for per-image work inside batch requests (PIL and dlib release the GIL for most of it)
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='batch')
+
+# Metrics served at /metrics; scrape-time gauges over the service are registered after it is created
+metrics = Registry()
+REQUESTS = metrics.counter('face_http_requests_total', 'HTTP requests by endpoint and status code', ('endpoint', 'status'))
+REQUEST_ERRORS = metrics.counter('face_http_request_errors_total', 'HTTP requests answered with a 5xx status', ('endpoint',))
+REQUEST_SECONDS = metrics.histogram('face_http_request_duration_seconds', 'HTTP request latency', ('endpoint',))
+STAGE_SECONDS = metrics.histogram('face_stage_duration_seconds', 'Time spent in each pipeline stage', ('stage',))
+MATCH_CONFIDENCE = metrics.histogram(
+    'face_match_confidence', 'Best-candidate confidence of each gallery search', ('result',),
+    buckets=(0.3, 0.4, 0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95)
+)
+QUALITY_REJECTIONS = metrics.counter('face_quality_rejections_total', 'Faces refused by the quality gate before encoding', ('reason',))
+ENCODER_SECONDS_SAVED = metrics.counter(
+    'face_quality_encoder_seconds_saved_total', 'Estimated encoder time skipped for faces the quality gate refused'
+)
+MATCH_BATCH_SIZE = metrics.histogram(
+    'face_match_batch_size', 'Probes searched together by the /recognize match batcher', (),
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+EDIT_BATCH_SIZE = metrics.histogram(
+    'face_gallery_edit_batch_size', 'Gallery changes applied to one copy of the gallery', (),
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+# Opt-in stack sampling of slow requests, switched at runtime by /admin/profiler or SIGUSR2
+profiler = RequestProfiler(PROFILE_THRESHOLD_MS, PROFILE_INTERVAL_MS, PROFILE_BUFFER)
+
+# Frame timing keys and the stage they are reported as
+TIMING_STAGES = {
+    'base64_ms': 'base64_decode',
+    'decode_ms': 'image_decode',
+    'detect_ms': 'face_locations',
+    'quality_ms': 'quality_check',
+    'encode_ms': 'face_encodings',
+}
+
+def observe_timings(timings):
+    """Record a frame's stage timings (milliseconds) in the stage histogram"""
+    for key, ms in timings.items():
+        stage = TIMING_STAGES.get(key)
+        if stage is not None:
+            STAGE_SECONDS.observe(ms / 1000, stage=stage)
+
+def build_index():
+    """Create the configured gallery search backend"""
+    if INDEX_BACKEND == 'ivf':
+        return make_index('ivf', nlist=INDEX_NLIST, nprobe=INDEX_NPROBE)
+    return make_index(INDEX_BACKEND)
+
+class GalleryEdit:
+    """One queued gallery change; see FaceRecognitionService.edit"""
+    __slots__ = ('change', 'result', 'ops', 'sequence', 'error', 'done')
+
+    def __init__(self, change):
+        self.change = change
+        self.result = None
+        self.ops = ()
+        self.sequence = None
+        self.error = None
+        self.done = False
+
 class FaceRecognitionService:
     def __init__(self):
-        self.known_face_encodings = []
-        self.known_face_names = []
-        self.load_encodings()
+        # Nothing slow happens here: load() brings in the models and the gallery, either in the
+        # background from start() or up front in a pre-forking master (see gunicorn.conf.py)
+        self.pool = None
+        self.persistence = None
+        self.batcher = None
+        self.store = EncodingStore(ENCODINGS_DIR)
+        # Readers take self.gallery once per request and never lock. Writers change a copy
+        # and publish it by replacing the reference (see edit), so a request never sees
+        # a half-applied change
+        self.gallery = FaceGallery(index=build_index(), **GALLERY_OPTIONS)
+        # Gallery changes and their persistence sequence numbers are taken under one lock
+        self.write_lock = threading.RLock()
+        # Changes waiting for the write lock; the next writer to get it applies them all
+        self.edit_queue = []
+        self.edit_lock = threading.Lock()
+        self.stopping = threading.Event()
+        # One bulk import at a time; it rebuilds the whole gallery
+        self.bulk_lock = threading.Lock()
+        self.cache = RecognitionCache(CACHE_SIZE, CACHE_TTL, CACHE_QUANTUM)
+        self.quality = QualityGate(
+            QUALITY_MIN_FACE_PX, QUALITY_MIN_BRIGHTNESS, QUALITY_MAX_BRIGHTNESS, QUALITY_MIN_SHARPNESS
+        ) if QUALITY_GATE else None
+        self.readiness = Readiness(('models', 'gallery', 'warmup'))
+        # Kiosk frames and enrolment photos can use different detectors (see face_detectors)
+        self.detector = resolve_detector(DETECTOR, DETECTOR_REPORT, DETECTOR_MIN_RECALL)
+        self.enrol_detector = resolve_detector(ENROL_DETECTOR, ENROL_DETECTOR_REPORT, DETECTOR_MIN_RECALL)
+        self.detectors = tuple(dict.fromkeys((self.detector, self.enrol_detector)))
+        self.streams = StreamSessions(
+            ttl=STREAM_SESSION_TTL,
+            min_interval=1 / STREAM_MAX_FPS if STREAM_MAX_FPS > 0 else 0,
+            track_ttl=STREAM_TRACK_TTL,
+            half_life=STREAM_HALF_LIFE,
+            threshold=CONFIDENCE_THRESHOLD,
+            retry_interval=STREAM_RETRY_MS / 1000,
+            repeat_after=STREAM_REPEAT_SECONDS
+        )
+    
+    def start(self):
+        """Start the inference pool and persistence worker in the serving process, and load in the background"""
+        # Worker processes are forked first, before this service starts any threads
+        # or takes the store's writer lock
+        if WORKER_PROCESSES > 0:
+            if hasattr(os, 'fork'):
+                self.pool = InferencePool(
+                    WORKER_PROCESSES,
+                    max_queue=WORKER_QUEUE,
+                    retry_after=RETRY_AFTER_SECONDS,
+                    timeout=WORKER_TIMEOUT,
+                    warm_up_inference=WARMUP,
+                    detectors=self.detectors
+                )
+            else:
+                logger.warning("FACE_WORKER_PROCESSES needs fork(); running detection in-process")
+        
+        # Only one process may write the store: an append from a second writer would be
+        # placed by its own, stale row count. Raises StoreLocked if another process holds it.
+        # Read-only replicas never take it and only follow the store
+        if not READ_ONLY:
+            try:
+                self.store.acquire_writer(WRITER_LOCK_TIMEOUT)
+            except StoreLocked:
+                if self.pool is not None:
+                    self.pool.shutdown()
+                raise
+        
+        # A preloaded gallery may be older than the store if workers were re-forked later
+        if self.readiness.ready and self.store.is_stale():
+            logger.info("Encoding store changed since preload, catching up")
+            self.refresh()
+        
+        if not READ_ONLY:
+            self.persistence = PersistenceWorker(
+                self.store,
+                self.snapshot,
+                flush_window=PERSIST_WINDOW_MS / 1000,
+                on_flush=lambda kind, changes, seconds: STAGE_SECONDS.observe(seconds, stage=f'persist_{kind}')
+            )
+        
+        # Concurrent /recognize probes are searched together (see match_batcher)
+        if MATCH_BATCH_WINDOW_MS > 0:
+            self.batcher = MatchBatcher(
+                self.match_encodings,
+                window=MATCH_BATCH_WINDOW_MS / 1000,
+                max_batch=MATCH_BATCH_MAX,
+                timeout=WORKER_TIMEOUT,
+                on_batch=lambda size, seconds: MATCH_BATCH_SIZE.observe(size),
+                threads=MATCH_BATCH_THREADS
+            )
+        
+        if not self.readiness.ready:
+            threading.Thread(target=self._load_in_background, name='service-load', daemon=True).start()
+        elif SYNC_INTERVAL > 0:
+            threading.Thread(target=self._follow_store, name='store-sync', daemon=True).start()
+    
+    def load(self):
+        """Load the models and the gallery and warm up, recording each stage in readiness"""
+        with self.readiness.stage('models'):
+            if self.pool is not None:
+                # The pool's processes load the models (and run the warm-up) themselves
+                self.pool.wait_ready()
+            else:
+                warm_up(detectors=self.detectors)
+        with self.readiness.stage('gallery'):
+            self.load_encodings()
+        if WARMUP and self.pool is None:
+            with self.readiness.stage('warmup'):
+                warm_up(run_inference=True, detectors=self.detectors)
+        else:
+            self.readiness.skip('warmup')
+        self.readiness.mark_ready()
+    
+    def _load_in_background(self):
+        try:
+            self.load()
+        except Exception as e:
+            logger.error(f"Error loading face recognition service: {e}")
+            return
+        if SYNC_INTERVAL > 0:
+            self._follow_store()
+    
+    def stop(self):
+        """Flush pending gallery changes and stop the worker processes"""
+        self.stopping.set()
+        if self.persistence is not None:
+            self.persistence.stop()
+        self.store.release_writer()
+        if self.batcher is not None:
+            self.batcher.stop()
+        if self.pool is not None:
+            self.pool.shutdown()
     
     def load_encodings(self):
-        """Load face encodings from pickle file"""
+        """
+        Load face encodings by mapping the encoding store. Errors propagate: serving an empty
+        gallery in place of one that failed to load would report ready with nobody registered
+        """
         try:
-            if os.path.exists(ENCODINGS_FILE):
-                with open(ENCODINGS_FILE, 'rb') as f:
-                    data = pickle.load(f)
-                    self.known_face_encodings = data.get('encodings', [])
-                    self.known_face_names = data.get('names', [])
-                logger.info(f"Loaded {len(self.known_face_encodings)} face encodings")
-            else:
-                logger.info("No existing encodings file found")
+            if not READ_ONLY and not self.store.exists() and os.path.exists(ENCODINGS_FILE):
+                self.import_legacy_encodings()
+            
+            vectors, rows, worker_ids, worker_names, scopes = self.store.load_mapped()
+            self.publish(FaceGallery.from_arrays(
+                vectors, worker_ids, worker_names, scopes,
+                index=build_index(),
+                rows=rows,
+                **GALLERY_OPTIONS
+            ))
+            logger.info(f"Loaded {len(self.gallery)} face encodings")
         except Exception as e:
             logger.error(f"Error loading encodings: {e}")
-            self.known_face_encodings = []
-            self.known_face_names = []
+            raise
 
-    def save_encodings(self):
-        """Save face encodings to pickle file"""
+    def edit(self, change):
+        """
+        Apply change(gallery) -> (result, persistence ops) to a copy of the served gallery,
+        queue the ops and publish the copy, so readers only ever see whole changes.
+        Returns (result, sequence of the change's last op or None); an exception from
+        change drops that change alone and is raised here.
+        The copy costs about 0.5 ms per 1,000 templates under the write lock (about 110 ms
+        at 200,000), so writers that queue up behind it share the next one: whichever gets
+        the lock first applies every queued change, and the others find theirs done
+        """
+        request = GalleryEdit(change)
+        with self.edit_lock:
+            self.edit_queue.append(request)
+        with self.write_lock:
+            if not request.done:
+                self._apply_edits()
+        if request.error is not None:
+            raise request.error
+        return request.result, request.sequence
+
+    def _apply_edits(self):
+        """Apply the queued changes to one copy of the gallery. Call under the write lock"""
+        with self.edit_lock:
+            batch, self.edit_queue = self.edit_queue, []
         try:
-            data = {
-                'encodings': self.known_face_encodings,
-                'names': self.known_face_names
-            }
-            with open(ENCODINGS_FILE, 'wb') as f:
-                pickle.dump(data, f)
-            logger.info("Encodings saved successfully")
-            return True
+            gallery = self.gallery.copy()
+            applied = []
+            for request in batch:
+                try:
+                    request.result, request.ops = request.change(gallery)
+                    applied.append(request)
+                except Exception as e:
+                    request.error = e
+                    # The change may have stopped half-way: start again from the served
+                    # gallery with the ones that worked, which only touch the gallery
+                    gallery = self.gallery.copy()
+                    for done in applied:
+                        done.change(gallery)
+            if applied:
+                for request in applied:
+                    for op in request.ops:
+                        request.sequence = self.persistence.submit(op)
+                self.publish(gallery)
+                EDIT_BATCH_SIZE.observe(len(applied))
         except Exception as e:
-            logger.error(f"Error saving encodings: {e}")
-            return False
+            for request in batch:
+                if request.error is None:
+                    request.error = e
+        finally:
+            for request in batch:
+                request.done = True
+
+    def publish(self, gallery):
+        """Serve gallery from now on, as the next version. Call under the write lock (or before serving)"""
+        gallery.version = self.gallery.version + 1
+        self.gallery = gallery
+        self.cache.invalidate()
+
+    def refresh(self, full=False):
+        """
+        Catch up with changes another process wrote to the encoding store. Only the journal
+        records since the last load are applied, to a copy of the gallery that is then
+        published; a compacted store, or full, reloads everything.
+        Returns the number of changes applied, or None after a full reload
+        """
+        if self.persistence is not None:
+            self.persistence.flush(timeout=DURABLE_WAIT_TIMEOUT)
+        with self.write_lock:
+            ops = None if full else self.store.read_delta()
+            if ops is None:
+                self.load_encodings()
+                return None
+            if ops:
+                self.edit(lambda gallery: (gallery.apply(ops), ()))
+                logger.info(f"Applied {len(ops)} store change(s), gallery version {self.gallery.version}")
+            return len(ops)
+
+    def _follow_store(self):
+        """Poll the store for changes made by other replicas"""
+        while not self.stopping.wait(SYNC_INTERVAL):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error following encoding store: {e}")
+
+    def import_legacy_encodings(self):
+        """Convert the old pickle file into the encoding store"""
+        with open(ENCODINGS_FILE, 'rb') as f:
+            data = pickle.load(f)
+        gallery = FaceGallery.from_lists(
+            data.get('encodings', []),
+            data.get('names', []),
+            scopes=data.get('scopes')
+        )
+        self.store.compact(*gallery.to_arrays())
+        logger.info(f"Imported {len(gallery)} face encodings from {ENCODINGS_FILE}")
+
+    def snapshot(self):
+        """Copy of the gallery rows together with the last persistence sequence they include"""
+        with self.write_lock:
+            encodings, worker_ids, worker_names, scopes = self.gallery.to_arrays()
+            return self.persistence.sequence, (encodings.copy(), worker_ids, worker_names, scopes)
 
-    def process_image_from_base64(self, base64_string):
-        """Convert base64 string to PIL Image"""
+    def process_image(self, source):
+        """Decode a base64 string or binary image stream into a Frame, or None if unreadable"""
         try:
-            # Remove data URL prefix if present
-            if ',' in base64_string:
-                base64_string = base64_string.split(',')[1]
-            
-            # Decode base64
-            image_data = base64.b64decode(base64_string)
-            image = Image.open(BytesIO(image_data))
-            
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Convert PIL to numpy array
-            return np.array(image)
+            frame = decode_frame(source, DETECT_MAX_SIDE)
+            observe_timings(frame.timings)
+            return frame
         except Exception as e:
-            logger.error(f"Error processing base64 image: {e}")
+            logger.error(f"Error processing image: {e}")
             return None
     
-    def register_face(self, image_array, worker_id, worker_name):
-        """Register a new face"""
+    def detect_and_encode(self, frame, max_faces=None, locations=None, enrol=False, quality=False):
+        """
+        Face locations and encodings, computed on the inference pool when one is configured.
+        max_faces=0 only detects; locations encodes known boxes without detecting. enrol uses
+        the enrolment detector instead of the recognition one. quality runs the quality gate
+        (when enabled) before encoding, raising FrameRejected for a face that fails it
+        """
+        detector = self.enrol_detector if enrol else self.detector
+        thresholds = self.quality.thresholds if quality and self.quality is not None else None
+        try:
+            if self.pool is not None:
+                face_locations, face_encodings, timings = self.pool.detect_and_encode(
+                    frame.array, max_faces, frame.detection, locations, detector, thresholds
+                )
+            else:
+                face_locations, face_encodings, timings = detect_and_encode(
+                    frame.array, max_faces, frame.detection, locations, detector, thresholds
+                )
+        except FrameRejected as e:
+            observe_timings(e.timings)
+            frame.timings.update(e.timings)
+            frame.rejection = {'reason': e.reason, **e.scores}
+            QUALITY_REJECTIONS.inc(reason=e.reason)
+            ENCODER_SECONDS_SAVED.inc(self.quality.record(e.reason, e.timings) / 1000)
+            logger.info(f"Quality gate rejected face: {frame.rejection}")
+            raise
+        if thresholds is not None and face_encodings:
+            self.quality.record(None, timings)
+        observe_timings(timings)
+        frame.timings.update(timings)
+        if locations is None:
+            frame.faces = len(face_locations)
+        return face_locations, face_encodings
+
+    def register_face(self, frame, worker_id, worker_name, location_id=None, append=False):
+        """
+        Register a new face, replacing the worker's templates unless append is set.
+        Returns (success, message, persistence sequence)
+        """
         try:
             # Find face locations and encodings
-            face_locations = face_recognition.face_locations(image_array)
+            face_locations, face_encodings = self.detect_and_encode(frame, max_faces=1, enrol=True, quality=True)
             
             if not face_locations:
-                return False, "No face detected in image"
+                return False, "No face detected in image", None
             
             if len(face_locations) > 1:
-                return False, "Multiple faces detected. Please ensure only one face is visible"
-            
-            # Get face encoding
-            face_encodings = face_recognition.face_encodings(image_array, face_locations)
+                return False, "Multiple faces detected. Please ensure only one face is visible", None
             
             if face_encodings:
                 face_encoding = face_encodings[0]
                 
-                # Check if this worker already exists and remove old encoding
-                worker_key = f"{worker_id}_{worker_name}"
-
-                # Remove existing encoding if exists
-                indices_to_remove = []
-                for i, name in enumerate(self.known_face_names):
-                    if name.startswith(f"{worker_id}_"):
-                        indices_to_remove.append(i)
-
-                # Remove in reverse order to maintain indices
-                for i in reversed(indices_to_remove):
-                    del self.known_face_encodings[i]
-                    del self.known_face_names[i]
-                    logger.info(f"Removed old encoding for worker ID {worker_id}")
-
-                # Add new encoding
-                self.known_face_encodings.append(face_encoding)
-                self.known_face_names.append(worker_key)
-
-                if indices_to_remove:
+                if append and self.gallery.has_worker(worker_id):
+                    return self._add_template(worker_id, worker_name, face_encoding, location_id, create=True)
+                
+                def replace(gallery):
+                    # Replace any existing encoding for this worker with the new one
+                    removed = gallery.remove_worker(worker_id)
+                    gallery.add(int(worker_id), worker_name, face_encoding, scope=location_id)
+                    return removed, [('replace', worker_id, worker_name, face_encoding, location_id)]
+                
+                removed, sequence = self.edit(replace)
+
+                if removed:
                     logger.info(f"Updated face encoding for {worker_name} (ID: {worker_id})")
                 else:
                     logger.info(f"Added new face encoding for {worker_name} (ID: {worker_id})")
 
-                # Save to file
-                if self.save_encodings():
-                    return True, f"Face registered successfully for {worker_name}"
-                else:
-                    return False, "Failed to save face encoding"
+                return True, f"Face registered successfully for {worker_name}", sequence
 
-            return False, "Could not generate face encoding"
+            return False, "Could not generate face encoding", None
             
+        except FrameRejected as e:
+            return False, e.message, None
+        except PoolBusy:
+            raise
         except Exception as e:
             logger.error(f"Error registering face: {e}")
-            return False, f"Error processing face: {str(e)}"
+            return False, f"Error processing face: {str(e)}", None
     
-    def recognize_face(self, image_array):
-        """Recognize face in image"""
+    def add_template(self, frame, worker_id):
+        """
+        Add a template for a registered worker from a confirmed clock-in photo.
+        Returns (success, message, persistence sequence)
+        """
         try:
-            if not self.known_face_encodings:
-                return False, None, 0, "No registered faces in database"
-            
-            # Find face locations and encodings
-            face_locations = face_recognition.face_locations(image_array)
-            
-            if not face_locations:
-                return False, None, 0, "No face detected in image"
-            
-            if len(face_locations) > 1:
-                return False, None, 0, "Multiple faces detected. Please ensure only one face is visible"
+            # One version of the gallery for every check below, whatever is published meanwhile
+            gallery = self.gallery
+            slots = gallery.templates_of(worker_id)
+            if len(slots) == 0:
+                return False, f"Worker with ID {worker_id} not found", None
             
-            # Get face encodings for the detected face
-            face_encodings = face_recognition.face_encodings(image_array, face_locations)
+            face_locations, face_encodings = self.detect_and_encode(frame, max_faces=1, enrol=True, quality=True)
+            if len(face_locations) != 1 or not face_encodings:
+                return False, "Image must contain exactly one face", None
+            face_encoding = np.asarray(face_encodings[0], dtype=np.float32)
             
-            if not face_encodings:
-                return False, None, 0, "Could not generate face encoding"
+            # Only learn from photos that really are this worker, and skip near-duplicates
+            distances = np.linalg.norm(gallery.vectors(slots) - face_encoding, axis=1)
+            if 1 - float(distances.min()) < CONFIDENCE_THRESHOLD:
+                return False, "Face does not match the worker's registered templates", None
+            if float(distances.min()) < TEMPLATE_MIN_DISTANCE:
+                return True, "Template already covered by an existing one", None
             
-            face_encoding = face_encodings[0]
+            return self._add_template(worker_id, gallery.name_of(worker_id), face_encoding, gallery.scope_of(slots[0]))
             
-            # Compare with known faces
-            face_distances = face_recognition.face_distance(self.known_face_encodings, face_encoding)
-            best_match_index = np.argmin(face_distances)
-            
-            # Get confidence (inverse of distance)
-            confidence = 1 - face_distances[best_match_index]
+        except FrameRejected as e:
+            return False, e.message, None
+        except PoolBusy:
+            raise
+        except Exception as e:
+            logger.error(f"Error adding template: {e}")
+            return False, f"Error processing face: {str(e)}", None
+    
+    def _add_template(self, worker_id, worker_name, face_encoding, location_id=None, create=False):
+        """
+        Add one template under the write lock; without a location_id it joins the worker's current scope.
+        Unless create is set (registration), a worker deleted since the caller looked is not brought back
+        """
+        def add(gallery):
+            if not create and not gallery.has_worker(worker_id):
+                return None, ()
+            scope = location_id
+            if scope is None and gallery.has_worker(worker_id):
+                scope = gallery.scope_of(gallery.templates_of(worker_id)[0])
+            slot, evicted = gallery.add_template(int(worker_id), worker_name, face_encoding, scope=scope)
+            count = gallery.template_count(worker_id)
+            if slot is None:
+                return (None, count), ()
+            if evicted:
+                # Rewrite the worker's remaining templates in one go
+                templates = gallery.vectors(gallery.templates_of(worker_id))
+                return (slot, count), [('templates', worker_id, worker_name, templates, scope)]
+            return (slot, count), [('add', worker_id, worker_name, face_encoding, scope)]
+        
+        added, sequence = self.edit(add)
+        if added is None:
+            return False, f"Worker with ID {worker_id} not found", None
+        slot, count = added
+        
+        if slot is None:
+            return True, f"New template was the outlier and was not kept ({count} templates)", sequence
+        logger.info(f"Added face template for {worker_name} (ID: {worker_id}), {count} templates")
+        return True, f"Template added for {worker_name} ({count} templates)", sequence
+
+    def recognize_face(self, frame, location_id=None):
+        """Recognize face in image, searching the location's workers first when location_id is given"""
+        try:
+            if len(self.gallery) == 0:
+                return False, None, 0, "No registered faces in database"
             
-            if confidence >= CONFIDENCE_THRESHOLD:
-                worker_key = self.known_face_names[best_match_index]
-                worker_id, worker_name = worker_key.split('_', 1)
-                
-                return True, {
-                    'worker_id': int(worker_id),
-                    'worker_name': worker_name,
-                    'confidence': float(confidence)
-                }, confidence * 100, "Face recognized successfully"
-            else:
-                return False, None, confidence * 100, "Face not recognized with sufficient confidence"
+            # A retried frame skips detection, encoding and search
+            generation = self.cache.generation
+            frame_key = self.cache.frame_key(frame, location_id)
+            result = self.cache.get('frame', frame_key)
+            if result is None:
+                result = self._recognize_frame(frame, location_id, generation)
+                self.cache.put('frame', frame_key, result, generation)
+            return result
                 
+        except FrameRejected as e:
+            return False, None, 0, e.message
+        except PoolBusy:
+            raise
         except Exception as e:
             logger.error(f"Error recognizing face: {e}")
             return False, None, 0, f"Error processing face: {str(e)}"
 
-    def delete_worker(self, worker_id):
-        """Delete a worker's face encoding"""
-        try:
-            worker_id_str = str(worker_id)
-            indices_to_remove = []
+    def _recognize_frame(self, frame, location_id, generation):
+        # The batcher waits briefly for probes of requests still detecting, like this one
+        with self.batcher.upstream() if self.batcher is not None else nullcontext():
+            return self._detect_and_match(frame, location_id, generation)
+
+    def _detect_and_match(self, frame, location_id, generation):
+        # Find face locations and encodings
+        face_locations, face_encodings = self.detect_and_encode(frame, max_faces=1, quality=True)
+        
+        if not face_locations:
+            return False, None, 0, "No face detected in image"
+        
+        if len(face_locations) > 1:
+            return False, None, 0, "Multiple faces detected. Please ensure only one face is visible"
+        
+        if not face_encodings:
+            return False, None, 0, "Could not generate face encoding"
+        
+        face_encoding = face_encodings[0]
+        
+        # A nearly identical frame encodes to the same quantized embedding and skips the search
+        embedding_key = self.cache.embedding_key(face_encoding, location_id)
+        result = self.cache.get('embedding', embedding_key)
+        if result is None:
+            started = time.perf_counter()
+            if self.batcher is not None:
+                result = self.batcher.match(face_encoding, location_id)
+            else:
+                result = self.match_encoding(face_encoding, location_id)
+            frame.timings['match_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            self.cache.put('embedding', embedding_key, result, generation)
+        return result
 
-            for i, name in enumerate(self.known_face_names):
-                if name.startswith(f"{worker_id_str}_"):
-                    indices_to_remove.append(i)
+    def match_encoding(self, face_encoding, location_id=None):
+        """Match one face encoding against the gallery"""
+        return self.match_encodings([face_encoding], location_id)[0]
 
-            if not indices_to_remove:
-                return False, f"Worker with ID {worker_id} not found"
+    def match_encodings(self, face_encodings, location_id=None):
+        """
+        Match face encodings against the gallery with batched searches.
+        Returns one (success, worker_data, confidence, message) per encoding
+        """
+        # Every search and lookup below uses the same published gallery
+        gallery = self.gallery
+        started = time.perf_counter()
+        face_encodings = np.asarray(face_encodings, dtype=np.float32).reshape(-1, gallery.dim)
+        scopes = ['global'] * len(face_encodings)
+        results = [None] * len(face_encodings)
+        
+        if location_id is not None and location_id in gallery.scopes:
+            scopes = ['location'] * len(face_encodings)
+            results = gallery.search_batch(face_encodings, k=RECOGNITION_TOP_K, scope=location_id)
+            if SCOPE_FALLBACK:
+                for i, (slots, distances, _) in enumerate(results):
+                    if len(slots) == 0 or 1 - float(distances[0]) < CONFIDENCE_THRESHOLD:
+                        scopes[i] = 'global'
+        
+        retry = [i for i, scope in enumerate(scopes) if scope == 'global']
+        if retry:
+            for i, result in zip(retry, gallery.search_batch(face_encodings[retry], k=RECOGNITION_TOP_K)):
+                results[i] = result
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage='gallery_search')
+        
+        return [
+            self._match_result(gallery, slots, distances, margins, scope)
+            for (slots, distances, margins), scope in zip(results, scopes)
+        ]
 
-            # Remove in reverse order to maintain indices
-            for i in reversed(indices_to_remove):
-                worker_name = self.known_face_names[i].split('_', 1)[1]
-                del self.known_face_encodings[i]
-                del self.known_face_names[i]
-                logger.info(f"Deleted face encoding for {worker_name} (ID: {worker_id})")
+    def _match_result(self, gallery, slots, distances, margins, scope):
+        if len(slots) == 0:
+            return False, None, 0, "Face not recognized with sufficient confidence"
+        
+        # Get confidence (inverse of distance)
+        confidence = 1 - float(distances[0])
+        MATCH_CONFIDENCE.observe(confidence, result='match' if confidence >= CONFIDENCE_THRESHOLD else 'no_match')
+        
+        if confidence >= CONFIDENCE_THRESHOLD:
+            candidates = []
+            for slot, distance in zip(slots, distances):
+                candidate_id = int(gallery.ids[slot])
+                candidates.append({
+                    'worker_id': candidate_id,
+                    'worker_name': gallery.names[candidate_id],
+                    'confidence': 1 - float(distance)
+                })
+            
+            return True, {
+                'worker_id': candidates[0]['worker_id'],
+                'worker_name': candidates[0]['worker_name'],
+                'confidence': float(confidence),
+                'margin': float(margins[0]) if np.isfinite(margins[0]) else None,
+                'candidates': candidates,
+                'location_id': gallery.scope_of(slots[0]),
+                'search_scope': scope
+            }, confidence * 100, "Face recognized successfully"
+        else:
+            return False, None, confidence * 100, "Face not recognized with sufficient confidence"
 
-            if self.save_encodings():
-                return True, f"Successfully deleted {len(indices_to_remove)} face encoding(s) for worker {worker_id}"
-            else:
-                return False, "Failed to save changes"
+    def recognize_batch(self, frames, location_id=None):
+        """
+        Recognize every face in several images. Detection and encoding run across images in
+        parallel, then all encodings are matched together. Returns one result dict per image
+        """
+        if len(self.gallery) == 0:
+            return [{'success': False, 'message': 'No registered faces in database', 'faces': []}
+                    for _ in frames]
+        
+        def detect(frame):
+            if frame is None:
+                return None, []
+            return self.detect_and_encode(frame)
+        
+        detections = list(batch_executor.map(detect, frames))
+        
+        all_encodings = [encoding for _, encodings in detections for encoding in encodings]
+        matches = iter(self.match_encodings(all_encodings, location_id) if all_encodings else [])
+        
+        results = []
+        for frame, (face_locations, encodings) in zip(frames, detections):
+            if face_locations is None:
+                results.append({'success': False, 'message': 'Invalid image data', 'faces': []})
+                continue
+            if not face_locations:
+                results.append({'success': False, 'message': 'No face detected in image', 'faces': []})
+                continue
+            
+            faces = []
+            for (top, right, bottom, left), _ in zip(face_locations, encodings):
+                success, worker_data, confidence, message = next(matches)
+                face = {
+                    'box': {'top': top, 'right': right, 'bottom': bottom, 'left': left},
+                    'success': success,
+                    'message': message,
+                    'confidence': confidence
+                }
+                if success and worker_data:
+                    face['worker'] = worker_data
+                faces.append(face)
+            results.append({
+                'success': any(face['success'] for face in faces),
+                'message': f"{len(faces)} face(s) processed",
+                'faces': faces,
+                'timings': frame.timings
+            })
+        return results
+
+    def recognize_stream_frame(self, session, source):
+        """
+        Process one frame of a kiosk stream. Frames arriving faster than the session's rate are
+        skipped undecoded; otherwise faces are detected and followed, and only new tracks or
+        tracks whose confidence decayed are encoded and searched. Returns the frame result
+        """
+        with session.lock:
+            now = time.monotonic()
+            if not session.should_process(now):
+                return {'processed': False, 'tracks': session.snapshot(now), 'events': []}
+            frame = self.process_image(source)
+            if frame is None:
+                return {'processed': False, 'message': 'Invalid image data', 'tracks': session.snapshot(now), 'events': []}
+            
+            face_locations, _ = self.detect_and_encode(frame, max_faces=0)
+            events = session.update(face_locations, now)
+            pending = session.needs_encoding(now)
+            if pending:
+                _, face_encodings = self.detect_and_encode(frame, locations=[track.box for track in pending])
+                matches = self.match_encodings(face_encodings, session.location_id) if len(self.gallery) else []
+                for i, track in enumerate(pending):
+                    success, worker_data, confidence, _ = matches[i] if i < len(matches) else (False, None, 0, None)
+                    event = session.record_match(track, worker_data if success else None, confidence / 100, now)
+                    if event is not None:
+                        events.append(event)
+            
+            for event in events:
+                if event['event'] == 'identified':
+                    logger.info(f"Kiosk {session.kiosk_id}: identified {event['worker']['worker_name']} "
+                                f"(ID: {event['worker']['worker_id']}, track {event['track_id']})")
+            return {
+                'processed': True,
+                'tracks': session.snapshot(now),
+                'events': events,
+                'encoded': len(pending),
+                'timings': frame.timings
+            }
+
+    def delete_worker(self, worker_id):
+        """Delete a worker's face encoding. Returns (success, message, persistence sequence)"""
+        try:
+            if not self.gallery.has_worker(worker_id):
+                return False, f"Worker with ID {worker_id} not found", None
+            
+            def delete(gallery):
+                if not gallery.has_worker(worker_id):
+                    return (None, 0), ()
+                worker_name = gallery.name_of(worker_id)
+                return (worker_name, gallery.remove_worker(worker_id)), [('delete', worker_id)]
+            
+            (worker_name, removed), sequence = self.edit(delete)
+            if not removed:
+                return False, f"Worker with ID {worker_id} not found", None
+
+            logger.info(f"Deleted {removed} face encoding(s) for {worker_name} (ID: {worker_id})")
+
+            return True, f"Successfully deleted {removed} face encoding(s) for worker {worker_id}", sequence
 
         except Exception as e:
             logger.error(f"Error deleting worker: {e}")
-            return False, f"Error deleting worker: {str(e)}"
+            return False, f"Error deleting worker: {str(e)}", None
+
+    def bulk_register(self, items, workers=None, mode='merge'):
+        """
+        Encode (name, bytes) capture images on a process pool and swap in the rebuilt gallery,
+        persisted as one new store generation. Returns (report, persistence sequence),
+        or (None, None) while another import is running
+        """
+        if not self.bulk_lock.acquire(blocking=False):
+            return None, None
+        try:
+            templates, report = enroll(
+                items, BULK_PROCESSES, DETECT_MAX_SIDE, MAX_TEMPLATES, TEMPLATE_MIN_DISTANCE, self.enrol_detector
+            )
+            with self.write_lock:
+                arrays = merge_arrays(self.gallery.to_arrays(), templates, workers, mode)
+                self.publish(FaceGallery.from_arrays(*arrays, index=build_index(), **GALLERY_OPTIONS))
+                sequence = self.persistence.submit(('snapshot',))
+            report['gallery_rows'] = len(arrays[1])
+            logger.info(
+                f"Bulk enrolled {report['workers']} worker(s) from {report['images']} image(s), "
+                f"{len(report['failures'])} failed, in {report['elapsed_s']} s"
+            )
+            return report, sequence
+        finally:
+            self.bulk_lock.release()
+
+    def assign_location(self, worker_id, location_id):
+        """Move a worker to another location scope. Returns the persistence sequence, or None if unknown"""
+        if not self.gallery.has_worker(worker_id):
+            return None
+        
+        def move(gallery):
+            if not gallery.has_worker(worker_id):
+                return False, ()
+            gallery.set_scope(worker_id, location_id)
+            return True, [('scope', worker_id, location_id)]
+        
+        found, sequence = self.edit(move)
+        return sequence if found else None
 
 # Initialize service
 face_service = FaceRecognitionService()
 
+def start_service():
+    """Start background work for this process; pre-forking servers call it after fork"""
+    face_service.start()
+    atexit.register(face_service.stop)
+    if PROFILE_ENABLED:
+        profiler.configure(enabled=True)
+
+def install_signal_handlers():
+    """SIGUSR2 toggles the request profiler. Must run in the main thread, after gunicorn set up its own handlers"""
+    if hasattr(signal, 'SIGUSR2') and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR2, lambda signum, frame: profiler.toggle())
+
+def pool_stat(field):
+    """Scrape-time reading of an inference pool stat, absent when detection runs in-process"""
+    return lambda: face_service.pool.stats()[field] if face_service.pool is not None else None
+
+def cache_stat(field):
+    """Scrape-time reading of a recognition cache counter per level"""
+    def read():
+        stats = face_service.cache.stats()
+        return {(level,): stats[level][field] for level in RecognitionCache.LEVELS}
+    return read
+
+metrics.gauge('face_gallery_workers', 'Registered workers', function=lambda: face_service.gallery.worker_count)
+metrics.gauge('face_gallery_templates', 'Face templates in the gallery', function=lambda: len(face_service.gallery))
+metrics.gauge('face_gallery_version', 'Version of the served gallery', function=lambda: face_service.gallery.version)
+metrics.gauge('face_gallery_scan_bytes', 'Bytes of the matrix gallery scans read', function=lambda: face_service.gallery.memory_stats()['scan_bytes'])
+metrics.gauge('face_inference_queue_depth', 'Inference requests in flight on the worker pool', function=pool_stat('in_flight'))
+metrics.gauge('face_inference_queue_capacity', 'Inference requests admitted before answering 503', function=pool_stat('queue_capacity'))
+metrics.counter('face_inference_rejected_total', 'Requests turned away because the inference pool was full', function=pool_stat('rejected'))
+metrics.gauge('face_persistence_pending', 'Gallery changes waiting to be written to the store',
+              function=lambda: face_service.persistence.stats()['pending'] if face_service.persistence is not None else None)
+metrics.counter('face_cache_hits_total', 'Recognition cache hits by level', ('level',), function=cache_stat('hits'))
+metrics.counter('face_cache_misses_total', 'Recognition cache misses by level', ('level',), function=cache_stat('misses'))
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+    g.profile = profiler.begin()
+
+# Endpoints served while the models and gallery are still loading
+STARTUP_ENDPOINTS = {'health_check', 'liveness', 'readiness_check', 'metrics_endpoint', 'admin_profiler', 'admin_slow_requests'}
+WRITE_ENDPOINTS = {'register_face', 'add_template', 'delete_worker', 'bulk_register', 'assign_location', 'durability_status'}
+
+@app.before_request
+def require_ready():
+    """Until loading finishes, answer everything else with 503 and Retry-After"""
+    if face_service.readiness.ready or request.endpoint in STARTUP_ENDPOINTS:
+        return None
+    response = jsonify({
+        'success': False,
+        'message': 'Face recognition service is starting, please retry',
+        'confidence': 0
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+    return response
+
+@app.before_request
+def refuse_writes():
+    """A read-only replica has no persistence worker; gallery changes go to the writing instance"""
+    if not READ_ONLY or request.endpoint not in WRITE_ENDPOINTS:
+        return None
+    return jsonify({
+        'success': False,
+        'message': 'This is a read-only replica (FACE_READ_ONLY); send changes to the writing instance'
+    }), 409
+
+@app.after_request
+def record_request(response):
+    """Count every response and its latency under its route, not the raw path"""
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    if response.status_code >= 500:
+        REQUEST_ERRORS.inc(endpoint=endpoint)
+    if 'started' in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.started, endpoint=endpoint)
+    profiler.end(g.pop('profile', None), lambda: {
+        'endpoint': endpoint,
+        'method': request.method,
+        'status': response.status_code,
+        'content_type': request.content_type,
+        'content_length': request.content_length,
+        'images': [frame.describe() if frame is not None else None for frame in g.get('frames', [])]
+    })
+    return response
+
+# gunicorn.conf.py defers the start to each forked worker; bulk enrolment processes (started
+# by a fork server, or spawned) re-import this module as __mp_main__ and must not start it
+# either. They are named before that import, while parent_process() is only set after it
+if os.environ.get('FACE_DEFER_START', 'false').lower() != 'true' and multiprocessing.current_process().name == 'MainProcess':
+    start_service()
+    install_signal_handlers()
+
+@app.errorhandler(PoolBusy)
+def service_busy(e):
+    """Backpressure: tell clients to come back instead of queueing unboundedly"""
+    response = jsonify({
+        'success': False,
+        'message': str(e),
+        'confidence': 0
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+def durability(data, sequence):
+    """Persistence fields for a write response, optionally waiting for the change to reach disk"""
+    if sequence is None:
+        return {}
+    durable = sequence <= face_service.persistence.durable_sequence
+    if not durable and data.get('wait_durable'):
+        durable = face_service.persistence.wait_for(sequence, DURABLE_WAIT_TIMEOUT)
+    return {
+        'sequence': sequence,
+        'durable': durable
+    }
+
+def request_fields():
+    """
+    Fields of an image request. Besides base64 JSON, the image may come as a multipart
+    'image' upload or as a raw image body with the other fields in the query string;
+    'image' is then the unread stream, decoded by process_image without a base64 copy
+    """
+    if request.mimetype == 'multipart/form-data':
+        data = request.form.to_dict()
+        if 'image' in request.files:
+            data['image'] = request.files['image'].stream
+    elif request.mimetype in RAW_IMAGE_TYPES:
+        data = request.args.to_dict()
+        if request.content_length != 0:
+            data['image'] = request.stream
+    else:
+        return request.get_json(silent=True)
+    
+    return parse_flags(data)
+
+def rejection(frame):
+    """Reason code and scores to add to a response when the quality gate refused the frame's face"""
+    if frame.rejection is None:
+        return {}
+    return {'reason': frame.rejection['reason'], 'quality': frame.rejection}
+
+def parse_flags(data):
+    """Form and query values arrive as strings"""
+    for flag in ('wait_durable', 'append'):
+        if flag in data:
+            data[flag] = data[flag].lower() in ('1', 'true', 'yes')
+    return data
+
+class InvalidField(ValueError):
+    """A request field that does not parse; answered with 400 instead of a server error"""
+
+def parse_id(data, field):
+    """Integer id field of a request body; raises InvalidField for non-numeric values"""
+    value = data[field]
+    try:
+        if isinstance(value, (bool, float)):
+            raise ValueError(value)
+        return int(value)
+    except (TypeError, ValueError):
+        raise InvalidField(f"Invalid {field} '{value}': expected an integer id")
+
+def parse_worker_id(data):
+    return parse_id(data, 'worker_id')
+
+def parse_location_id(data):
+    """Optional project location scope from a request body"""
+    location_id = data.get('location_id')
+    if location_id is None or location_id == '':
+        return None
+    return parse_id(data, 'location_id')
+
+@app.errorhandler(InvalidField)
+def invalid_field(e):
+    return jsonify({
+        'success': False,
+        'message': str(e)
+    }), 400
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """Health check endpoint; 503 with status 'starting' (or 'failed') until the service is ready"""
+    readiness = face_service.readiness.stats()
     return jsonify({
-        'status': 'healthy',
-        'registered_faces': len(face_service.known_face_encodings),
+        'status': 'healthy' if readiness['ready'] else 'failed' if readiness['state'] == 'failed' else 'starting',
+        'readiness': readiness,
+        'registered_faces': face_service.gallery.worker_count,
+        'gallery_version': face_service.gallery.version,
+        'templates': len(face_service.gallery),
+        'index': face_service.gallery.index.stats(),
+        'gallery_memory': face_service.gallery.memory_stats(),
+        'locations': len(face_service.gallery.scopes.keys()),
+        'store': face_service.store.stats(),
+        'read_only': READ_ONLY,
+        'persistence': face_service.persistence.stats() if face_service.persistence is not None else None,
+        'inference_pool': face_service.pool.stats() if face_service.pool is not None else None,
+        'detectors': {'recognize': face_service.detector, 'enrol': face_service.enrol_detector},
+        'cache': face_service.cache.stats(),
+        'match_batcher': face_service.batcher.stats() if face_service.batcher is not None else None,
+        'quality_gate': face_service.quality.stats() if face_service.quality is not None else None,
+        'streams': face_service.streams.stats(),
         'service': 'face_recognition'
+    }), 200 if readiness['ready'] else 503
+
+@app.route('/live', methods=['GET'])
+def liveness():
+    """Liveness probe: the process is up and answering, whether or not it has finished loading"""
+    return jsonify({
+        'status': 'alive',
+        'uptime_s': face_service.readiness.stats()['uptime_s']
     })
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 200 once the models and gallery are loaded, else 503 with per-stage progress and timing"""
+    stats = face_service.readiness.stats()
+    return jsonify(stats), 200 if stats['ready'] else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition of this process's counters, gauges and histograms"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/register', methods=['POST'])
 def register_face():
     """Register a new face"""
     try:
-        data = request.get_json()
+        data = request_fields()
         
         if not data or 'image' not in data or 'worker_id' not in data or 'worker_name' not in data:
             return jsonify({
                 'success': False,
                 'message': 'Missing required fields: image, worker_id, worker_name'
             }), 400
+        worker_id = parse_worker_id(data)
+        location_id = parse_location_id(data)
         
         # Process image
-        image_array = face_service.process_image_from_base64(data['image'])
-        if image_array is None:
+        frame = face_service.process_image(data['image'])
+        g.frames = [frame]
+        if frame is None:
             return jsonify({
                 'success': False,
                 'message': 'Invalid image data'
             }), 400
         
         # Register face
-        success, message = face_service.register_face(
-            image_array, 
-            data['worker_id'], 
-            data['worker_name']
+        success, message, sequence = face_service.register_face(
+            frame, 
+            worker_id, 
+            data['worker_name'],
+            location_id,
+            append=bool(data.get('append'))
         )
         
         return jsonify({
             'success': success,
             'message': message,
-            'total_registered': len(face_service.known_face_encodings)
+            'total_registered': face_service.gallery.worker_count,
+            'timings': frame.timings,
+            **rejection(frame),
+            **durability(data, sequence)
         })
         
+    except (PoolBusy, InvalidField):
+        raise
     except Exception as e:
         logger.error(f"Error in register endpoint: {e}")
         return jsonify({
@@ -283,22 +1156,63 @@ def register_face():
             'message': f'Server error: {str(e)}'
         }), 500
 
+@app.route('/add_template', methods=['POST'])
+def add_template():
+    """Add a template for a registered worker from a confirmed clock-in photo"""
+    try:
+        data = request_fields()
+        
+        if not data or 'image' not in data or 'worker_id' not in data:
+            return jsonify({
+                'success': False,
+                'message': 'Missing required fields: image, worker_id'
+            }), 400
+        worker_id = parse_worker_id(data)
+        
+        frame = face_service.process_image(data['image'])
+        g.frames = [frame]
+        if frame is None:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid image data'
+            }), 400
+        
+        success, message, sequence = face_service.add_template(frame, worker_id)
+        
+        return jsonify({
+            'success': success,
+            'message': message,
+            'templates': face_service.gallery.template_count(worker_id),
+            **rejection(frame),
+            **durability(data, sequence)
+        })
+        
+    except (PoolBusy, InvalidField):
+        raise
+    except Exception as e:
+        logger.error(f"Error in add_template endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}'
+        }), 500
+
 @app.route('/recognize', methods=['POST'])
 def recognize_face():
     """Recognize a face"""
     try:
-        data = request.get_json()
+        data = request_fields()
         
         if not data or 'image' not in data:
             return jsonify({
                 'success': False,
                 'message': 'Missing required field: image'
             }), 400
+        location_id = parse_location_id(data)
         
         logger.info("Received face recognition request")
         
         # Check if we have any registered faces
-        if len(face_service.known_face_encodings) == 0:
+        if len(face_service.gallery) == 0:
             logger.warning("No registered faces available")
             return jsonify({
                 'success': False,
@@ -306,11 +1220,12 @@ def recognize_face():
                 'confidence': 0
             })
         
-        logger.info(f"Total registered faces: {len(face_service.known_face_encodings)}")
+        logger.info(f"Total registered faces: {len(face_service.gallery)}")
         
         # Process image
-        image_array = face_service.process_image_from_base64(data['image'])
-        if image_array is None:
+        frame = face_service.process_image(data['image'])
+        g.frames = [frame]
+        if frame is None:
             return jsonify({
                 'success': False,
                 'message': 'Invalid image data',
@@ -320,14 +1235,20 @@ def recognize_face():
         logger.info("Image processed successfully")
         
         # Recognize face
-        success, worker_data, confidence, message = face_service.recognize_face(image_array)
+        success, worker_data, confidence, message = face_service.recognize_face(
+            frame,
+            location_id
+        )
         
         logger.info(f"Recognition result: success={success}, confidence={confidence:.1f}%, message={message}")
+        logger.info("Stage timings: " + ", ".join(f"{stage} {ms:.1f}" for stage, ms in frame.timings.items()))
         
         response = {
             'success': success,
             'message': message,
-            'confidence': confidence
+            'confidence': confidence,
+            'timings': frame.timings,
+            **rejection(frame)
         }
         
         if success and worker_data:
@@ -336,6 +1257,8 @@ def recognize_face():
         
         return jsonify(response)
         
+    except (PoolBusy, InvalidField):
+        raise
     except Exception as e:
         logger.error(f"Error in recognize endpoint: {e}")
         return jsonify({
@@ -343,18 +1266,138 @@ def recognize_face():
             'message': f'Server error: {str(e)}'
         }), 500
 
+@app.route('/recognize_batch', methods=['POST'])
+def recognize_batch():
+    """Recognize all faces in several frames or a group shot"""
+    try:
+        data = request.get_json()
+        
+        if not data or not isinstance(data.get('images'), list) or not data['images']:
+            return jsonify({
+                'success': False,
+                'message': 'Missing required field: images (list of base64 images)'
+            }), 400
+        
+        if len(data['images']) > BATCH_MAX_IMAGES:
+            return jsonify({
+                'success': False,
+                'message': f'Too many images: at most {BATCH_MAX_IMAGES} per request'
+            }), 400
+        
+        logger.info(f"Received batch recognition request with {len(data['images'])} image(s)")
+        
+        # Decode all images in parallel
+        frames = list(batch_executor.map(face_service.process_image, data['images']))
+        g.frames = frames
+        
+        results = face_service.recognize_batch(frames, parse_location_id(data))
+        
+        return jsonify({
+            'success': any(result['success'] for result in results),
+            'results': results
+        })
+        
+    except (PoolBusy, InvalidField):
+        raise
+    except Exception as e:
+        logger.error(f"Error in recognize_batch endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}'
+        }), 500
+
+@app.route('/stream/<kiosk_id>', methods=['POST'])
+def stream_frame(kiosk_id):
+    """
+    One frame of a kiosk's stream, in any /recognize image format; send the next frame on the
+    same connection. Identifications are reported once per person per pass through the gate
+    """
+    try:
+        data = request_fields()
+        
+        if not data or 'image' not in data:
+            return jsonify({
+                'success': False,
+                'message': 'Missing required field: image'
+            }), 400
+        
+        session = face_service.streams.get(kiosk_id, parse_location_id(data))
+        result = face_service.recognize_stream_frame(session, data['image'])
+        return jsonify({
+            'success': True,
+            'kiosk_id': kiosk_id,
+            **result
+        })
+        
+    except (PoolBusy, InvalidField):
+        raise
+    except Exception as e:
+        logger.error(f"Error in stream endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}'
+        }), 500
+
+@app.route('/stream/<kiosk_id>/mjpeg', methods=['POST'])
+def stream_mjpeg(kiosk_id):
+    """
+    Chunked multipart/x-mixed-replace (MJPEG) upload of a kiosk's camera; the response streams
+    one JSON line per frame as frames arrive
+    """
+    boundary = request.mimetype_params.get('boundary')
+    if request.mimetype != 'multipart/x-mixed-replace' or not boundary:
+        return jsonify({
+            'success': False,
+            'message': 'Expected a multipart/x-mixed-replace body with a boundary'
+        }), 400
+    
+    # The stream is open-ended; each frame is bounded by the part reader instead
+    request.max_content_length = None
+    session = face_service.streams.get(kiosk_id, parse_location_id(request.args))
+    stream = request.stream
+    
+    def results():
+        try:
+            for index, body in enumerate(iter_multipart_frames(stream, boundary)):
+                try:
+                    result = face_service.recognize_stream_frame(session, BytesIO(body))
+                except PoolBusy as e:
+                    result = {'processed': False, 'message': str(e), 'tracks': [], 'events': []}
+                yield json.dumps({'frame': index, **result}) + '\n'
+        except Exception as e:
+            logger.error(f"Error in MJPEG stream for kiosk {kiosk_id}: {e}")
+            yield json.dumps({'success': False, 'message': f'Stream error: {str(e)}'}) + '\n'
+    
+    return Response(stream_with_context(results()), mimetype='application/x-ndjson')
+
+@app.route('/stream/<kiosk_id>', methods=['DELETE'])
+def close_stream(kiosk_id):
+    """End a kiosk's stream session and return its counters"""
+    session = face_service.streams.close(kiosk_id)
+    if session is None:
+        return jsonify({
+            'success': False,
+            'message': f'No stream session for kiosk {kiosk_id}'
+        }), 404
+    return jsonify({
+        'success': True,
+        **session.summary()
+    })
+
 @app.route('/list_registered', methods=['GET'])
 def list_registered():
     """List all registered faces"""
     try:
+        gallery = face_service.gallery
         workers = []
-        for name in face_service.known_face_names:
-            if '_' in name:
-                worker_id, worker_name = name.split('_', 1)
-                workers.append({
-                    'worker_id': int(worker_id),
-                    'worker_name': worker_name
-                })
+        for worker_id in gallery.worker_ids():
+            slots = gallery.templates_of(worker_id)
+            workers.append({
+                'worker_id': worker_id,
+                'worker_name': gallery.name_of(worker_id),
+                'location_id': gallery.scope_of(slots[0]),
+                'templates': len(slots)
+            })
 
         return jsonify({
             'success': True,
@@ -381,15 +1424,18 @@ def delete_worker():
                 'message': 'Missing required field: worker_id'
             }), 400
         
-        worker_id = data['worker_id']
-        success, message = face_service.delete_worker(worker_id)
+        worker_id = parse_worker_id(data)
+        success, message, sequence = face_service.delete_worker(worker_id)
 
         return jsonify({
             'success': success,
             'message': message,
-            'total_registered': len(face_service.known_face_encodings)
+            'total_registered': face_service.gallery.worker_count,
+            **durability(data, sequence)
         })
 
+    except InvalidField:
+        raise
     except Exception as e:
         logger.error(f"Error in delete_worker endpoint: {e}")
         return jsonify({
@@ -397,15 +1443,140 @@ def delete_worker():
             'message': f'Server error: {str(e)}'
         }), 500
 
+@app.route('/bulk_register', methods=['POST'])
+def bulk_register():
+    """
+    Enrol many workers in one step from worker_<id>_<timestamp>.jpg captures: a tarball
+    body (fields in the query string), a multipart 'archive' upload, or, for a JSON or
+    empty body, the FACE_IMAGES_DIR directory. 'workers' optionally lists worker_id,
+    worker_name and location_id; 'mode' is merge (default) or replace
+    """
+    try:
+        # Archives are far larger than the single images other endpoints accept
+        request.max_content_length = BULK_MAX_UPLOAD_MB * 1024 * 1024
+        if request.mimetype in ARCHIVE_TYPES:
+            data = parse_flags(request.args.to_dict())
+            items = iter_tarball(request.stream)
+        elif request.mimetype == 'multipart/form-data':
+            data = parse_flags(request.form.to_dict())
+            if 'archive' not in request.files:
+                return jsonify({
+                    'success': False,
+                    'message': 'Missing required file: archive'
+                }), 400
+            items = iter_tarball(request.files['archive'].stream)
+        else:
+            data = request.get_json(silent=True) or {}
+            if not os.path.isdir(FACE_IMAGES_DIR):
+                return jsonify({
+                    'success': False,
+                    'message': f'Capture directory {FACE_IMAGES_DIR} not found'
+                }), 400
+            items = iter_directory(FACE_IMAGES_DIR)
+        
+        mode = data.get('mode', 'merge')
+        if mode not in BULK_MODES:
+            return jsonify({
+                'success': False,
+                'message': f"Invalid mode: {mode}, expected one of {', '.join(BULK_MODES)}"
+            }), 400
+        workers = data.get('workers')
+        if isinstance(workers, str):
+            workers = json.loads(workers)
+        
+        report, sequence = face_service.bulk_register(items, parse_workers(workers or []), mode)
+        if report is None:
+            return jsonify({
+                'success': False,
+                'message': 'A bulk registration is already running'
+            }), 409
+        
+        return jsonify({
+            'success': True,
+            'message': f"Enrolled {report['workers']} worker(s) from {report['images']} image(s)",
+            'report': report,
+            'total_registered': face_service.gallery.worker_count,
+            **durability(data, sequence)
+        })
+        
+    except RequestEntityTooLarge:
+        raise
+    except tarfile.TarError as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid archive: {str(e)}'
+        }), 400
+    except Exception as e:
+        logger.error(f"Error in bulk_register endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}'
+        }), 500
+
+@app.route('/assign_location', methods=['POST'])
+def assign_location():
+    """Move a registered worker to another project location scope"""
+    try:
+        data = request.get_json()
+        
+        if not data or 'worker_id' not in data:
+            return jsonify({
+                'success': False,
+                'message': 'Missing required field: worker_id'
+            }), 400
+        
+        worker_id = parse_worker_id(data)
+        location_id = parse_location_id(data)
+        sequence = face_service.assign_location(worker_id, location_id)
+        if sequence is None:
+            return jsonify({
+                'success': False,
+                'message': f"Worker with ID {worker_id} not found"
+            })
+        
+        return jsonify({
+            'success': True,
+            'message': f"Worker {worker_id} assigned to location {location_id}",
+            **durability(data, sequence)
+        })
+        
+    except InvalidField:
+        raise
+    except Exception as e:
+        logger.error(f"Error in assign_location endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}'
+        }), 500
+
+@app.route('/durability', methods=['GET'])
+def durability_status():
+    """Report the durable sequence, optionally waiting for ?sequence=N to reach disk"""
+    sequence = request.args.get('sequence', type=int)
+    if sequence is not None:
+        timeout = min(request.args.get('timeout', DURABLE_WAIT_TIMEOUT, type=float), DURABLE_WAIT_TIMEOUT)
+        face_service.persistence.wait_for(sequence, timeout)
+    
+    stats = face_service.persistence.stats()
+    if sequence is not None:
+        stats['durable'] = sequence <= stats['durable_sequence']
+    return jsonify({
+        'success': True,
+        **stats
+    })
+
 @app.route('/reload_encodings', methods=['POST'])
 def reload_encodings():
-    """Reload face encodings from file"""
+    """Apply changes other processes wrote to the encoding store; ?full=true reloads everything"""
     try:
-        face_service.load_encodings()
+        full = request.args.get('full', 'false').lower() in ('1', 'true', 'yes')
+        applied = face_service.refresh(full=full)
         return jsonify({
             'success': True,
-            'message': 'Face encodings reloaded successfully',
-            'total_registered': len(face_service.known_face_encodings)
+            'message': 'Face encodings reloaded successfully' if applied is None else f'Applied {applied} change(s)',
+            'full_reload': applied is None,
+            'version': face_service.gallery.version,
+            'total_registered': face_service.gallery.worker_count
         })
     except Exception as e:
         logger.error(f"Error reloading encodings: {e}")
@@ -414,14 +1585,73 @@ def reload_encodings():
             'message': f'Error reloading encodings: {str(e)}'
         }), 500
 
+def admin_denied():
+    """403 response unless FACE_ADMIN_TOKEN is configured and the request carries it"""
+    if not ADMIN_TOKEN:
+        return jsonify({
+            'success': False,
+            'message': 'Admin endpoints are disabled, set FACE_ADMIN_TOKEN to enable them'
+        }), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+        return jsonify({
+            'success': False,
+            'message': 'Admin token required'
+        }), 403
+    return None
+
+@app.route('/admin/profiler', methods=['GET', 'POST'])
+def admin_profiler():
+    """Profiler settings; POST enabled, threshold_ms, interval_ms or capacity to change them"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            profiler.configure(
+                enabled=data.get('enabled'),
+                threshold_ms=data.get('threshold_ms'),
+                interval_ms=data.get('interval_ms'),
+                capacity=data.get('capacity')
+            )
+        return jsonify({
+            'success': True,
+            **profiler.stats()
+        })
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid profiler setting: {str(e)}'
+        }), 400
+
+@app.route('/admin/slow_requests', methods=['GET'])
+def admin_slow_requests():
+    """
+    Download the buffered slow requests as JSON, or with ?format=folded their merged stacks
+    in collapsed form for flame graph tools; ?clear=true empties the buffer
+    """
+    denied = admin_denied()
+    if denied:
+        return denied
+    clear = request.args.get('clear', 'false').lower() in ('1', 'true', 'yes')
+    records = profiler.slow_requests(clear=clear)
+    if request.args.get('format') == 'folded':
+        return Response(fold_stacks(records), mimetype='text/plain',
+                        headers={'Content-Disposition': 'attachment; filename=slow_requests.folded'})
+    return Response(json.dumps({'profiler': profiler.stats(), 'requests': records}), mimetype='application/json',
+                    headers={'Content-Disposition': 'attachment; filename=slow_requests.json'})
+
 if __name__ == '__main__':
+    # Development server only; production runs under gunicorn (see start_production.sh)
+    host = os.environ.get('FLASK_HOST', '0.0.0.0')
+    port = int(os.environ.get('FLASK_PORT', 5000))
     print("Starting Face Recognition Service...")
-    print(f"Service will run on http://localhost:5000")
-    print(f"Loaded {len(face_service.known_face_encodings)} registered faces")
+    print(f"Service will run on http://{host}:{port}")
+    print("Models and face encodings load in the background; GET /ready reports progress")
 
     app.run(
-        host='0.0.0.0',
-        port=5000,
-        debug=True,
+        host=host,
+        port=port,
+        debug=os.environ.get('FLASK_DEBUG', 'false').lower() == 'true',
         threaded=True
     )
@@ -2,11 +2,14 @@
 Face Registration Test Script
 Gunakan script ini untuk mendaftarkan wajah Anda sebagai test worker
 """
+import os
 import cv2
 import requests
 import base64
 import json
 
+FACE_SERVICE_URL = os.environ.get('FACE_SERVICE_URL', 'http://localhost:5000')  # Same variable the backend reads
+
 def capture_and_register():
     print("Face Registration Test")
     print("=" * 30)
@@ -57,7 +60,7 @@ def capture_and_register():
             # Send to face registration service
             try:
                 print("Mendaftarkan wajah...")
-                response = requests.post('http://localhost:5001/register', 
+                response = requests.post(f'{FACE_SERVICE_URL}/register', 
                     json={
                         'worker_id': int(worker_id),
                         'worker_name': worker_name,
@@ -120,7 +123,7 @@ def test_recognition():
             # Send to face recognition service
             try:
                 print("Testing recognition...")
-                response = requests.post('http://localhost:5001/recognize', 
+                response = requests.post(f'{FACE_SERVICE_URL}/recognize', 
                     json={'image': img_base64},
                     timeout=15
                 )
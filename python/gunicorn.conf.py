@@ -0,0 +1,74 @@
+# Gunicorn configuration for the Face Recognition Service
+# Usage: gunicorn -c gunicorn.conf.py face_recognition_server:app
+# Graceful reload: kill -HUP <master pid>  (workers finish in-flight requests first)
+import os
+import sys
+import multiprocessing
+
+# The server module must not start its pool/persistence threads in the master
+os.environ['FACE_DEFER_START'] = 'true'
+
+bind = f"{os.environ.get('FLASK_HOST', '0.0.0.0')}:{os.environ.get('FLASK_PORT', '5000')}"
+
+# Every worker owns a gallery and would write to the encoding store, which takes one
+# writer (see the store's LOCK file). Keep one worker and scale detection with
+# FACE_THREADS and FACE_WORKER_PROCESSES; read-only replicas (FACE_READ_ONLY=true)
+# only follow the store and may run several.
+workers = int(os.environ.get('FACE_WORKERS', 1))
+read_only = os.environ.get('FACE_READ_ONLY', 'false').lower() == 'true'
+if workers > 1 and not read_only:
+    raise RuntimeError(
+        f"FACE_WORKERS={workers}: the encoding store has a single writer, run one worker "
+        "(or set FACE_READ_ONLY=true on a replica) and scale with FACE_THREADS and FACE_WORKER_PROCESSES"
+    )
+worker_class = 'gthread'
+threads = int(os.environ.get('FACE_THREADS', 2 * multiprocessing.cpu_count()))
+
+# By default each worker binds at once and loads the models and gallery in the background
+# (GET /ready reports progress). With FACE_PRELOAD=true the master loads them before forking,
+# so several workers share them copy-on-write, at the cost of a slower start
+preload_app = os.environ.get('FACE_PRELOAD', 'false').lower() == 'true'
+
+keepalive = int(os.environ.get('FACE_KEEPALIVE', 5))  # Seconds an idle kiosk connection is kept open
+timeout = int(os.environ.get('FACE_REQUEST_TIMEOUT', 60))  # Worker is restarted if a request blocks longer
+graceful_timeout = int(os.environ.get('FACE_GRACEFUL_TIMEOUT', 30))  # Time to drain on reload/shutdown
+# A reloaded worker waits for the store's writer lock while its predecessor drains, so for longer than that
+os.environ.setdefault('FACE_WRITER_LOCK_TIMEOUT', str(graceful_timeout + 15))
+max_requests = int(os.environ.get('FACE_MAX_REQUESTS', 0))  # Recycle workers after this many requests, 0 never
+max_requests_jitter = max_requests // 10
+
+pidfile = os.environ.get('FACE_PIDFILE', 'face_service.pid')
+accesslog = os.environ.get('FACE_ACCESS_LOG', '-')
+errorlog = os.environ.get('FACE_ERROR_LOG', '-')
+loglevel = os.environ.get('FACE_LOG_LEVEL', 'info')
+
+
+def when_ready(server):
+    if preload_app:
+        from face_recognition_server import face_service
+        face_service.load()
+        server.log.info("Loaded models and face encodings in the master")
+
+
+def post_fork(server, worker):
+    # Threads and inference processes do not survive fork, so each worker starts its own
+    from face_recognition_server import start_service
+    from encoding_store import StoreLocked
+    try:
+        start_service()
+    except StoreLocked as e:
+        # An exception here is a boot error, which halts the master; a plain exit gets the worker re-forked
+        server.log.error(f"{e}; exiting for the master to start another worker")
+        sys.exit(1)
+    server.log.info(f"Worker {worker.pid} started face recognition service")
+
+
+def post_worker_init(worker):
+    # gunicorn resets worker signal handlers after post_fork, so ours go in afterwards
+    from face_recognition_server import install_signal_handlers
+    install_signal_handlers()
+
+
+def worker_exit(server, worker):
+    from face_recognition_server import face_service
+    face_service.stop()
@@ -0,0 +1,155 @@
+# Image Input
+# Decodes request images into RGB NumPy arrays. Accepts the legacy data-URL base64 string
+# or any binary file-like object (a raw request body or a multipart upload), so binary
+# clients skip the base64 inflation and the intermediate string copies.
+import time
+import base64
+import binascii
+from io import BytesIO
+import numpy as np
+from PIL import Image
+
+
+class Frame:
+    """A decoded request image: full-resolution array, optional reduced copy for detection, stage timings"""
+
+    def __init__(self, array, detection=None):
+        self.array = array
+        self.detection = detection
+        self.timings = {}
+        self.faces = None  # Faces found, once detection has run
+        self.rejection = None  # Reason code and scores when the quality gate refused to encode a face
+
+    def describe(self):
+        """Size and detection facts for logs and slow-request traces"""
+        return {
+            'width': self.array.shape[1],
+            'height': self.array.shape[0],
+            'detection_size': None if self.detection is None else [self.detection.shape[1], self.detection.shape[0]],
+            'faces': self.faces,
+            'rejection': self.rejection,
+            'timings': self.timings
+        }
+
+
+def open_base64(base64_string):
+    """Binary stream for a base64 image string, with or without a data URL prefix"""
+    # Decode from the comma onward instead of splitting, which copies the whole string
+    start = base64_string.find(',') + 1
+    if start:
+        base64_string = memoryview(base64_string.encode('ascii'))[start:]
+    try:
+        return BytesIO(base64.b64decode(base64_string, validate=False))
+    except binascii.Error as e:
+        raise ValueError(f"Invalid base64 image: {e}")
+
+
+def open_stream(source):
+    """Seekable binary stream for a base64 string or a file-like object"""
+    if isinstance(source, str):
+        return open_base64(source)
+    if not source.seekable():
+        return BytesIO(source.read())
+    return source
+
+
+def to_rgb_array(image):
+    # Convert to RGB if necessary
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return np.array(image)
+
+
+def decode_image(source):
+    """RGB array for a base64 string or a binary file-like object"""
+    return to_rgb_array(Image.open(open_stream(source)))
+
+
+def decode_frame(source, detect_max_side=0):
+    """
+    Decode a request image into a Frame. Images larger than detect_max_side also get a
+    reduced copy for detection; for JPEGs it comes from a draft-mode decode, where libjpeg
+    scales by 1/2 to 1/8 while decoding instead of resizing the full frame afterwards.
+    base64_ms covers unwrapping a base64 string, decode_ms the PIL decode and RGB conversion
+    """
+    started = time.perf_counter()
+    stream = open_stream(source)
+    opened = time.perf_counter()
+    image = Image.open(stream)
+    width, height = image.size
+
+    detection = None
+    if detect_max_side and max(width, height) > detect_max_side:
+        scale = detect_max_side / max(width, height)
+        target = (max(1, round(width * scale)), max(1, round(height * scale)))
+        if image.format == 'JPEG':
+            image.draft('RGB', target)
+            reduced = image
+            stream.seek(0)
+            image = Image.open(stream)
+        else:
+            image.load()
+            reduced = image
+        if reduced.size != target:
+            reduced = reduced.resize(target, Image.BILINEAR)
+        detection = to_rgb_array(reduced)
+
+    frame = Frame(to_rgb_array(image), detection)
+    if isinstance(source, str):
+        frame.timings['base64_ms'] = round((opened - started) * 1000, 2)
+    frame.timings['decode_ms'] = round((time.perf_counter() - opened) * 1000, 2)
+    return frame
+
+
+def iter_multipart_frames(stream, boundary, chunk_size=64 * 1024, max_frame_bytes=16 * 1024 * 1024):
+    """
+    Yield the bodies of a multipart/x-mixed-replace (MJPEG) stream as they arrive. Parts with a
+    Content-Length header are read directly; others run to the next boundary
+    """
+    delimiter = b'--' + boundary.encode('latin-1')
+    buffer = b''
+    while True:
+        # Part headers end with a blank line
+        start = buffer.find(delimiter)
+        header_end = buffer.find(b'\r\n\r\n', start) if start != -1 else -1
+        if header_end == -1:
+            if len(buffer) > max_frame_bytes:
+                raise ValueError("MJPEG part headers not found")
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                return
+            buffer += chunk
+            continue
+        headers = buffer[start + len(delimiter):header_end]
+        if headers.startswith(b'--'):
+            return  # Closing delimiter
+        length = None
+        for line in headers.split(b'\r\n'):
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-length':
+                length = int(value.strip())
+        buffer = buffer[header_end + 4:]
+
+        if length is not None:
+            if length > max_frame_bytes:
+                raise ValueError(f"MJPEG part of {length} bytes is too large")
+            while len(buffer) < length:
+                chunk = stream.read(max(chunk_size, length - len(buffer)))
+                if not chunk:
+                    return
+                buffer += chunk
+            yield buffer[:length]
+            buffer = buffer[length:]
+        else:
+            while True:
+                end = buffer.find(b'\r\n' + delimiter)
+                if end != -1:
+                    break
+                if len(buffer) > max_frame_bytes:
+                    raise ValueError("MJPEG part too large")
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    return
+                buffer += chunk
+            yield buffer[:end]
+            buffer = buffer[end + 2:]
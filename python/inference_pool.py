@@ -0,0 +1,253 @@
+# Inference Pool
+# Runs face detection and encoding in worker processes so dlib work is not serialized
+# on one interpreter. Decoded frames reach the workers through shared memory instead of
+# being pickled, and admission is bounded so overload turns into a fast 503.
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+
+from face_detectors import get_detector
+from face_quality import FrameRejected, check_faces
+
+logger = logging.getLogger(__name__)
+
+
+class PoolBusy(Exception):
+    """Raised when every inference slot is taken"""
+
+    def __init__(self, retry_after):
+        super().__init__('Face recognition service is busy, please retry')
+        self.retry_after = retry_after
+
+
+ENCODE_CROP_MARGIN = 0.5  # Context kept around a face box, as a fraction of its height, when encoding a crop
+WARMUP_SIZE = 160  # Side of the blank frame used for the warm-up inference
+
+
+def _scale_locations(face_locations, detection_shape, shape):
+    """Map (top, right, bottom, left) boxes found on a reduced copy back onto the full image"""
+    scale_y = shape[0] / detection_shape[0]
+    scale_x = shape[1] / detection_shape[1]
+    return [
+        (
+            max(0, round(top * scale_y)),
+            min(shape[1], round(right * scale_x)),
+            min(shape[0], round(bottom * scale_y)),
+            max(0, round(left * scale_x))
+        )
+        for top, right, bottom, left in face_locations
+    ]
+
+
+def _encode_crops(face_recognition, image_array, face_locations):
+    """Encode each face on a crop around its box, so only that region is processed at full resolution"""
+    height, width = image_array.shape[:2]
+    encodings = []
+    for top, right, bottom, left in face_locations:
+        pad = int((bottom - top) * ENCODE_CROP_MARGIN)
+        y0, x0 = max(0, top - pad), max(0, left - pad)
+        y1, x1 = min(height, bottom + pad), min(width, right + pad)
+        crop = np.ascontiguousarray(image_array[y0:y1, x0:x1])
+        encodings.extend(face_recognition.face_encodings(crop, [(top - y0, right - x0, bottom - y0, left - x0)]))
+    return encodings
+
+
+def detect_and_encode(image_array, max_faces=None, detection_image=None, locations=None, detector=None, quality=None):
+    """
+    Face locations, encodings and stage timings for one image; encodings are skipped past max_faces
+    (max_faces=0 only detects). With detection_image (a reduced copy), faces are found on it and
+    encoded on crops of image_array. With locations (boxes on image_array), detection is skipped
+    and only those faces are encoded. detector is a face_detectors spec, default HOG. With quality
+    (face_quality thresholds), faces are checked before encoding and FrameRejected is raised
+    instead of encoding a face that fails
+    """
+    import face_recognition
+
+    timings = {}
+    if locations is not None:
+        face_locations = [tuple(int(v) for v in box) for box in locations]
+    else:
+        detect = get_detector(detector).detect
+        started = time.perf_counter()
+        if detection_image is None:
+            face_locations = detect(image_array)
+        else:
+            face_locations = _scale_locations(
+                detect(detection_image),
+                detection_image.shape,
+                image_array.shape
+            )
+        timings['detect_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    if not face_locations or (max_faces is not None and len(face_locations) > max_faces):
+        return face_locations, [], timings
+
+    if quality is not None:
+        started = time.perf_counter()
+        try:
+            check_faces(image_array, face_locations, quality)
+        except FrameRejected as e:
+            timings['quality_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            e.timings = timings
+            raise
+        timings['quality_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    started = time.perf_counter()
+    if detection_image is None:
+        face_encodings = face_recognition.face_encodings(image_array, face_locations)
+    else:
+        face_encodings = _encode_crops(face_recognition, image_array, face_locations)
+    timings['encode_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return face_locations, face_encodings, timings
+
+
+def warm_up(run_inference=False, detectors=()):
+    """
+    Load the dlib models and those of the given detector specs; with run_inference, also run
+    each detection and one encoding on a blank frame so the first request does not pay for
+    lazy initialisation
+    """
+    import face_recognition
+    detectors = [get_detector(spec) for spec in detectors or (None,)]
+    if run_inference:
+        blank = np.zeros((WARMUP_SIZE, WARMUP_SIZE, 3), dtype=np.uint8)
+        for detector in detectors:
+            detector.detect(blank)
+        face_recognition.face_encodings(blank, [(20, WARMUP_SIZE - 20, WARMUP_SIZE - 20, 20)])
+    return True
+
+
+def _attach(shared):
+    """Array view of a frame another process put in shared memory"""
+    shm_name, shape, dtype = shared
+    shm = shared_memory.SharedMemory(name=shm_name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _shared_detect_and_encode(image, max_faces, detection, locations=None, detector=None, quality=None):
+    segments = [_attach(image)]
+    if detection is not None:
+        segments.append(_attach(detection))
+    try:
+        face_locations, face_encodings, timings = detect_and_encode(
+            segments[0][1],
+            max_faces,
+            segments[1][1] if detection is not None else None,
+            locations,
+            detector,
+            quality
+        )
+        return face_locations, [np.asarray(encoding) for encoding in face_encodings], timings
+    finally:
+        # The views must be released before the buffers can be closed
+        blocks = [shm for shm, _ in segments]
+        del segments
+        for shm in blocks:
+            shm.close()
+
+
+class InferencePool:
+    def __init__(self, processes, max_queue=None, retry_after=1, timeout=30, warm_up_inference=False, detectors=()):
+        self.processes = processes
+        self.warm_up_inference = warm_up_inference
+        self.detectors = tuple(detectors)
+        self.max_queue = max_queue or processes * 2
+        self.retry_after = retry_after
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(self.max_queue)
+        self.in_flight = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+        self.restart_lock = threading.Lock()
+        self._start()
+
+    def _start(self):
+        # fork starts every worker up front, before the service spawns its own threads,
+        # and does not re-import the server module in the children
+        context = multiprocessing.get_context('fork')
+        # Workers must share the parent's tracker, or each one reports the frames it
+        # attached to as leaked on exit
+        resource_tracker.ensure_running()
+        self.executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+        # The first submit forks the workers; the models then load in them in the background
+        self.warming = [self.executor.submit(warm_up, self.warm_up_inference, self.detectors) for _ in range(self.processes)]
+        logger.info(f"Started inference pool with {self.processes} worker process(es)")
+
+    def wait_ready(self, timeout=None):
+        """Block until the workers have loaded the models (and run the warm-up inference)"""
+        for future in self.warming:
+            future.result(timeout=timeout)
+
+    def detect_and_encode(self, image_array, max_faces=None, detection_image=None, locations=None, detector=None, quality=None):
+        """Run detection/encoding on a worker process; raises PoolBusy when the queue is full"""
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise PoolBusy(self.retry_after)
+
+        with self.lock:
+            self.in_flight += 1
+        segments = []
+        future = None
+        try:
+            image = self._share(image_array, segments)
+            # Known boxes need no detection copy
+            detection = None if detection_image is None or locations is not None else self._share(detection_image, segments)
+            executor = self.executor
+            future = executor.submit(_shared_detect_and_encode, image, max_faces, detection, locations, detector, quality)
+            return future.result(timeout=self.timeout)
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise
+        finally:
+            # A task that timed out keeps its slot and frames until a worker is done with it,
+            # so abandoned work still counts against the queue bound
+            if future is not None and not future.done() and not future.cancel():
+                future.add_done_callback(lambda _: self._release(segments))
+            else:
+                self._release(segments)
+
+    def _release(self, segments):
+        """Free a task's shared frames and its admission slot"""
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+        with self.lock:
+            self.in_flight -= 1
+        self.slots.release()
+
+    @staticmethod
+    def _share(array, segments):
+        """Copy an array into a new shared memory block; returns what a worker needs to attach it"""
+        array = np.ascontiguousarray(array)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        segments.append(shm)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+        return shm.name, array.shape, array.dtype.str
+
+    def _restart(self, broken):
+        """Replace a pool whose worker died; concurrent callers restart it only once"""
+        with self.restart_lock:
+            if self.executor is not broken:
+                return
+            logger.error("Inference pool broke, restarting workers")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._start()
+
+    def shutdown(self):
+        # Joining the manager thread keeps the interpreter's exit hook off the closed wakeup pipe
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'processes': self.processes,
+                'queue_capacity': self.max_queue,
+                'in_flight': self.in_flight,
+                'rejected': self.rejected
+            }
@@ -0,0 +1,148 @@
+"""
+Face Recognition Service Load Test
+Drives concurrent /recognize (or /health) requests against a running service and reports
+throughput and latency, so the gunicorn setup can be compared with the dev server.
+
+Usage:
+  python face_recognition_server.py                      # dev server baseline
+  python load_test.py --label dev --output dev.json
+  gunicorn -c gunicorn.conf.py face_recognition_server:app
+  python load_test.py --label gunicorn --baseline dev.json
+"""
+import argparse
+import base64
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+import requests
+from PIL import Image
+
+
+def load_image_base64(path):
+    """Base64 JPEG payload; a blank frame exercises decoding and detection without a face"""
+    if path:
+        with open(path, 'rb') as f:
+            data = f.read()
+    else:
+        buffer = BytesIO()
+        Image.new('RGB', (640, 480), (128, 128, 128)).save(buffer, format='JPEG')
+        data = buffer.getvalue()
+    return 'data:image/jpeg;base64,' + base64.b64encode(data).decode()
+
+
+def worker_loop(session, url, payload, deadline, remaining, results, lock):
+    """Send requests back to back on one keep-alive connection until the test ends"""
+    while time.monotonic() < deadline:
+        with lock:
+            if remaining[0] == 0:
+                return
+            remaining[0] -= 1
+        started = time.perf_counter()
+        try:
+            if payload is None:
+                response = session.get(url, timeout=60)
+            else:
+                response = session.post(url, json=payload, timeout=60)
+            status = response.status_code
+        except requests.RequestException:
+            status = 'error'
+        elapsed = time.perf_counter() - started
+        with lock:
+            results.append((elapsed, status))
+
+
+def run(url, payload, concurrency, duration, total):
+    results, lock = [], threading.Lock()
+    remaining = [total if total else -1]
+    deadline = time.monotonic() + duration
+    sessions = [requests.Session() for _ in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for session in sessions:
+            executor.submit(worker_loop, session, url, payload, deadline, remaining, results, lock)
+    wall = time.perf_counter() - started
+    for session in sessions:
+        session.close()
+    return results, wall
+
+
+def summarize(results, wall):
+    latencies = np.array([elapsed for elapsed, _ in results]) * 1000
+    statuses = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ok = statuses.get('200', 0)
+    return {
+        'requests': len(results),
+        'ok': ok,
+        'statuses': statuses,
+        'seconds': wall,
+        'requests_per_second': len(results) / wall if wall else 0.0,
+        'ok_per_second': ok / wall if wall else 0.0,
+        'mean_ms': float(latencies.mean()) if len(latencies) else 0.0,
+        'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+        'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:5000', help='Service base URL')
+    parser.add_argument('--endpoint', default='recognize', choices=['recognize', 'health'])
+    parser.add_argument('--image', help='JPEG/PNG to send (default: blank 640x480 frame)')
+    parser.add_argument('--location-id', type=int, help='location_id sent with /recognize')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    parser.add_argument('--requests', type=int, default=0, help='Stop after this many requests (0 = duration only)')
+    parser.add_argument('--warmup', type=int, default=5, help='Requests sent before measuring')
+    parser.add_argument('--label', default='run', help='Name for this run in the report')
+    parser.add_argument('--baseline', help='Earlier --output report to compare against')
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    args = parser.parse_args()
+
+    url = f"{args.url.rstrip('/')}/{args.endpoint}"
+    payload = None
+    if args.endpoint == 'recognize':
+        payload = {'image': load_image_base64(args.image)}
+        if args.location_id is not None:
+            payload['location_id'] = args.location_id
+
+    if args.warmup:
+        run(url, payload, 1, 60, args.warmup)
+
+    print(f"Load testing {url} with {args.concurrency} clients for {args.duration:g}s...")
+    results, wall = run(url, payload, args.concurrency, args.duration, args.requests)
+    report = {
+        'label': args.label,
+        'url': url,
+        'concurrency': args.concurrency,
+        **summarize(results, wall)
+    }
+    print(
+        f"{report['label']}: {report['requests_per_second']:.1f} req/s  "
+        f"mean {report['mean_ms']:.1f} ms  p50 {report['p50_ms']:.1f} ms  p99 {report['p99_ms']:.1f} ms  "
+        f"statuses {report['statuses']}"
+    )
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report['baseline'] = baseline
+        speedup = report['requests_per_second'] / baseline['requests_per_second'] if baseline['requests_per_second'] else 0.0
+        print(
+            f"vs {baseline['label']}: {baseline['requests_per_second']:.1f} req/s, p99 {baseline['p99_ms']:.1f} ms "
+            f"-> throughput x{speedup:.2f}, p99 {report['p99_ms'] - baseline['p99_ms']:+.1f} ms"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
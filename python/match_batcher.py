@@ -0,0 +1,164 @@
+# Match Batcher
+# Micro-batching of gallery searches across concurrent requests. Request threads hand over
+# their probe encoding and wait; a few background threads each gather the probes of one
+# location that arrive within a short window (or until max_batch), search them together
+# with one matrix-matrix product and hand every caller its own result. Searches of other
+# locations run meanwhile on the other threads.
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class MatchRequest:
+    __slots__ = ('encoding', 'location_id', 'done', 'result', 'error')
+
+    def __init__(self, encoding, location_id):
+        self.encoding = encoding
+        self.location_id = location_id
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MatchBatcher:
+    def __init__(self, match, window=0.002, max_batch=32, timeout=30, on_batch=None, threads=4):
+        """
+        match: callable(encodings, location_id) returning one result per encoding
+        window: longest time the first probe of a batch waits for others to join it
+        max_batch: most probes matched in one batch
+        timeout: seconds a caller waits for its result
+        on_batch: optional callable(size, seconds) run after each batch
+        threads: batches searched at once (numpy releases the GIL while scoring)
+        """
+        self.match_batch = match
+        self.window = window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.on_batch = on_batch
+        self.pending = deque()
+        # Requests between upstream() and match(); the window is only waited for while there are some,
+        # so a lone request is matched at once instead of waiting for company that is not coming
+        self.upstream_count = 0
+        self.local = threading.local()
+        self.condition = threading.Condition()
+        self.running = True
+        self.batches = 0
+        self.probes = 0
+        self.largest_batch = 0
+        self.threads = [
+            threading.Thread(target=self._run, name=f'match-batcher-{i}', daemon=True) for i in range(max(1, threads))
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    @contextmanager
+    def upstream(self):
+        """Mark the calling request as on its way to match() (decoding, detecting) for the duration"""
+        with self.condition:
+            self.upstream_count += 1
+            self.local.upstream = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                # match() already took the request off the count
+                if self.local.upstream:
+                    self.upstream_count -= 1
+                    self.local.upstream = False
+                    self.condition.notify_all()
+
+    def match(self, encoding, location_id=None):
+        """Match one probe encoding in the next batch; blocks until its result is ready"""
+        request = MatchRequest(encoding, location_id)
+        with self.condition:
+            if getattr(self.local, 'upstream', False):
+                self.upstream_count -= 1
+                self.local.upstream = False
+            self.pending.append(request)
+            self.condition.notify_all()
+        if not request.done.wait(self.timeout):
+            raise TimeoutError('Timed out waiting for the gallery search')
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=10)
+
+    def _take_batch(self):
+        """The oldest pending probe and those of the same location, up to max_batch"""
+        with self.condition:
+            while self.running and not self.pending:
+                self.condition.wait()
+            if not self.pending:
+                return []
+
+            # Give requests still on their way a short window to join the first probe
+            deadline = time.monotonic() + self.window
+            while self.running and self.upstream_count > 0 and len(self.pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            if not self.pending:
+                # Another thread took them meanwhile
+                return self._take_batch()
+            location_id = self.pending[0].location_id
+            batch, rest = [], deque()
+            for request in self.pending:
+                if request.location_id == location_id and len(batch) < self.max_batch:
+                    batch.append(request)
+                else:
+                    rest.append(request)
+            self.pending = rest
+            if rest:
+                # Other locations go to the other threads
+                self.condition.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            started = time.perf_counter()
+            # Every probe of a batch has the same location; those without one share the global search
+            try:
+                results = self.match_batch([request.encoding for request in batch], batch[0].location_id)
+                for request, result in zip(batch, results):
+                    request.result = result
+            except Exception as e:
+                logger.error(f"Error matching batch of {len(batch)}: {e}")
+                for request in batch:
+                    request.error = e
+            for request in batch:
+                request.done.set()
+
+            with self.condition:
+                self.batches += 1
+                self.probes += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+            if self.on_batch is not None:
+                self.on_batch(len(batch), time.perf_counter() - started)
+
+    def stats(self):
+        with self.condition:
+            return {
+                'window_ms': self.window * 1000,
+                'max_batch': self.max_batch,
+                'threads': len(self.threads),
+                'batches': self.batches,
+                'probes': self.probes,
+                'mean_batch': round(self.probes / self.batches, 2) if self.batches else 0,
+                'largest_batch': self.largest_batch,
+                'queued': len(self.pending),
+                'upstream': self.upstream_count
+            }
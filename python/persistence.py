@@ -0,0 +1,155 @@
+# Persistence Worker
+# Write-behind batching of gallery changes into the encoding store.
+# Request threads enqueue an operation and get a sequence number back immediately;
+# a background thread coalesces everything queued within the flush window into one
+# fsynced store write and then advances the durable sequence.
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class PersistenceWorker:
+    def __init__(self, store, snapshot, flush_window=0.05, max_batch=1024, on_flush=None):
+        """
+        store: EncodingStore receiving the batches
+        snapshot: callable returning (sequence, (encodings, worker_ids, worker_names, scopes))
+                  for the gallery as of that sequence, used for compaction
+        on_flush: optional callable(kind, changes, seconds) run after each 'apply' or 'compact' write
+        """
+        self.store = store
+        self.snapshot = snapshot
+        self.on_flush = on_flush
+        self.flush_window = flush_window
+        self.max_batch = max_batch
+        self.pending = deque()
+        self.sequence = 0
+        self.durable_sequence = 0
+        self.failed = False
+        self.condition = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='persistence-worker', daemon=True)
+        self.thread.start()
+
+    def submit(self, op):
+        """
+        Queue one store operation; returns its sequence number. Call under the gallery write lock.
+        ('snapshot',) rewrites the whole store from the gallery instead of appending to it
+        """
+        with self.condition:
+            self.sequence += 1
+            self.pending.append((self.sequence, op))
+            self.condition.notify_all()
+            return self.sequence
+
+    def wait_for(self, sequence, timeout=None):
+        """Block until sequence is durable; returns whether it became durable in time"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while self.durable_sequence < sequence:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return True
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far is durable"""
+        with self.condition:
+            target = self.sequence
+        return self.wait_for(target, timeout)
+
+    def stop(self):
+        self.flush(timeout=10)
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join(timeout=10)
+
+    def _take_batch(self):
+        with self.condition:
+            while self.running and not self.pending:
+                self.condition.wait()
+            if not self.pending:
+                return []
+
+        # Let a burst of registrations accumulate before paying for the fsync
+        deadline = time.monotonic() + self.flush_window
+        with self.condition:
+            while self.running and len(self.pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            batch = []
+            while self.pending and len(batch) < self.max_batch:
+                batch.append(self.pending.popleft())
+            return batch
+
+    def _mark_durable(self, sequence):
+        with self.condition:
+            self.durable_sequence = max(self.durable_sequence, sequence)
+            self.condition.notify_all()
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            try:
+                started = time.perf_counter()
+                if any(op[0] == 'snapshot' for _, op in batch):
+                    # The snapshot already holds every change queued before it
+                    self._compact()
+                    self.failed = False
+                    self._observe('compact', len(batch), time.perf_counter() - started)
+                    continue
+                self.store.apply([op for _, op in batch])
+            except Exception as e:
+                # Changes stay in memory; retry them after the next window
+                logger.error(f"Error persisting encodings: {e}")
+                self.failed = True
+                with self.condition:
+                    self.pending.extendleft(reversed(batch))
+                time.sleep(self.flush_window or 0.05)
+                continue
+
+            self.failed = False
+            self._mark_durable(batch[-1][0])
+            elapsed = time.perf_counter() - started
+            logger.info(f"Flushed {len(batch)} gallery change(s) in {elapsed * 1000:.1f} ms")
+            self._observe('apply', len(batch), elapsed)
+            if self.store.needs_compaction():
+                try:
+                    started = time.perf_counter()
+                    self._compact()
+                    self._observe('compact', 0, time.perf_counter() - started)
+                except Exception as e:
+                    logger.error(f"Error compacting encodings: {e}")
+
+    def _observe(self, kind, changes, seconds):
+        if self.on_flush is not None:
+            try:
+                self.on_flush(kind, changes, seconds)
+            except Exception as e:
+                logger.error(f"Error in persistence flush callback: {e}")
+
+    def _compact(self):
+        """Replace the store with a snapshot; queued changes already in the snapshot are dropped"""
+        sequence, arrays = self.snapshot()
+        self.store.compact(*arrays)
+        with self.condition:
+            while self.pending and self.pending[0][0] <= sequence:
+                self.pending.popleft()
+        self._mark_durable(sequence)
+
+    def stats(self):
+        with self.condition:
+            return {
+                'sequence': self.sequence,
+                'durable_sequence': self.durable_sequence,
+                'pending': len(self.pending),
+                'failed': self.failed
+            }
@@ -0,0 +1,139 @@
+# Request Profiler
+# Opt-in sampling profiler for slow requests. While enabled, a background thread samples the
+# Python stack of every thread that is serving a request; requests slower than the threshold
+# keep their sampled stacks and metadata in a bounded ring buffer that can be downloaded.
+# Sampling only reads sys._current_frames(), so it can be switched on and off in production.
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+
+def collapse_stack(frame, max_depth=64):
+    """Stack of a frame in collapsed (flame graph) form: outermost;...;innermost"""
+    names = []
+    while frame is not None and len(names) < max_depth:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def fold_stacks(records):
+    """Stacks of profiled requests merged into collapsed-stack text for flame graph tools"""
+    totals = Counter()
+    for record in records:
+        for entry in record['stacks']:
+            totals[entry['stack']] += entry['samples']
+    return ''.join(f"{stack} {count}\n" for stack, count in totals.most_common())
+
+
+class RequestProfiler:
+    def __init__(self, threshold_ms=1000, interval_ms=10, capacity=100, max_stacks=20):
+        """
+        threshold_ms: requests at least this slow are kept in the buffer
+        interval_ms: time between stack samples
+        capacity: slow requests kept, oldest dropped first
+        max_stacks: distinct stacks kept per request, most sampled first
+        """
+        self.threshold_ms = threshold_ms
+        self.interval_ms = interval_ms
+        self.max_stacks = max_stacks
+        self.records = deque(maxlen=capacity)
+        self.enabled = False
+        self.active = {}  # Thread id -> Counter of sampled stacks for the request it serves
+        self.lock = threading.Lock()
+        self.thread = None
+        self.samples = 0
+
+    def configure(self, enabled=None, threshold_ms=None, interval_ms=None, capacity=None):
+        """Change settings at runtime; enabling starts the sampler thread, disabling lets it exit"""
+        with self.lock:
+            if threshold_ms is not None:
+                self.threshold_ms = float(threshold_ms)
+            if interval_ms is not None:
+                self.interval_ms = max(1.0, float(interval_ms))
+            if capacity is not None:
+                self.records = deque(self.records, maxlen=max(1, int(capacity)))
+            if enabled is not None:
+                self.enabled = bool(enabled)
+                if not self.enabled:
+                    self.active.clear()
+                elif self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(target=self._sample, name='request-profiler', daemon=True)
+                    self.thread.start()
+        logger.info(f"Request profiler {'enabled' if self.enabled else 'disabled'} "
+                    f"(threshold {self.threshold_ms:g} ms, interval {self.interval_ms:g} ms)")
+
+    def toggle(self):
+        self.configure(enabled=not self.enabled)
+
+    def begin(self):
+        """Start tracing the calling thread's request; returns a token for end(), or None when disabled"""
+        if not self.enabled:
+            return None
+        stacks = Counter()
+        with self.lock:
+            self.active[threading.get_ident()] = stacks
+        return (time.perf_counter(), stacks)
+
+    def end(self, token, describe):
+        """
+        Stop tracing; a request over the threshold is buffered with the dict describe() returns,
+        so building it costs nothing for fast requests
+        """
+        if token is None:
+            return
+        started, stacks = token
+        with self.lock:
+            if self.active.get(threading.get_ident()) is stacks:
+                del self.active[threading.get_ident()]
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms < self.threshold_ms:
+            return
+        record = {
+            'timestamp': time.time(),
+            'duration_ms': round(duration_ms, 2),
+            **describe(),
+            'samples': sum(stacks.values()),
+            'stacks': [{'stack': stack, 'samples': count} for stack, count in stacks.most_common(self.max_stacks)]
+        }
+        with self.lock:
+            self.records.append(record)
+
+    def _sample(self):
+        me = threading.get_ident()
+        while self.enabled:
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_id, stacks in self.active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None and thread_id != me:
+                        stacks[collapse_stack(frame)] += 1
+                        self.samples += 1
+            del frames
+            time.sleep(self.interval_ms / 1000)
+
+    def slow_requests(self, clear=False):
+        """Buffered slow requests, oldest first"""
+        with self.lock:
+            records = list(self.records)
+            if clear:
+                self.records.clear()
+        return records
+
+    def stats(self):
+        with self.lock:
+            return {
+                'enabled': self.enabled,
+                'threshold_ms': self.threshold_ms,
+                'interval_ms': self.interval_ms,
+                'capacity': self.records.maxlen,
+                'buffered': len(self.records),
+                'tracing': len(self.active),
+                'samples': self.samples
+            }
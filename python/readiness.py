@@ -0,0 +1,74 @@
+# Readiness
+# Tracks the service's startup stages (model loading, gallery loading, warm-up) so a process
+# can bind and answer liveness checks at once while the slow work runs in the background.
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    def __init__(self, stages):
+        self.created = time.time()
+        self.stages = {name: {'state': 'pending'} for name in stages}
+        self.lock = threading.Lock()
+        self.ready_event = threading.Event()
+        self.ready_after = None
+        self.error = None
+
+    @property
+    def ready(self):
+        return self.ready_event.is_set()
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+    @contextmanager
+    def stage(self, name):
+        """Time a startup stage; an exception marks it and the service as failed and propagates"""
+        started = time.perf_counter()
+        with self.lock:
+            self.stages[name] = {'state': 'running', 'started_after_s': round(time.time() - self.created, 3)}
+        try:
+            yield
+        except Exception as e:
+            with self.lock:
+                self.stages[name].update(state='failed', error=str(e))
+                self.error = f"{name}: {e}"
+            raise
+        seconds = time.perf_counter() - started
+        with self.lock:
+            self.stages[name].update(state='done', seconds=round(seconds, 3))
+        logger.info(f"Startup stage {name} done in {seconds:.2f} s")
+
+    def skip(self, name):
+        with self.lock:
+            self.stages[name] = {'state': 'skipped'}
+
+    def mark_ready(self):
+        self.ready_after = round(time.time() - self.created, 3)
+        self.ready_event.set()
+        logger.info(f"Service ready {self.ready_after:.2f} s after start")
+
+    def wait(self, timeout=None):
+        return self.ready_event.wait(timeout)
+
+    def stats(self):
+        with self.lock:
+            if self.ready:
+                state = 'ready'
+            elif self.failed:
+                state = 'failed'
+            else:
+                state = 'loading'
+            return {
+                'state': state,
+                'ready': self.ready,
+                'uptime_s': round(time.time() - self.created, 3),
+                'ready_after_s': self.ready_after,
+                'error': self.error,
+                'stages': {name: dict(stage) for name, stage in self.stages.items()}
+            }
@@ -0,0 +1,97 @@
+# Recognition Cache
+# Two bounded LRU/TTL levels in front of the recognition pipeline:
+#   frame      keyed by a hash of the decoded pixels, skips detection, encoding and search
+#   embedding  keyed by the encoding quantized to a fixed step, skips the gallery search
+# Any gallery change clears both levels; results computed against an older gallery are dropped.
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class RecognitionCache:
+    LEVELS = ('frame', 'embedding')
+
+    def __init__(self, max_entries=1024, ttl=60.0, quantum=0.005):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.quantum = quantum
+        self.entries = {level: OrderedDict() for level in self.LEVELS}
+        self.hits = dict.fromkeys(self.LEVELS, 0)
+        self.misses = dict.fromkeys(self.LEVELS, 0)
+        self.invalidations = 0
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def frame_key(self, frame, scope=None):
+        """Hash of the pixels detection runs on (the reduced copy when there is one); None when disabled"""
+        if not self.enabled:
+            return None
+        pixels = np.ascontiguousarray(frame.array if frame.detection is None else frame.detection)
+        digest = hashlib.blake2b(pixels.data, digest_size=16)
+        digest.update(repr(pixels.shape).encode())
+        return digest.digest(), scope
+
+    def embedding_key(self, encoding, scope=None):
+        """Encodings within the same quantum on every dimension share a key; None when disabled"""
+        if not self.enabled:
+            return None
+        quantized = np.round(np.asarray(encoding, dtype=np.float32) / self.quantum).astype(np.int16)
+        return quantized.tobytes(), scope
+
+    def get(self, level, key):
+        """Cached value or None"""
+        if key is None:
+            return None
+        with self.lock:
+            entries = self.entries[level]
+            entry = entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del entries[key]
+                self.misses[level] += 1
+                return None
+            entries.move_to_end(key)
+            self.hits[level] += 1
+            return entry[0]
+
+    def put(self, level, key, value, generation):
+        """Store a value computed when the cache was at generation; stale values are ignored"""
+        if key is None:
+            return
+        with self.lock:
+            if generation != self.generation:
+                return
+            entries = self.entries[level]
+            entries[key] = (value, time.monotonic() + self.ttl)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def invalidate(self):
+        """Drop everything; call whenever the gallery changes"""
+        with self.lock:
+            self.generation += 1
+            self.invalidations += 1
+            for entries in self.entries.values():
+                entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'enabled': self.enabled,
+                'invalidations': self.invalidations,
+                **{
+                    level: {
+                        'entries': len(self.entries[level]),
+                        'hits': self.hits[level],
+                        'misses': self.misses[level]
+                    }
+                    for level in self.LEVELS
+                }
+            }
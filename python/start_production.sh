@@ -5,7 +5,7 @@ echo "Starting Face Recognition Service in Production Mode..."
 
 # Set environment variables
 export FLASK_ENV=production
-export FLASK_PORT=${FLASK_PORT:-5001}
+export FLASK_PORT=${FLASK_PORT:-5000}
 export FLASK_HOST=${FLASK_HOST:-127.0.0.1}
 
 # Activate virtual environment if it exists
@@ -17,13 +17,18 @@ fi
 # Create logs directory
 mkdir -p logs
 
-# Start the service with logging
+# Start the service under gunicorn; host, port and workers are read in gunicorn.conf.py
 echo "Starting service on ${FLASK_HOST}:${FLASK_PORT}..."
-python face_recognition_server.py >> logs/face_service.log 2>&1 &
+export FACE_PIDFILE=face_service.pid
+gunicorn -c gunicorn.conf.py face_recognition_server:app >> logs/face_service.log 2>&1 &
 
-# Store PID for later management
-echo $! > face_service.pid
+# The service binds at once and loads the models and gallery in the background; /ready turns 200 when done
+for i in $(seq 1 120); do
+    curl -sf "http://${FLASK_HOST}:${FLASK_PORT}/ready" > /dev/null && break
+    sleep 1
+done
 
 echo "Face Recognition Service started with PID: $(cat face_service.pid)"
 echo "Logs available at: logs/face_service.log"
+echo "To reload gracefully: kill -HUP \$(cat face_service.pid)"
 echo "To stop: kill \$(cat face_service.pid)"
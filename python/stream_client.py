@@ -0,0 +1,80 @@
+"""
+Face Recognition Stream Client
+Sends a webcam (or video file) to the service's per-kiosk stream endpoint, one JPEG per
+frame on a kept-alive connection, and prints each identification as it is reported.
+The service follows faces between frames, so a person is reported once per pass.
+
+Usage: python stream_client.py --kiosk gate-1 [--source 0 | --source video.mp4] [--location-id 3]
+"""
+import argparse
+import os
+import time
+
+import cv2
+import requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=os.environ.get('FACE_SERVICE_URL', 'http://localhost:5000'), help='Service base URL')
+    parser.add_argument('--kiosk', required=True, help='Kiosk id; one tracking session per kiosk')
+    parser.add_argument('--source', default='0', help='Camera index or video file')
+    parser.add_argument('--location-id', type=int, help='Project location searched first')
+    parser.add_argument('--fps', type=float, default=10, help='Frames sent per second')
+    parser.add_argument('--quality', type=int, default=80, help='JPEG quality')
+    parser.add_argument('--show', action='store_true', help='Show the frames with the tracked boxes')
+    args = parser.parse_args()
+
+    capture = cv2.VideoCapture(int(args.source) if args.source.isdigit() else args.source)
+    if not capture.isOpened():
+        parser.error(f"Cannot open {args.source}")
+
+    url = f"{args.url.rstrip('/')}/stream/{args.kiosk}"
+    params = {} if args.location_id is None else {'location_id': args.location_id}
+    session = requests.Session()
+    interval = 1 / args.fps if args.fps > 0 else 0
+    try:
+        while True:
+            started = time.monotonic()
+            ok, frame = capture.read()
+            if not ok:
+                break
+            _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, args.quality])
+            response = session.post(url, data=buffer.tobytes(), params=params,
+                                    headers={'Content-Type': 'image/jpeg'}, timeout=30)
+            if response.status_code == 503:
+                time.sleep(float(response.headers.get('Retry-After', 1)))
+                continue
+            result = response.json()
+            for event in result.get('events', []):
+                if event['event'] == 'identified':
+                    worker = event['worker']
+                    print(f"Identified {worker['worker_name']} (ID: {worker['worker_id']}) "
+                          f"{event['confidence'] * 100:.1f}% on track {event['track_id']}")
+                elif event['event'] == 'lost':
+                    print(f"Track {event['track_id']} left after {event['seconds']} s")
+
+            if args.show:
+                for track in result.get('tracks', []):
+                    box = track['box']
+                    label = track['worker']['worker_name'] if track['worker'] else 'unknown'
+                    cv2.rectangle(frame, (box['left'], box['top']), (box['right'], box['bottom']), (0, 255, 0), 2)
+                    cv2.putText(frame, label, (box['left'], box['top'] - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+                cv2.imshow('Face Stream', frame)
+                if cv2.waitKey(1) & 0xFF == 27:  # ESC
+                    break
+
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        summary = session.delete(url, timeout=10).json()
+        print(f"Session: {summary}")
+        session.close()
+        capture.release()
+        if args.show:
+            cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# Stream Tracker
+# Per-kiosk sessions for streaming recognition. Faces are followed between frames by box
+# overlap (IoU), so the encoder and gallery search only run for a new track or one whose
+# confidence has decayed, and each person is reported once per pass through the gate
+# instead of once per frame.
+import time
+import itertools
+import threading
+
+
+def box_iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    intersection = max(0, right - left) * max(0, bottom - top)
+    if intersection == 0:
+        return 0.0
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    return intersection / float(area_a + area_b - intersection)
+
+
+class Track:
+    """One face followed across frames"""
+
+    def __init__(self, track_id, box, now):
+        self.track_id = track_id
+        self.box = box
+        self.first_seen = now
+        self.last_seen = now
+        self.last_encoded = None
+        self.worker = None
+        self.confidence = 0.0
+        self.frames = 1
+        self.encodings = 0
+
+    def to_dict(self, confidence):
+        top, right, bottom, left = self.box
+        return {
+            'track_id': self.track_id,
+            'box': {'top': top, 'right': right, 'bottom': bottom, 'left': left},
+            'worker': self.worker,
+            'confidence': round(confidence, 4),
+            'frames': self.frames,
+            'encodings': self.encodings
+        }
+
+
+class StreamSession:
+    def __init__(self, kiosk_id, location_id=None, min_interval=0.1, iou_threshold=0.3, track_ttl=1.0,
+                 half_life=2.0, threshold=0.6, retry_interval=0.3, repeat_after=30.0):
+        """
+        min_interval: frames arriving sooner after the last processed one are skipped
+        iou_threshold: box overlap needed to continue a track
+        track_ttl: seconds a track survives without being seen (the person left the gate)
+        half_life: seconds for a track's match confidence to decay by half; it is re-encoded
+                   once the decayed confidence falls under threshold
+        retry_interval: least time between encodings of one track, so an unknown face is not
+                        encoded on every frame
+        repeat_after: seconds before the same worker is reported again at this kiosk
+        """
+        self.kiosk_id = kiosk_id
+        self.location_id = location_id
+        self.min_interval = min_interval
+        self.iou_threshold = iou_threshold
+        self.track_ttl = track_ttl
+        self.half_life = half_life
+        self.threshold = threshold
+        self.retry_interval = retry_interval
+        self.repeat_after = repeat_after
+        self.tracks = []
+        self.track_ids = itertools.count(1)
+        self.last_reported = {}  # Worker id -> time it was last reported
+        self.last_processed = None
+        self.last_active = time.monotonic()
+        self.lock = threading.Lock()
+        self.stats = {'frames': 0, 'processed': 0, 'skipped': 0, 'encoded': 0, 'identified': 0}
+
+    def should_process(self, now):
+        """Frame skipping: at most one processed frame per min_interval"""
+        self.last_active = now
+        self.stats['frames'] += 1
+        if self.last_processed is not None and now - self.last_processed < self.min_interval:
+            self.stats['skipped'] += 1
+            return False
+        self.last_processed = now
+        self.stats['processed'] += 1
+        return True
+
+    def confidence_of(self, track, now):
+        """Match confidence decayed by the time since the track was last encoded"""
+        if track.last_encoded is None:
+            return 0.0
+        return track.confidence * 0.5 ** ((now - track.last_encoded) / self.half_life)
+
+    def update(self, boxes, now):
+        """
+        Associate detected boxes with tracks (greedy, highest IoU first), start tracks for the
+        rest and end tracks unseen for track_ttl. Returns the 'lost' events
+        """
+        pairs = sorted(
+            ((box_iou(track.box, box), t, b) for t, track in enumerate(self.tracks) for b, box in enumerate(boxes)),
+            reverse=True
+        )
+        matched_tracks, matched_boxes = set(), set()
+        for iou, t, b in pairs:
+            if iou < self.iou_threshold:
+                break
+            if t in matched_tracks or b in matched_boxes:
+                continue
+            matched_tracks.add(t)
+            matched_boxes.add(b)
+            track = self.tracks[t]
+            track.box = tuple(boxes[b])
+            track.last_seen = now
+            track.frames += 1
+
+        for b, box in enumerate(boxes):
+            if b not in matched_boxes:
+                self.tracks.append(Track(next(self.track_ids), tuple(box), now))
+
+        events = []
+        for track in self.tracks:
+            if now - track.last_seen > self.track_ttl:
+                events.append({'event': 'lost', 'track_id': track.track_id, 'worker': track.worker,
+                               'seconds': round(track.last_seen - track.first_seen, 2)})
+        self.tracks = [track for track in self.tracks if now - track.last_seen <= self.track_ttl]
+        return events
+
+    def needs_encoding(self, now):
+        """Tracks seen in this frame whose identity is unknown or has decayed"""
+        return [
+            track for track in self.tracks
+            if track.last_seen == now
+            and (track.last_encoded is None or now - track.last_encoded >= self.retry_interval)
+            and self.confidence_of(track, now) < self.threshold
+        ]
+
+    def record_match(self, track, worker, confidence, now):
+        """
+        Store a fresh match for a track; returns an 'identified' event the first time a worker
+        is matched at this kiosk within repeat_after, else None
+        """
+        track.last_encoded = now
+        track.encodings += 1
+        self.stats['encoded'] += 1
+        if worker is None:
+            # No match: keep any earlier identity, but at the new (low) confidence
+            track.confidence = confidence if track.worker is None else min(track.confidence, confidence)
+            return None
+
+        track.confidence = confidence
+        if track.worker is not None and track.worker['worker_id'] == worker['worker_id']:
+            track.worker = worker
+            return None
+        track.worker = worker
+        worker_id = worker['worker_id']
+        last = self.last_reported.get(worker_id)
+        self.last_reported[worker_id] = now
+        if last is not None and now - last < self.repeat_after:
+            return None
+        self.stats['identified'] += 1
+        return {'event': 'identified', 'track_id': track.track_id, 'worker': worker, 'confidence': round(confidence, 4)}
+
+    def snapshot(self, now):
+        return [track.to_dict(self.confidence_of(track, now)) for track in self.tracks]
+
+    def summary(self):
+        return {
+            'kiosk_id': self.kiosk_id,
+            'location_id': self.location_id,
+            'tracks': len(self.tracks),
+            **self.stats
+        }
+
+
+class StreamSessions:
+    """Sessions by kiosk id; sessions idle for longer than ttl are dropped"""
+
+    def __init__(self, ttl=300.0, **session_options):
+        self.ttl = ttl
+        self.session_options = session_options
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, kiosk_id, location_id=None):
+        now = time.monotonic()
+        with self.lock:
+            for stale in [key for key, session in self.sessions.items() if now - session.last_active > self.ttl]:
+                del self.sessions[stale]
+            session = self.sessions.get(kiosk_id)
+            if session is None:
+                session = self.sessions[kiosk_id] = StreamSession(kiosk_id, location_id, **self.session_options)
+            elif location_id is not None:
+                session.location_id = location_id
+            return session
+
+    def close(self, kiosk_id):
+        with self.lock:
+            return self.sessions.pop(kiosk_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {'sessions': len(self.sessions)}
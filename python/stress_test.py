@@ -0,0 +1,200 @@
+"""
+Face Recognition Service Stress Test
+Hammers /register, /delete_worker and /recognize at the same time against a running
+service and checks that the gallery stays consistent while it changes underneath readers:
+
+- every photo in --images is one synthetic worker (id --id-base + index, name "Stress <id>")
+- writer threads own disjoint sets of those workers and alternately register and delete them,
+  so each worker's final state is known
+- reader threads recognize random photos; a match must be the photo's own worker with its
+  own name (or no match while it is deleted), never another stress worker
+- at the end /list_registered must hold exactly the stress workers the writers left registered
+
+Every stress worker is deleted afterwards. Exits with status 1 if any check failed.
+
+Usage: python stress_test.py --images ../backend/face_images --writers 4 --readers 16 --duration 60
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+import requests
+
+from load_test import summarize
+
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png')
+
+
+class Recorder:
+    """Latency/status samples per endpoint and the consistency violations seen"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.violations = []
+
+    def sample(self, endpoint, elapsed, status):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((elapsed, status))
+
+    def violation(self, message):
+        with self.lock:
+            self.violations.append(message)
+
+
+def post_image(session, url, image, params, recorder, endpoint):
+    """POST a raw image body; returns the JSON response or None"""
+    content_type = 'image/png' if image['path'].lower().endswith('.png') else 'image/jpeg'
+    started = time.perf_counter()
+    try:
+        response = session.post(url, data=image['data'], params=params,
+                                headers={'Content-Type': content_type}, timeout=60)
+        status = response.status_code
+    except requests.RequestException:
+        response, status = None, 'error'
+    recorder.sample(endpoint, time.perf_counter() - started, status)
+    if status != 200:
+        if status not in (503, 'error'):
+            recorder.violation(f"{endpoint} returned {status}")
+        return None
+    return response.json()
+
+
+def writer_loop(base_url, images, owned, registered, deadline, recorder):
+    """Alternately register and delete the workers this thread owns"""
+    session = requests.Session()
+    while time.monotonic() < deadline:
+        index = random.choice(owned)
+        worker_id = images[index]['worker_id']
+        if registered[worker_id]:
+            started = time.perf_counter()
+            try:
+                response = session.post(f"{base_url}/delete_worker", json={'worker_id': worker_id}, timeout=60)
+                status = response.status_code
+            except requests.RequestException:
+                response, status = None, 'error'
+            recorder.sample('delete_worker', time.perf_counter() - started, status)
+            if status == 200 and response.json().get('success'):
+                registered[worker_id] = False
+            elif status == 200:
+                recorder.violation(f"delete of registered worker {worker_id} failed: {response.json().get('message')}")
+        else:
+            result = post_image(
+                session, f"{base_url}/register", images[index],
+                {'worker_id': worker_id, 'worker_name': f"Stress {worker_id}"},
+                recorder, 'register'
+            )
+            if result is not None and result.get('success'):
+                registered[worker_id] = True
+    session.close()
+
+
+def reader_loop(base_url, images, id_range, deadline, recorder):
+    """Recognize random photos and check every match against the photo's own worker"""
+    session = requests.Session()
+    while time.monotonic() < deadline:
+        image = random.choice(images)
+        result = post_image(session, f"{base_url}/recognize", image, {}, recorder, 'recognize')
+        if not result or not result.get('success'):
+            continue
+        worker = result.get('worker') or {}
+        worker_id = worker.get('worker_id')
+        if worker_id not in id_range:
+            continue
+        if worker_id != image['worker_id']:
+            recorder.violation(f"{os.path.basename(image['path'])} matched worker {worker_id}, expected {image['worker_id']}")
+        elif worker.get('worker_name') != f"Stress {worker_id}":
+            recorder.violation(f"worker {worker_id} returned with name {worker.get('worker_name')!r}")
+    session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:5000', help='Service base URL')
+    parser.add_argument('--images', required=True, help='Folder of single-face photos, one person each')
+    parser.add_argument('--limit', type=int, default=0, help='Use at most this many photos (0 = all)')
+    parser.add_argument('--id-base', type=int, default=900000, help='First synthetic worker id')
+    parser.add_argument('--writers', type=int, default=4, help='Threads registering and deleting')
+    parser.add_argument('--readers', type=int, default=16, help='Threads recognizing')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    base_url = args.url.rstrip('/')
+    paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(args.images, pattern)))
+    if args.limit:
+        paths = paths[:args.limit]
+    if len(paths) < args.writers:
+        parser.error(f"Need at least {args.writers} photos in {args.images}")
+    images = []
+    for index, path in enumerate(paths):
+        with open(path, 'rb') as f:
+            images.append({'path': path, 'data': f.read(), 'worker_id': args.id_base + index})
+    id_range = range(args.id_base, args.id_base + len(images))
+    registered = {image['worker_id']: False for image in images}
+
+    recorder = Recorder()
+    deadline = time.monotonic() + args.duration
+    threads = [
+        threading.Thread(target=writer_loop, args=(
+            base_url, images, list(range(w, len(images), args.writers)), registered, deadline, recorder
+        ))
+        for w in range(args.writers)
+    ] + [
+        threading.Thread(target=reader_loop, args=(base_url, images, id_range, deadline, recorder))
+        for _ in range(args.readers)
+    ]
+    print(f"Stressing {base_url} with {args.writers} writer(s) and {args.readers} reader(s) "
+          f"over {len(images)} synthetic worker(s) for {args.duration:g}s...")
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    # The writers finished, so the service must now hold exactly what they left registered
+    listed = requests.get(f"{base_url}/list_registered", timeout=60).json()
+    present = {worker['worker_id'] for worker in listed.get('workers', []) if worker['worker_id'] in id_range}
+    expected = {worker_id for worker_id, is_registered in registered.items() if is_registered}
+    if present != expected:
+        recorder.violation(
+            f"list_registered mismatch: {len(present - expected)} unexpected, {len(expected - present)} missing"
+        )
+
+    for worker_id in sorted(present | expected):
+        requests.post(f"{base_url}/delete_worker", json={'worker_id': worker_id}, timeout=60)
+
+    report = {
+        'url': base_url,
+        'workers': len(images),
+        'writers': args.writers,
+        'readers': args.readers,
+        'endpoints': {endpoint: summarize(samples, wall) for endpoint, samples in recorder.samples.items()},
+        'violations': recorder.violations,
+    }
+    for endpoint, row in report['endpoints'].items():
+        print(
+            f"{endpoint:<14} {row['requests_per_second']:7.1f} req/s  p50 {row['p50_ms']:7.1f} ms  "
+            f"p99 {row['p99_ms']:7.1f} ms  statuses {row['statuses']}"
+        )
+    print(f"{len(recorder.violations)} consistency violation(s)")
+    for message in recorder.violations[:20]:
+        print(f"  {message}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    sys.exit(1 if recorder.violations else 0)
+
+
+if __name__ == "__main__":
+    main()